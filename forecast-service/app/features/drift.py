@@ -0,0 +1,225 @@
+"""
+Sketches de drift à mémoire bornée sur les features servies en production
+"""
+import json
+import queue
+import random
+import threading
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+# Nombre de bins des histogrammes numériques (bornes = quantiles de l'entraînement)
+DEFAULT_BINS = 20
+# Catégories suivies par colonne (les plus fréquentes à l'entraînement), le reste va dans OTHER
+MAX_CATEGORIES = 1000
+OTHER_CATEGORY = "__other__"
+# Colonnes catégorielles suivies par défaut
+CATEGORICAL_COLS = ['country', 'channel', 'product_id']
+# Seuil PSI usuel au-delà duquel une distribution a significativement bougé
+PSI_ALERT_THRESHOLD = 0.2
+
+def population_stability_index(reference: np.ndarray, current: np.ndarray, eps: float = 1e-4) -> float:
+    """PSI entre deux histogrammes de mêmes bins"""
+    ref = reference / max(reference.sum(), 1)
+    cur = current / max(current.sum(), 1)
+    ref = np.maximum(ref, eps)
+    cur = np.maximum(cur, eps)
+    return float(np.sum((cur - ref) * np.log(cur / ref)))
+
+class DriftMonitor:
+    """
+    Histogrammes à bornes fixes (numériques) et compteurs bornés (catégories).
+
+    La référence est construite à l'entraînement puis sauvegardée en JSON ; en
+    production, un monitor vide avec les mêmes bornes est mis à jour à chaque batch
+    (searchsorted + bincount, sans boucle par ligne) et comparé à la référence.
+    """
+
+    def __init__(self, numeric: Dict[str, Dict], categorical: Dict[str, Dict]):
+        self.numeric = numeric
+        self.categorical = categorical
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_reference(
+        cls,
+        df_features: pd.DataFrame,
+        feature_cols: List[str],
+        categorical_cols: List[str] = CATEGORICAL_COLS,
+        n_bins: int = DEFAULT_BINS
+    ) -> "DriftMonitor":
+        """Construire la référence à partir des features d'entraînement"""
+        numeric = {}
+        for col in feature_cols:
+            values = df_features[col].to_numpy(dtype=np.float64, na_value=0)
+            edges = np.unique(np.quantile(values, np.linspace(0, 1, n_bins + 1)[1:-1]))
+            numeric[col] = {'edges': edges, 'counts': np.zeros(len(edges) + 1, dtype=np.int64)}
+
+        categorical = {}
+        for col in categorical_cols:
+            if col in df_features.columns:
+                top = df_features[col].astype(str).value_counts().index[:MAX_CATEGORIES].tolist()
+                categorical[col] = {
+                    'categories': top + [OTHER_CATEGORY],
+                    'counts': np.zeros(len(top) + 1, dtype=np.int64)
+                }
+
+        monitor = cls(numeric, categorical)
+        monitor.update(df_features)
+        return monitor
+
+    def empty_copy(self) -> "DriftMonitor":
+        """Monitor vide avec les mêmes bornes et catégories (pour la production)"""
+        return DriftMonitor(
+            {col: {'edges': s['edges'], 'counts': np.zeros_like(s['counts'])} for col, s in self.numeric.items()},
+            {col: {'categories': s['categories'], 'counts': np.zeros_like(s['counts'])}
+             for col, s in self.categorical.items()}
+        )
+
+    def update(self, df_features: pd.DataFrame):
+        """Ajouter un batch de features au sketch"""
+        numeric_counts = {}
+        for col, sketch in self.numeric.items():
+            if col in df_features.columns:
+                values = df_features[col].to_numpy(dtype=np.float64, na_value=0)
+                bins = np.searchsorted(sketch['edges'], values, side='right')
+                numeric_counts[col] = np.bincount(bins, minlength=len(sketch['counts']))
+
+        categorical_counts = {}
+        for col, sketch in self.categorical.items():
+            if col in df_features.columns:
+                codes = pd.Categorical(df_features[col].astype(str), categories=sketch['categories'][:-1]).codes
+                codes = np.where(codes < 0, len(sketch['categories']) - 1, codes)
+                categorical_counts[col] = np.bincount(codes, minlength=len(sketch['counts']))
+
+        with self._lock:
+            self.rows += len(df_features)
+            for col, counts in numeric_counts.items():
+                self.numeric[col]['counts'] += counts
+            for col, counts in categorical_counts.items():
+                self.categorical[col]['counts'] += counts
+
+    def drift_scores(self, reference: "DriftMonitor") -> Dict:
+        """PSI par feature entre ce monitor et la référence"""
+        with self._lock:
+            scores = {
+                col: population_stability_index(reference.numeric[col]['counts'], sketch['counts'])
+                for col, sketch in self.numeric.items()
+                if col in reference.numeric and sketch['counts'].sum() > 0
+            }
+            scores.update({
+                col: population_stability_index(reference.categorical[col]['counts'], sketch['counts'])
+                for col, sketch in self.categorical.items()
+                if col in reference.categorical and sketch['counts'].sum() > 0
+            })
+            rows = self.rows
+
+        scores = dict(sorted(scores.items(), key=lambda item: item[1], reverse=True))
+        return {
+            'rows': rows,
+            'psi': scores,
+            'drifted_features': [col for col, score in scores.items() if score > PSI_ALERT_THRESHOLD],
+            'alert_threshold': PSI_ALERT_THRESHOLD,
+        }
+
+    def to_json(self) -> str:
+        with self._lock:
+            return json.dumps({
+                'rows': self.rows,
+                'numeric': {col: {'edges': s['edges'].tolist(), 'counts': s['counts'].tolist()}
+                            for col, s in self.numeric.items()},
+                'categorical': {col: {'categories': s['categories'], 'counts': s['counts'].tolist()}
+                                for col, s in self.categorical.items()},
+            })
+
+    @classmethod
+    def from_json(cls, payload: str) -> "DriftMonitor":
+        data = json.loads(payload)
+        monitor = cls(
+            {col: {'edges': np.array(s['edges'], dtype=np.float64), 'counts': np.array(s['counts'], dtype=np.int64)}
+             for col, s in data['numeric'].items()},
+            {col: {'categories': s['categories'], 'counts': np.array(s['counts'], dtype=np.int64)}
+             for col, s in data['categorical'].items()}
+        )
+        monitor.rows = data['rows']
+        return monitor
+
+class DriftSampler:
+    """
+    Alimentation du drift hors du chemin de la requête, sur un échantillon borné.
+
+    Une requête sur `sample_rate` est retenue, avec au plus `max_ids` produits tirés au
+    hasard ; un worker unique calcule les features (update_fn) et met à jour le monitor.
+    La file est bornée : si le worker est en retard, les requêtes sont abandonnées (et comptées).
+    """
+
+    def __init__(
+        self,
+        update_fn: Callable[..., None],
+        sample_rate: float = 0.1,
+        max_ids: int = 100,
+        max_queue: int = 32
+    ):
+        self.update_fn = update_fn
+        self.sample_rate = sample_rate
+        self.max_ids = max_ids
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.sampled = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._worker_loop, name="drift-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        if self._thread is None:
+            return
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def submit(self, product_ids: List[str], *args):
+        """Planifier la mise à jour du drift pour une requête (non bloquant, échantillonné)"""
+        if not product_ids or random.random() >= self.sample_rate:
+            return
+        if len(product_ids) > self.max_ids:
+            product_ids = random.sample(product_ids, self.max_ids)
+        try:
+            self._queue.put_nowait((product_ids, args))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'sample_rate': self.sample_rate,
+                'max_ids': self.max_ids,
+                'sampled_requests': self.sampled,
+                'dropped_requests': self.dropped,
+                'failed_requests': self.failed,
+            }
+
+    def _worker_loop(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+            product_ids, args = task
+            try:
+                self.update_fn(product_ids, *args)
+                with self._lock:
+                    self.sampled += 1
+            except Exception as e:
+                print(f"⚠️  Erreur mise à jour du drift: {e}")
+                with self._lock:
+                    self.failed += 1
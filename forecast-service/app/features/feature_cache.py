@@ -0,0 +1,112 @@
+"""
+Cache des matrices de features, adressé par le contenu des données d'entrée
+"""
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from features.feature_engineering import FEATURE_ENGINE_VERSION
+
+FEATURE_CACHE_DIR = os.getenv("FEATURE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "luxury-feature-cache"))
+# Colonnes d'identification conservées à côté de la matrice (clés de série, date)
+KEY_COLS = ['date', 'product_id', 'country', 'channel', 'collection']
+
+class CachedFeatures:
+    """Matrice float32 + labels (memory-mapped), colonnes et clés de lignes"""
+
+    def __init__(self, X: np.ndarray, y: np.ndarray, feature_cols: List[str], keys: pd.DataFrame, target: str):
+        self.X = X
+        self.y = y
+        self.feature_cols = feature_cols
+        self.keys = keys
+        self.target = target
+
+    def to_frame(self) -> pd.DataFrame:
+        """DataFrame features + clés + cible, pour le code qui travaille en pandas"""
+        frame = pd.DataFrame(self.X, columns=self.feature_cols)
+        for col in self.keys.columns:
+            frame[col] = self.keys[col].to_numpy()
+        frame[self.target] = self.y
+        return frame
+
+class FeatureMatrixCache:
+    """
+    Cache disque des features d'entraînement.
+
+    La clé est un hash des données brutes (valeurs, colonnes, types), de la cible
+    et de FEATURE_ENGINE_VERSION : toute modification des données ou du feature
+    engineering (avec bump de version) produit une nouvelle entrée. Les matrices
+    sont stockées en .npy et relues en memory-map.
+    """
+
+    def __init__(self, cache_dir: str = FEATURE_CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+
+    def key(self, df: pd.DataFrame, target: str = 'quantity') -> str:
+        digest = hashlib.sha256()
+        digest.update(FEATURE_ENGINE_VERSION.encode())
+        digest.update(target.encode())
+        digest.update(json.dumps(KEY_COLS).encode())
+        digest.update(json.dumps([[col, str(dtype)] for col, dtype in df.dtypes.items()]).encode())
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+        return digest.hexdigest()
+
+    def load(self, key: str, target: str = 'quantity') -> Optional[CachedFeatures]:
+        """Entrée du cache en memory-map (None si absente)"""
+        entry = self.cache_dir / key
+        if not (entry / "meta.json").exists():
+            return None
+        meta = json.loads((entry / "meta.json").read_text())
+        return CachedFeatures(
+            X=np.load(entry / "X.npy", mmap_mode='r'),
+            y=np.load(entry / "y.npy", mmap_mode='r'),
+            feature_cols=meta['feature_cols'],
+            keys=pd.read_parquet(entry / "keys.parquet"),
+            target=target
+        )
+
+    def store(self, key: str, X: np.ndarray, y: np.ndarray, feature_cols: List[str], keys: pd.DataFrame):
+        """Écriture atomique d'une entrée (répertoire temporaire puis renommage)"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_dir = Path(tempfile.mkdtemp(prefix=f".{key}-", dir=self.cache_dir))
+        np.save(tmp_dir / "X.npy", np.ascontiguousarray(X, dtype=np.float32))
+        np.save(tmp_dir / "y.npy", np.asarray(y, dtype=np.float32))
+        keys.to_parquet(tmp_dir / "keys.parquet", index=False)
+        (tmp_dir / "meta.json").write_text(json.dumps({
+            'feature_cols': feature_cols,
+            'feature_engine_version': FEATURE_ENGINE_VERSION,
+            'rows': int(len(X)),
+        }))
+        try:
+            os.rename(tmp_dir, self.cache_dir / key)
+        except OSError:
+            # Entrée écrite entre-temps par un autre process : identique par construction
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def get_or_build(self, df: pd.DataFrame, feature_engine, target: str = 'quantity') -> CachedFeatures:
+        """Features depuis le cache, ou calculées avec create_features puis mises en cache"""
+        key = self.key(df, target)
+        cached = self.load(key, target)
+        if cached is not None:
+            print(f"⚡ Features depuis le cache ({key[:12]})")
+            return cached
+
+        df_features = feature_engine.create_features(df)
+        feature_cols = [col for col in feature_engine.get_feature_columns(df_features) if col != target]
+        keys = df_features[[col for col in KEY_COLS if col in df_features.columns]].reset_index(drop=True)
+        self.store(
+            key,
+            feature_engine.to_matrix(df_features, feature_cols),
+            df_features[target].to_numpy(dtype=np.float32),
+            feature_cols,
+            keys
+        )
+        print(f"💾 Features mises en cache ({key[:12]})")
+        return self.load(key, target)
@@ -1,6 +1,28 @@
 import pandas as pd
 import numpy as np
 from sklearn.preprocessing import LabelEncoder, StandardScaler
+from datetime import timedelta
+from typing import List, Optional
+
+# Version du feature engineering : à incrémenter à chaque changement de create_features
+# (invalide les matrices mises en cache par FeatureMatrixCache)
+FEATURE_ENGINE_VERSION = "1"
+
+# Colonnes jamais utilisées comme features
+EXCLUDE_COLS = ['date', 'product_id', 'quantity', 'product_name', 'forecast_week']
+
+# Lags et fenêtres glissantes des ventes (en semaines)
+LAG_WEEKS = [1, 2, 4, 8, 12]
+ROLLING_WINDOWS = [4, 12]
+# Moyenne glissante utilisée quand aucun historique n'est disponible
+DEFAULT_ROLLING_SALES = 10
+
+# Features dérivées de la seule date (recalculées pour la semaine cible des modèles directs)
+CALENDAR_FEATURES = ['month', 'quarter', 'is_peak_season', 'weeks_to_fashion_week']
+
+# Gammes de prix
+PRICE_TIER_BINS = [0, 2000, 5000, 10000, np.inf]
+PRICE_TIER_LABELS = ['Entry', 'Core', 'Premium', 'Exceptional']
 
 class LuxuryForecastFeatureEngine:
     def __init__(self):
@@ -26,10 +48,9 @@ class LuxuryForecastFeatureEngine:
             df['date'] = pd.Timestamp.now()
         
         # Features temporelles
-        df['month'] = df['date'].dt.month
-        df['quarter'] = df['date'].dt.quarter
-        df['is_peak_season'] = df['month'].isin([11, 12, 1, 2]).astype(int)  # Fêtes + Fashion Weeks
-        df['weeks_to_fashion_week'] = self._calculate_fashion_week_distance(df['date'])
+        calendar = self.calendar_features(df['date'])
+        for col in CALENDAR_FEATURES:
+            df[col] = calendar[col].to_numpy()
         
         # Features produit
         if 'product_id' in df.columns:
@@ -50,28 +71,26 @@ class LuxuryForecastFeatureEngine:
             df['price'] = 5000  # Prix par défaut
         df['price_tier'] = pd.cut(
             df['price'], 
-            bins=[0, 2000, 5000, 10000, np.inf], 
-            labels=['Entry', 'Core', 'Premium', 'Exceptional']
+            bins=PRICE_TIER_BINS, 
+            labels=PRICE_TIER_LABELS
         )
         
         # Lag features (nécessite des données historiques)
         if 'quantity' in df.columns and 'product_id' in df.columns:
-            for lag in [1, 2, 4, 8, 12]:
+            for lag in LAG_WEEKS:
                 df[f'sales_lag_{lag}w'] = df.groupby('product_id')['quantity'].shift(lag).fillna(0)
             
             # Rolling statistics
-            df['sales_rolling_4w'] = df.groupby('product_id')['quantity'].transform(
-                lambda x: x.rolling(window=4, min_periods=1).mean()
-            )
-            df['sales_rolling_12w'] = df.groupby('product_id')['quantity'].transform(
-                lambda x: x.rolling(window=12, min_periods=1).mean()
-            )
+            for window in ROLLING_WINDOWS:
+                df[f'sales_rolling_{window}w'] = df.groupby('product_id')['quantity'].transform(
+                    lambda x: x.rolling(window=window, min_periods=1).mean()
+                )
         else:
             # Valeurs par défaut pour les prédictions futures
-            for lag in [1, 2, 4, 8, 12]:
+            for lag in LAG_WEEKS:
                 df[f'sales_lag_{lag}w'] = 0
-            df['sales_rolling_4w'] = 10
-            df['sales_rolling_12w'] = 10
+            for window in ROLLING_WINDOWS:
+                df[f'sales_rolling_{window}w'] = DEFAULT_ROLLING_SALES
         
         # Features canal
         if 'channel' in df.columns:
@@ -95,6 +114,29 @@ class LuxuryForecastFeatureEngine:
         
         return df
     
+    def get_feature_columns(self, df_features: pd.DataFrame) -> List[str]:
+        """Colonnes numériques utilisables par le modèle"""
+        return [col for col in df_features.columns
+                if col not in EXCLUDE_COLS and not col.startswith('Unnamed')
+                and pd.api.types.is_numeric_dtype(df_features[col])]
+    
+    def to_matrix(self, df_features: pd.DataFrame, feature_cols: Optional[List[str]] = None) -> np.ndarray:
+        """Matrice float32 alignée sur les colonnes demandées (manquantes = 0)"""
+        if feature_cols is None:
+            feature_cols = self.get_feature_columns(df_features)
+        X = df_features.reindex(columns=feature_cols, fill_value=0)
+        return X.to_numpy(dtype=np.float32, na_value=0)
+    
+    def calendar_features(self, dates) -> pd.DataFrame:
+        """Features calendaires (CALENDAR_FEATURES), calculées une fois par date distincte"""
+        dates = pd.to_datetime(pd.Series(dates)).reset_index(drop=True)
+        unique_dates = pd.Series(dates.unique())
+        frame = pd.DataFrame({'month': unique_dates.dt.month, 'quarter': unique_dates.dt.quarter})
+        frame['is_peak_season'] = frame['month'].isin([11, 12, 1, 2]).astype(int)  # Fêtes + Fashion Weeks
+        frame['weeks_to_fashion_week'] = self._calculate_fashion_week_distance(unique_dates)
+        idx = pd.Index(unique_dates).get_indexer(dates)
+        return frame.iloc[idx].reset_index(drop=True)
+    
     def _calculate_fashion_week_distance(self, dates):
         """Distance à la prochaine Fashion Week (Paris, Milan, NYC)"""
         if isinstance(dates, pd.Series):
@@ -115,3 +157,29 @@ class LuxuryForecastFeatureEngine:
             min_distances.append(min(distances) if distances else 365)
         
         return min_distances if len(min_distances) > 1 else min_distances[0]
+
+def prepare_future_dataframe(
+    product_ids: List[str],
+    start_date: str,
+    horizon: int,
+    channel: str = "All",
+    countries: List[str] = ["All"]
+) -> pd.DataFrame:
+    """Préparation du DataFrame pour les prédictions futures"""
+    start = pd.to_datetime(start_date)
+    
+    data = []
+    for week in range(horizon):
+        forecast_date = start + timedelta(weeks=week)
+        for product_id in product_ids:
+            data.append({
+                'date': forecast_date,
+                'product_id': product_id,
+                'forecast_week': week,
+                'channel': channel,
+                'country': countries[0] if countries else "FR",
+                'month': forecast_date.month,
+                'quarter': (forecast_date.month - 1) // 3 + 1
+            })
+    
+    return pd.DataFrame(data)
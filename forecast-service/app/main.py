@@ -1,32 +1,92 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List
+from fastapi import FastAPI, HTTPException, Request, Depends, Header, BackgroundTasks
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, ValidationError
+from typing import List, Dict, Optional
 from contextlib import asynccontextmanager
 import pandas as pd
-from datetime import datetime, timedelta
+import numpy as np
+import tempfile
+from datetime import datetime
 import mlflow
 import mlflow.xgboost
 from mlflow.tracking import MlflowClient
 import os
 
 from models.xgboost_predictor import LuxuryDemandPredictor
-from features.feature_engineering import LuxuryForecastFeatureEngine
+from features.feature_engineering import LuxuryForecastFeatureEngine, prepare_future_dataframe
+from features.drift import DriftSampler
+from utils.model_registry import (
+    download_horizon_models, load_predictor, download_drift_reference, download_segment_models,
+    attach_segment_router
+)
+from models.inventory_optimizer import InventoryOptimizer
+from models.explanations import MAX_TOP_K, ExplanationCache
+from utils.shadow import ShadowScorer
+from utils.warmup import Warmup, parse_warmup_sizes
+from utils.forecast_table import FORECAST_TABLE_DIR, ForecastTableStore, table_keys
+from utils.forecast_jobs import ForecastJobManager, JobQueueFullError
+from utils.validators import (
+    validate_product_ids, validate_job_product_ids, validate_date, validate_horizon, validate_production_params,
+    validate_scenarios
+)
+from utils.wire_format import (
+    ARROW_STREAM_MEDIA_TYPE, accepts_arrow, is_arrow, forecast_request_from_arrow, predictions_to_arrow
+)
 
 # Configuration MLflow
 MLFLOW_TRACKING_URI = os.getenv("MLFLOW_TRACKING_URI", "http://localhost:5000")
 MODEL_NAME = os.getenv("MODEL_NAME", "luxury_demand_forecast")
 MODEL_STAGE = os.getenv("MODEL_STAGE", "Production")
+# Stage du challenger scoré en shadow (vide = désactivé), ex: "Staging"
+CHALLENGER_STAGE = os.getenv("CHALLENGER_STAGE", "")
+SHADOW_MAX_QUEUE = int(os.getenv("SHADOW_MAX_QUEUE", "32"))
+# Modèles par segment : répertoire local (sinon artifacts de la run) et mémoire max du LRU
+SEGMENT_MODELS_DIR = os.getenv("SEGMENT_MODELS_DIR", "")
+SEGMENT_CACHE_MB = int(os.getenv("SEGMENT_CACHE_MB", "512"))
+
+# Explications TreeSHAP mises en cache par (ligne, version du modèle)
+EXPLANATION_CACHE_SIZE = int(os.getenv("EXPLANATION_CACHE_SIZE", "100000"))
+
+# Warm-up au démarrage : tailles 'produitsxsemaines' des requêtes synthétiques
+WARMUP_SIZES = parse_warmup_sizes(os.getenv("WARMUP_SIZES", "1x13,20x13,100x52"))
+WARMUP_ROUNDS = int(os.getenv("WARMUP_ROUNDS", "2"))
+
+# Table de prévisions précalculée (scripts/build_forecast_table.py), relue à chaud
+FORECAST_TABLE_ENABLED = os.getenv("FORECAST_TABLE_ENABLED", "true").lower() == "true"
+FORECAST_TABLE_POLL_SECONDS = float(os.getenv("FORECAST_TABLE_POLL_SECONDS", "30"))
+# Drift des réponses lues dans la table : part des requêtes échantillonnées (0 = désactivé),
+# produits max par requête, file bornée du worker
+DRIFT_TABLE_SAMPLE = float(os.getenv("DRIFT_TABLE_SAMPLE", "0.1"))
+DRIFT_TABLE_MAX_IDS = int(os.getenv("DRIFT_TABLE_MAX_IDS", "100"))
+DRIFT_TABLE_MAX_QUEUE = int(os.getenv("DRIFT_TABLE_MAX_QUEUE", "32"))
+
+# Configuration des jobs asynchrones
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_CHUNK_SIZE = int(os.getenv("JOB_CHUNK_SIZE", "100"))
+JOB_MAX_PENDING_CHUNKS = int(os.getenv("JOB_MAX_PENDING_CHUNKS", "200"))
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+JOB_SPOOL_DIR = os.getenv("JOB_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "forecast-jobs"))
 
 # Variables globales pour le modèle
 loaded_model = None
 model_version = None
 predictor = None
+job_manager = None
+challenger_version = None
+shadow_scorer = None
+drift_reference = None
+warmup = None
+forecast_tables = None
+drift_sampler = None
+explanation_cache = ExplanationCache(EXPLANATION_CACHE_SIZE)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Gestion du cycle de vie de l'application"""
     # Startup
-    global loaded_model, model_version, predictor
+    global loaded_model, model_version, predictor, job_manager, challenger_version, shadow_scorer, drift_reference
+    global warmup, forecast_tables, drift_sampler
     
     try:
         # Tentative de chargement depuis MLflow
@@ -43,7 +103,25 @@ async def lifespan(app: FastAPI):
         
         if model_version_info:
             model_version = model_version_info[0].version
+            predictor = LuxuryDemandPredictor()
+            predictor.model = loaded_model
             print(f"✅ Modèle v{model_version} chargé avec succès depuis MLflow")
+            
+            # Modèles directs multi-horizon enregistrés avec la run (optionnels)
+            horizon_dir = download_horizon_models(model_version_info[0].run_id)
+            if horizon_dir:
+                n_buckets = predictor.load_horizon_models(horizon_dir)
+                print(f"   + {n_buckets} modèles par tranche d'horizon")
+            
+            # Boosters par segment, chargés à la demande
+            segment_dir = SEGMENT_MODELS_DIR or download_segment_models(model_version_info[0].run_id)
+            if segment_dir and attach_segment_router(predictor, segment_dir, SEGMENT_CACHE_MB * 1024 * 1024):
+                print(f"   + {len(predictor.segment_router.registry.segments)} modèles par segment "
+                      f"({predictor.segment_router.segment_by}, chargement à la demande)")
+            
+            # Référence de drift : les features servies sont comparées à l'entraînement
+            # (monitor attaché après le warm-up, pour ne compter que le trafic réel)
+            drift_reference = download_drift_reference(model_version_info[0].run_id)
         else:
             print(f"⚠️  Aucun modèle en {MODEL_STAGE}, utilisation d'un modèle par défaut")
             predictor = LuxuryDemandPredictor()
@@ -54,10 +132,59 @@ async def lifespan(app: FastAPI):
         predictor = LuxuryDemandPredictor()
         loaded_model = None
     
+    # Challenger optionnel, scoré en arrière-plan sur chaque batch /forecast
+    if CHALLENGER_STAGE:
+        try:
+            client = MlflowClient(tracking_uri=MLFLOW_TRACKING_URI)
+            challenger_info = client.get_latest_versions(MODEL_NAME, stages=[CHALLENGER_STAGE])
+            if challenger_info:
+                challenger_version = challenger_info[0].version
+                challenger = load_predictor(MODEL_NAME, challenger_version, challenger_info[0].run_id)
+                shadow_scorer = ShadowScorer(
+                    score_fn=lambda request: run_prediction(request, challenger),
+                    max_queue=SHADOW_MAX_QUEUE
+                )
+                shadow_scorer.start()
+                print(f"🕶️  Challenger v{challenger_version} ({CHALLENGER_STAGE}) scoré en shadow")
+            else:
+                print(f"⚠️  Aucun modèle en {CHALLENGER_STAGE}, scoring shadow désactivé")
+        except Exception as e:
+            print(f"⚠️  Erreur chargement du challenger: {str(e)}")
+    
+    job_manager = ForecastJobManager(
+        score_chunk=score_job_chunk,
+        spool_dir=JOB_SPOOL_DIR,
+        workers=JOB_WORKERS,
+        chunk_size=JOB_CHUNK_SIZE,
+        max_pending_chunks=JOB_MAX_PENDING_CHUNKS,
+        job_ttl_seconds=JOB_TTL_SECONDS
+    )
+    job_manager.start()
+    
+    if FORECAST_TABLE_ENABLED:
+        forecast_tables = ForecastTableStore(FORECAST_TABLE_DIR, poll_seconds=FORECAST_TABLE_POLL_SECONDS)
+        forecast_tables.start()
+        if DRIFT_TABLE_SAMPLE > 0:
+            drift_sampler = DriftSampler(
+                update_table_drift, sample_rate=DRIFT_TABLE_SAMPLE,
+                max_ids=DRIFT_TABLE_MAX_IDS, max_queue=DRIFT_TABLE_MAX_QUEUE
+            )
+            drift_sampler.start()
+    
+    # Warm-up en arrière-plan : /ready reste à 503 tant qu'il n'est pas terminé
+    warmup = Warmup(warmup_request, WARMUP_SIZES, rounds=WARMUP_ROUNDS, on_done=attach_drift_monitor)
+    warmup.start()
+    
     yield
     
-    # Shutdown (cleanup si nécessaire)
-    pass
+    # Shutdown
+    job_manager.stop()
+    if forecast_tables is not None:
+        forecast_tables.stop()
+    if drift_sampler is not None:
+        drift_sampler.stop()
+    if shadow_scorer is not None:
+        shadow_scorer.stop()
 
 app = FastAPI(title="Luxury Demand Forecast API", version="1.0.0", lifespan=lifespan)
 
@@ -67,6 +194,13 @@ class ForecastRequest(BaseModel):
     forecast_horizon_weeks: int = 13
     channel: str = "All"
     countries: List[str] = ["All"]
+    recursive: bool = False  # Réinjecter les prévisions dans les lags semaine après semaine
+    # Paramètres de production (voir models/inventory_optimizer.py)
+    production_policy: str = "newsvendor"  # "newsvendor" ou "coverage"
+    service_level: float = 0.95
+    lead_time_weeks: int = 2
+    moq: int = 0
+    lot_size: int = 1
 
 class ForecastResponse(BaseModel):
     product_id: str
@@ -76,57 +210,213 @@ class ForecastResponse(BaseModel):
     confidence_upper: float
     recommended_production: int
 
-def prepare_future_dataframe(
-    product_ids: List[str],
-    start_date: str,
-    horizon: int,
-    channel: str = "All",
+class ExplainRequest(BaseModel):
+    product_ids: List[str]
+    start_date: str
+    forecast_horizon_weeks: int = 13
+    channel: str = "All"
     countries: List[str] = ["All"]
-) -> pd.DataFrame:
-    """Préparation du DataFrame pour les prédictions futures"""
-    start = pd.to_datetime(start_date)
-    
-    data = []
-    for week in range(horizon):
-        forecast_date = start + timedelta(weeks=week)
-        for product_id in product_ids:
-            data.append({
-                'date': forecast_date,
-                'product_id': product_id,
-                'forecast_week': week,
-                'channel': channel,
-                'country': countries[0] if countries else "FR",
-                'month': forecast_date.month,
-                'quarter': (forecast_date.month - 1) // 3 + 1
-            })
-    
-    return pd.DataFrame(data)
-
-def calculate_production_quantity(predicted_quantity: float, safety_stock_weeks: int = 2) -> int:
-    """Calcul de la quantité de production recommandée"""
-    return int(predicted_quantity + (predicted_quantity * 0.2))  # 20% de stock sécurité
-
-@app.post("/forecast", response_model=List[ForecastResponse])
-async def generate_forecast(request: ForecastRequest):
-    """Endpoint principal de prédiction"""
-    try:
-        # Préparation des données futures
-        future_df = prepare_future_dataframe(
-            product_ids=request.product_ids,
-            start_date=request.start_date,
-            horizon=request.forecast_horizon_weeks,
-            channel=request.channel,
-            countries=request.countries
+    top_k: int = 5
+
+class FeatureContribution(BaseModel):
+    feature: str
+    contribution: float
+
+class ExplanationResponse(BaseModel):
+    product_id: str
+    country: str
+    channel: str
+    week_offset: int
+    predicted_quantity: float
+    base_value: float
+    contributions: List[FeatureContribution]
+
+class Scenario(BaseModel):
+    name: str
+    price: Optional[float] = None  # Prix simulé (sinon prix de la requête de base)
+    channel_mix: Optional[Dict[str, float]] = None  # Poids par canal, ex: {"Online": 0.3, "Boutique": 0.7}
+    start_shift_weeks: int = 0  # Décalage du lancement (semaines, négatif = avancé)
+
+class ScenarioRequest(BaseModel):
+    product_ids: List[str]
+    start_date: str
+    forecast_horizon_weeks: int = 13
+    channel: str = "All"
+    countries: List[str] = ["All"]
+    price: Optional[float] = None  # Prix de base (défaut du feature engineering si absent)
+    scenarios: List[Scenario]
+
+class ScenarioResponse(BaseModel):
+    name: str
+    start_date: str
+    product_id: List[str]
+    week_offset: List[int]
+    predicted_quantity: List[float]
+    confidence_lower: List[float]
+    confidence_upper: List[float]
+
+def calculate_production_quantities(request: ForecastRequest, predictions: List[Dict]) -> np.ndarray:
+    """Production recommandée pour toutes les lignes de la prévision, en une passe"""
+    optimizer = InventoryOptimizer(
+        service_level=request.service_level,
+        lead_time_weeks=request.lead_time_weeks,
+        moq=request.moq,
+        lot_size=request.lot_size,
+        policy=request.production_policy
+    )
+    return optimizer.recommend(predictions)
+
+def run_prediction(request: ForecastRequest, model_predictor: LuxuryDemandPredictor = None) -> List[Dict]:
+    """Prédictions groupées par semaine pour une requête (champion par défaut)"""
+    model_predictor = model_predictor or predictor
+    
+    # Champion en direct : réponse depuis la table précalculée de la version servie
+    if model_predictor is predictor and predictor is not None and not request.recursive:
+        table = forecast_tables.current(model_version) if forecast_tables is not None else None
+        if table is not None and request.forecast_horizon_weeks <= table.horizon:
+            return predict_from_table(request, table)
+    
+    # Préparation des données futures
+    future_df = prepare_future_dataframe(
+        product_ids=request.product_ids,
+        start_date=request.start_date,
+        horizon=request.forecast_horizon_weeks,
+        channel=request.channel,
+        countries=request.countries
+    )
+    
+    # Prédiction
+    if model_predictor is None:
+        raise HTTPException(status_code=500, detail="Model not loaded")
+    
+    if request.recursive:
+        return model_predictor.predict_recursive(future_df, request.forecast_horizon_weeks)
+    return model_predictor.predict(future_df, request.forecast_horizon_weeks)
+
+def predict_from_table(request: ForecastRequest, table) -> List[Dict]:
+    """Prévisions lues dans la table ; seules les clés absentes passent par le modèle"""
+    horizon = request.forecast_horizon_weeks
+    country = request.countries[0] if request.countries else "FR"
+    keys = table_keys(request.product_ids, country, request.channel, request.start_date)
+    found, values = table.lookup(keys)
+    
+    matrix = np.empty((len(keys), horizon), dtype=np.float32)
+    matrix[found] = values[:, :horizon]
+    if drift_sampler is not None and predictor.drift_monitor is not None and found.any():
+        # Drift des lignes lues dans la table : échantillon calculé hors requête
+        # (les clés absentes sont comptées par predictor.predict)
+        drift_sampler.submit(
+            [pid for pid, hit in zip(request.product_ids, found) if hit],
+            request.start_date, horizon, request.channel, request.countries
+        )
+    if not found.all():
+        missing_ids = [pid for pid, hit in zip(request.product_ids, found) if not hit]
+        live = predictor.predict(
+            prepare_future_dataframe(missing_ids, request.start_date, horizon, request.channel, request.countries),
+            horizon
         )
+        matrix[~found] = np.column_stack([pred['predicted_quantity'] for pred in live])
+    forecast_tables.record(hits=int(found.sum()), misses=int((~found).sum()))
+    
+    # Intervalle recalculé sur la requête, comme en inférence directe
+    product_ids = np.asarray(request.product_ids)
+    return [{
+        'product_id': product_ids,
+        'week': week,
+        'predicted_quantity': matrix[:, week],
+        'confidence_interval': predictor._calculate_confidence_interval(matrix[:, week])
+    } for week in range(horizon)]
+
+def warmup_request(params: Dict):
+    """Requête synthétique sur le même chemin que /forecast (prédiction + production)"""
+    request = ForecastRequest(start_date=datetime.now().date().isoformat(), **params)
+    predictions = run_prediction(request)
+    predictions_to_frame(predictions, calculate_production_quantities(request, predictions))
+
+def update_table_drift(product_ids: List[str], start_date: str, horizon: int, channel: str, countries: List[str]):
+    """Features des lignes servies depuis la table, ajoutées au monitor de drift (worker DriftSampler)"""
+    monitor = predictor.drift_monitor if predictor is not None else None
+    if monitor is not None:
+        monitor.update(predictor.feature_engine.create_features(
+            prepare_future_dataframe(product_ids, start_date, horizon, channel, countries)
+        ))
+
+def attach_drift_monitor():
+    """Démarrer le suivi de drift sur le trafic réel"""
+    if drift_reference is not None and predictor is not None:
+        predictor.drift_monitor = drift_reference.empty_copy()
+
+def predictions_to_frame(predictions: List[Dict], recommended_production: np.ndarray) -> pd.DataFrame:
+    """Prédictions en colonnes, avec les mêmes champs que ForecastResponse"""
+    predicted = np.concatenate([pred['predicted_quantity'] for pred in predictions])
+    return pd.DataFrame({
+        'product_id': np.concatenate([pred['product_id'] for pred in predictions]),
+        'week_offset': np.concatenate([np.full(len(pred['predicted_quantity']), pred['week']) for pred in predictions]),
+        'predicted_quantity': predicted,
+        'confidence_lower': np.concatenate([pred['confidence_interval'][0] for pred in predictions]),
+        'confidence_upper': np.concatenate([pred['confidence_interval'][1] for pred in predictions]),
+        'recommended_production': recommended_production,
+    })
+
+def score_job_chunk(params: Dict, product_ids: List[str]) -> pd.DataFrame:
+    """Scoring d'un chunk de produits pour un job asynchrone"""
+    chunk_request = ForecastRequest(**{**params, 'product_ids': product_ids})
+    predictions = run_prediction(chunk_request)
+    return predictions_to_frame(predictions, calculate_production_quantities(chunk_request, predictions))
+
+async def parse_forecast_request(http_request: Request) -> ForecastRequest:
+    """Corps de /forecast en JSON (par défaut) ou en stream Arrow"""
+    body = await http_request.body()
+    try:
+        if is_arrow(http_request.headers.get("content-type")):
+            return ForecastRequest(**forecast_request_from_arrow(body))
+        return ForecastRequest.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid request body: {e}")
+
+@app.post(
+    "/forecast",
+    response_model=List[ForecastResponse],
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "application/json": {"schema": ForecastRequest.model_json_schema()},
+        ARROW_STREAM_MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}},
+    }}}
+)
+async def generate_forecast(
+    background_tasks: BackgroundTasks,
+    request: ForecastRequest = Depends(parse_forecast_request),
+    accept: Optional[str] = Header(None)
+):
+    """Endpoint principal de prédiction (JSON, ou Arrow IPC selon Content-Type / Accept)"""
+    if not validate_product_ids(request.product_ids):
+        raise HTTPException(status_code=400, detail="Invalid product_ids")
+    if not validate_date(request.start_date):
+        raise HTTPException(status_code=400, detail="Invalid start_date")
+    if not validate_horizon(request.forecast_horizon_weeks):
+        raise HTTPException(status_code=400, detail="Invalid forecast_horizon_weeks")
+    if not validate_production_params(request):
+        raise HTTPException(status_code=400, detail="Invalid production parameters")
+    
+    try:
+        predictions = run_prediction(request)
+        recommended = calculate_production_quantities(request, predictions)
         
-        # Prédiction
-        if predictor is None:
-            raise HTTPException(status_code=500, detail="Model not loaded")
+        # Mise en file du scoring challenger une fois la réponse envoyée
+        if shadow_scorer is not None:
+            background_tasks.add_task(shadow_scorer.submit, request, predictions)
         
-        predictions = predictor.predict(future_df, request.forecast_horizon_weeks)
+        # Réponse colonne sans objet Python par ligne
+        if accepts_arrow(accept):
+            return Response(
+                content=predictions_to_arrow(predictions, recommended),
+                media_type=ARROW_STREAM_MEDIA_TYPE
+            )
         
         # Formatage des résultats
         results = []
+        row = 0
         for pred in predictions:
             for i, prod_id in enumerate(pred['product_id']):
                 predicted_qty = float(pred['predicted_quantity'][i])
@@ -139,14 +429,186 @@ async def generate_forecast(request: ForecastRequest):
                     predicted_quantity=predicted_qty,
                     confidence_lower=conf_lower,
                     confidence_upper=conf_upper,
-                    recommended_production=calculate_production_quantity(predicted_qty)
+                    recommended_production=int(recommended[row])
                 ))
+                row += 1
         
         return results
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/forecast/explain", response_model=List[ExplanationResponse])
+async def explain_forecast(request: ExplainRequest):
+    """Top-k contributions par feature (TreeSHAP XGBoost) pour chaque ligne de la prévision"""
+    if not validate_product_ids(request.product_ids):
+        raise HTTPException(status_code=400, detail="Invalid product_ids")
+    if not validate_date(request.start_date):
+        raise HTTPException(status_code=400, detail="Invalid start_date")
+    if not validate_horizon(request.forecast_horizon_weeks):
+        raise HTTPException(status_code=400, detail="Invalid forecast_horizon_weeks")
+    if not 1 <= request.top_k <= MAX_TOP_K:
+        raise HTTPException(status_code=400, detail=f"top_k must be between 1 and {MAX_TOP_K}")
+    if predictor is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    
+    future_df = prepare_future_dataframe(
+        product_ids=request.product_ids,
+        start_date=request.start_date,
+        horizon=request.forecast_horizon_weeks,
+        channel=request.channel,
+        countries=request.countries
+    )
+    try:
+        explained = predictor.explain(future_df, request.top_k, cache=explanation_cache, model_version=model_version)
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    return [
+        ExplanationResponse(
+            product_id=explained['product_id'][i],
+            country=explained['country'][i],
+            channel=explained['channel'][i],
+            week_offset=int(explained['week'][i]),
+            predicted_quantity=entry['prediction'],
+            base_value=entry['base_value'],
+            contributions=[
+                FeatureContribution(feature=feature, contribution=value)
+                for feature, value in zip(entry['features'], entry['values'])
+            ]
+        )
+        for i, entry in enumerate(explained['explanations'])
+    ]
+
+@app.post("/forecast/scenarios", response_model=List[ScenarioResponse])
+async def forecast_scenarios(request: ScenarioRequest):
+    """Scénarios what-if sur une requête de base, scorés ensemble (un tableau par scénario)"""
+    if not validate_product_ids(request.product_ids):
+        raise HTTPException(status_code=400, detail="Invalid product_ids")
+    if not validate_date(request.start_date):
+        raise HTTPException(status_code=400, detail="Invalid start_date")
+    if not validate_horizon(request.forecast_horizon_weeks):
+        raise HTTPException(status_code=400, detail="Invalid forecast_horizon_weeks")
+    if not validate_scenarios(request.scenarios) or (request.price is not None and request.price <= 0):
+        raise HTTPException(status_code=400, detail="Invalid scenarios")
+    if predictor is None:
+        raise HTTPException(status_code=500, detail="Model not loaded")
+    
+    future_df = prepare_future_dataframe(
+        product_ids=request.product_ids,
+        start_date=request.start_date,
+        horizon=request.forecast_horizon_weeks,
+        channel=request.channel,
+        countries=request.countries
+    )
+    if request.price is not None:
+        future_df['price'] = request.price
+    
+    try:
+        results = predictor.predict_scenarios(
+            future_df, [scenario.model_dump() for scenario in request.scenarios]
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    start = pd.to_datetime(request.start_date)
+    return [
+        ScenarioResponse(
+            name=scenario.name,
+            start_date=(start + pd.Timedelta(weeks=scenario.start_shift_weeks)).date().isoformat(),
+            product_id=result['product_id'].tolist(),
+            week_offset=result['week'].tolist(),
+            predicted_quantity=result['predicted_quantity'].tolist(),
+            confidence_lower=result['confidence_interval'][0].tolist(),
+            confidence_upper=result['confidence_interval'][1].tolist()
+        )
+        for scenario, result in zip(request.scenarios, results)
+    ]
+
+@app.post("/forecast/jobs", status_code=202)
+async def submit_forecast_job(request: ForecastRequest):
+    """Soumettre une prévision volumineuse, exécutée en arrière-plan par chunks"""
+    if not validate_job_product_ids(request.product_ids):
+        raise HTTPException(status_code=400, detail="Invalid product_ids")
+    if not validate_date(request.start_date):
+        raise HTTPException(status_code=400, detail="Invalid start_date")
+    if not validate_horizon(request.forecast_horizon_weeks):
+        raise HTTPException(status_code=400, detail="Invalid forecast_horizon_weeks")
+    if not validate_production_params(request):
+        raise HTTPException(status_code=400, detail="Invalid production parameters")
+    
+    try:
+        params = request.model_dump(exclude={'product_ids'})
+        return job_manager.submit(params, request.product_ids)
+    except JobQueueFullError as e:
+        return JSONResponse(status_code=429, content={"detail": str(e)}, headers={"Retry-After": "30"})
+
+@app.get("/forecast/jobs/{job_id}")
+async def get_forecast_job(job_id: str):
+    """État d'avancement d'un job"""
+    try:
+        return job_manager.status(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+
+@app.get("/forecast/jobs/{job_id}/results")
+async def get_forecast_job_results(job_id: str, page: int = 1, page_size: int = 1000):
+    """Résultats paginés d'un job terminé"""
+    if page < 1 or not 1 <= page_size <= 10000:
+        raise HTTPException(status_code=400, detail="Invalid pagination")
+    try:
+        return job_manager.results(job_id, page, page_size)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/admin/shadow")
+async def get_shadow_stats():
+    """Comparaison cumulée champion vs challenger (scoring shadow)"""
+    if shadow_scorer is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "champion_version": model_version,
+        "challenger_version": challenger_version,
+        "challenger_stage": CHALLENGER_STAGE,
+        **shadow_scorer.stats.summary()
+    }
+
+@app.get("/admin/drift")
+async def get_drift_scores():
+    """Drift (PSI) des features servies depuis le démarrage vs l'entraînement"""
+    if drift_reference is None or predictor is None or predictor.drift_monitor is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "model_version": model_version,
+        **predictor.drift_monitor.drift_scores(drift_reference),
+        "table_sampling": drift_sampler.stats() if drift_sampler is not None else None,
+    }
+
+@app.get("/admin/explanations")
+async def get_explanation_cache_stats():
+    """État du cache des explications"""
+    return {"model_version": model_version, **explanation_cache.stats()}
+
+@app.get("/admin/forecast-table")
+async def get_forecast_table_stats():
+    """Table de prévisions chargée et taux de réponse depuis la table"""
+    if forecast_tables is None:
+        return {"enabled": False}
+    stats = forecast_tables.stats()
+    return {"enabled": True, "serving": stats['model_version'] == str(model_version), **stats}
+
+@app.get("/admin/segments")
+async def get_segment_stats():
+    """État du cache LRU des modèles par segment"""
+    if predictor is None or predictor.segment_router is None:
+        return {"enabled": False}
+    return {"enabled": True, "segment_by": predictor.segment_router.segment_by,
+            **predictor.segment_router.registry.stats()}
+
 @app.get("/model/metrics")
 async def get_model_metrics():
     """Retourne les métriques du modèle en production"""
@@ -168,9 +630,24 @@ async def get_model_metrics():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness : modèle chargé depuis MLflow et warm-up terminé (503 sinon)"""
+    warmup_status = warmup.status() if warmup is not None else {'done': False}
+    ready = loaded_model is not None and warmup_status['done']
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "ready": ready,
+            "model_loaded": loaded_model is not None,
+            "model_version": model_version,
+            "warmup": warmup_status
+        }
+    )
+
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (liveness)"""
     return {
         "status": "healthy",
         "model_loaded": predictor is not None,
@@ -0,0 +1,83 @@
+"""
+Explications des prévisions : contributions TreeSHAP natives d'XGBoost (pred_contribs)
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+# Nombre maximal de contributions conservées par ligne (top_k demandé <= cette borne)
+MAX_TOP_K = 20
+
+def as_booster(model) -> xgb.Booster:
+    """Booster natif d'un modèle XGBoost (Booster ou XGBRegressor)"""
+    if isinstance(model, xgb.Booster):
+        return model
+    if hasattr(model, 'get_booster'):
+        return model.get_booster()
+    raise ValueError("Explanations require an XGBoost model")
+
+def booster_contribs(model, X: np.ndarray) -> np.ndarray:
+    """Contributions par feature + biais en dernière colonne (n, n_features + 1)"""
+    booster = as_booster(model)
+    dmatrix = xgb.DMatrix(X, feature_names=booster.feature_names)
+    return booster.predict(dmatrix, pred_contribs=True)
+
+def top_contributions(contribs: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Index et valeurs des k plus fortes contributions (en valeur absolue) de chaque ligne"""
+    values = contribs[:, :-1]
+    k = min(k, values.shape[1])
+    top = np.argpartition(-np.abs(values), k - 1, axis=1)[:, :k]
+    top_values = np.take_along_axis(values, top, axis=1)
+    order = np.argsort(-np.abs(top_values), axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_values, order, axis=1)
+
+def row_keys(df_features: pd.DataFrame) -> np.ndarray:
+    """Clé stable d'une ligne de prévision (série, date, semaine d'horizon)"""
+    parts = [df_features[col].astype(str) for col in ['product_id', 'country', 'channel', 'date', 'forecast_week']
+             if col in df_features.columns]
+    return parts[0].str.cat(parts[1:], sep='|').to_numpy()
+
+class ExplanationCache:
+    """
+    Explications par (clé de ligne, version du modèle), dans un LRU borné en nombre d'entrées.
+
+    Chaque entrée garde les MAX_TOP_K premières contributions : tout top_k plus petit
+    est servi depuis le cache.
+    """
+
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: np.ndarray, model_version: str) -> List[Optional[Dict]]:
+        with self._lock:
+            found = []
+            for key in keys:
+                entry = self._entries.get((key, model_version))
+                if entry is not None:
+                    self._entries.move_to_end((key, model_version))
+                found.append(entry)
+            hits = sum(entry is not None for entry in found)
+            self.hits += hits
+            self.misses += len(found) - hits
+            return found
+
+    def put_many(self, keys: np.ndarray, model_version: str, entries: List[Dict]):
+        with self._lock:
+            for key, entry in zip(keys, entries):
+                self._entries[(key, model_version)] = entry
+                self._entries.move_to_end((key, model_version))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries,
+                    'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,251 @@
+"""
+Modèles directs multi-horizon : un booster XGBoost par tranche d'horizon
+"""
+import os
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from features.feature_engineering import CALENDAR_FEATURES
+from models.explanations import booster_contribs
+
+# Tranches d'horizon (semaines, bornes incluses) ; semaine 1 = forecast_week 0
+HORIZON_BUCKETS = [(1, 4), (5, 13), (14, 26), (27, 52)]
+# Sous-répertoire des artifacts MLflow contenant les boosters
+HORIZON_ARTIFACT_PATH = "horizon_models"
+# Feature ajoutée en dernière colonne des boosters directs : semaines entre l'origine et la cible
+HORIZON_FEATURE = "horizon"
+
+def bucket_name(bucket: Tuple[int, int]) -> str:
+    """Nom stable d'une tranche, ex: h05_13"""
+    return f"h{bucket[0]:02d}_{bucket[1]:02d}"
+
+def assign_buckets(horizons: np.ndarray, buckets: List[Tuple[int, int]]) -> np.ndarray:
+    """Index de tranche pour chaque horizon (-1 si hors de toutes les tranches)"""
+    lower = np.array([b[0] for b in buckets])
+    upper = np.array([b[1] for b in buckets])
+    idx = np.searchsorted(upper, horizons)
+    idx_clipped = np.minimum(idx, len(buckets) - 1)
+    inside = (idx < len(buckets)) & (horizons >= lower[idx_clipped])
+    return np.where(inside, idx_clipped, -1)
+
+def shifted_target(df: pd.DataFrame, target: str, horizon: int, series_keys: List[str]) -> np.ndarray:
+    """Cible décalée de `horizon` semaines dans le futur, par série (NaN en fin de série)"""
+    keys = [col for col in series_keys if col in df.columns]
+    return df.groupby(keys, sort=False)[target].shift(-horizon).to_numpy(dtype=np.float32)
+
+def predict_direct(booster: xgb.Booster, X: np.ndarray, horizons: np.ndarray, contribs: bool = False) -> np.ndarray:
+    """Predict d'un booster direct : horizon réel de chaque ligne en dernière colonne"""
+    if HORIZON_FEATURE not in (booster.feature_names or []):
+        return booster_contribs(booster, X) if contribs else booster.inplace_predict(X)
+    X_h = np.column_stack([X, horizons.astype(np.float32)])
+    if not contribs:
+        return booster.inplace_predict(X_h)
+    # Contribution de l'horizon rattachée au biais : mêmes colonnes que les autres boosters
+    contributions = booster_contribs(booster, X_h)
+    contributions[:, -1] += contributions[:, -2]
+    return np.delete(contributions, -2, axis=1)
+
+def horizon_design_matrix(
+    X: np.ndarray,
+    dates: np.ndarray,
+    horizons: np.ndarray,
+    feature_cols: List[str],
+    feature_engine
+) -> np.ndarray:
+    """
+    Lignes d'origine vues depuis leur semaine cible (date + h semaines).
+
+    Le calendrier (mois, saison, Fashion Week) est celui de la semaine cible, comme
+    dans les lignes servies (datées start + forecast_week) ; les autres features
+    restent celles de l'origine. La colonne HORIZON_FEATURE est ajoutée en dernier.
+    """
+    X_h = np.array(X, dtype=np.float32, copy=True)
+    target_dates = pd.to_datetime(dates) + pd.to_timedelta(np.asarray(horizons) * 7, unit='D')
+    calendar = feature_engine.calendar_features(target_dates)
+    for col in CALENDAR_FEATURES:
+        if col in feature_cols:
+            X_h[:, feature_cols.index(col)] = calendar[col].to_numpy()
+    return np.column_stack([X_h, np.asarray(horizons, dtype=np.float32)])
+
+class DirectDesign:
+    """
+    Lignes des modèles directs, construites horizon par horizon à la demande.
+
+    Une ligne par (origine, horizon h) : features de l'origine, calendrier de la semaine
+    cible, colonne HORIZON_FEATURE et cible décalée de h semaines par série. frame
+    (date, clés de série, cible) est aligné sur X ; les cibles décalées sont calculées
+    une fois par horizon.
+    """
+
+    def __init__(
+        self,
+        X: np.ndarray,
+        frame: pd.DataFrame,
+        target: str,
+        series_keys: List[str],
+        feature_cols: List[str],
+        feature_engine
+    ):
+        self.X = X
+        self.frame = frame
+        self.target = target
+        self.series_keys = series_keys
+        self.feature_cols = list(feature_cols)
+        self.feature_names = self.feature_cols + [HORIZON_FEATURE]
+        self.feature_engine = feature_engine
+        self.dates = pd.to_datetime(frame['date']).to_numpy()
+        self._targets: Dict[int, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def shifted(self, h: int) -> np.ndarray:
+        with self._lock:
+            if h not in self._targets:
+                self._targets[h] = shifted_target(self.frame, self.target, h, self.series_keys)
+            return self._targets[h]
+
+    def origins(self, h: int, rows: np.ndarray = None, target_start=None, target_end=None) -> np.ndarray:
+        """
+        Origines utilisables à l'horizon h : cible connue, semaine cible dans
+        [target_start, target_end[ (ex: target_end = début du test, contre les fuites).
+        """
+        mask = ~np.isnan(self.shifted(h))
+        if rows is not None:
+            restricted = np.zeros(len(mask), dtype=bool)
+            restricted[rows] = True
+            mask &= restricted
+        target_dates = self.dates + np.timedelta64(7 * h, 'D')
+        if target_start is not None:
+            mask &= target_dates >= np.datetime64(pd.Timestamp(target_start))
+        if target_end is not None:
+            mask &= target_dates < np.datetime64(pd.Timestamp(target_end))
+        return np.flatnonzero(mask)
+
+    def batch(self, h: int, origins: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Matrice (avec colonne horizon) et cible des origines données à l'horizon h"""
+        X_h = horizon_design_matrix(
+            self.X[origins], self.dates[origins], np.full(len(origins), h), self.feature_cols, self.feature_engine
+        )
+        return X_h, self.shifted(h)[origins]
+
+    def matrix(self, horizons, rows=None, target_start=None, target_end=None) -> Tuple[np.ndarray, np.ndarray]:
+        """Lignes empilées de plusieurs horizons (évaluation, mises à jour sur une petite fenêtre)"""
+        selected = [(h, self.origins(h, rows, target_start, target_end)) for h in horizons]
+        parts = [self.batch(h, origins) for h, origins in selected if len(origins)]
+        if not parts:
+            return np.empty((0, len(self.feature_names)), dtype=np.float32), np.empty(0, dtype=np.float32)
+        return np.vstack([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+    def evaluation_frame(self, horizons, rows=None, target_start=None, target_end=None) -> pd.DataFrame:
+        """
+        Lignes directes sous forme servie : features, forecast_week (h - 1), clés de l'origine,
+        date de la semaine cible et cible, pour rejouer le chemin de prédiction complet.
+        """
+        keys = [col for col in self.frame.columns if col not in self.feature_cols and col not in ('date', self.target)]
+        parts = []
+        for h in horizons:
+            origins = self.origins(h, rows, target_start, target_end)
+            if not len(origins):
+                continue
+            X_h, y_h = self.batch(h, origins)
+            part = pd.DataFrame(X_h[:, :-1], columns=self.feature_cols)
+            part['forecast_week'] = h - 1
+            for col in keys:
+                part[col] = self.frame[col].to_numpy()[origins]
+            part['date'] = self.dates[origins] + np.timedelta64(7 * h, 'D')
+            part[self.target] = y_h
+            parts.append(part)
+        if not parts:
+            return pd.DataFrame(columns=self.feature_cols + ['forecast_week'] + keys + ['date', self.target])
+        return pd.concat(parts, ignore_index=True)
+
+    def reference(self, rows: np.ndarray, horizons: List[int], max_bin: int, nthread: int) -> xgb.QuantileDMatrix:
+        """
+        Quantification commune à toutes les tranches : une seule copie des lignes,
+        horizons (et donc calendriers cibles) répartis sur toute la plage servie.
+        """
+        rows = np.arange(len(self.X)) if rows is None else np.asarray(rows)
+        spread = np.asarray(horizons)[np.arange(len(rows)) % len(horizons)]
+        X_ref = horizon_design_matrix(self.X[rows], self.dates[rows], spread, self.feature_cols, self.feature_engine)
+        return xgb.QuantileDMatrix(X_ref, max_bin=max_bin, feature_names=self.feature_names, nthread=nthread)
+
+class _HorizonBatches(xgb.DataIter):
+    """Un lot par horizon de la tranche : la matrice empilée de la tranche n'est jamais matérialisée"""
+
+    def __init__(self, design: DirectDesign, origins: Dict[int, np.ndarray]):
+        self.design = design
+        self.horizons = [h for h, rows in origins.items() if len(rows)]
+        self.origins = origins
+        self._it = 0
+        super().__init__()
+
+    def next(self, input_data) -> int:
+        if self._it == len(self.horizons):
+            return 0
+        h = self.horizons[self._it]
+        X_h, y_h = self.design.batch(h, self.origins[h])
+        input_data(data=X_h, label=y_h, feature_names=self.design.feature_names)
+        self._it += 1
+        return 1
+
+    def reset(self):
+        self._it = 0
+
+def train_horizon_models(
+    design: DirectDesign,
+    params: Dict,
+    num_boost_round: int,
+    buckets: List[Tuple[int, int]] = HORIZON_BUCKETS,
+    rows: np.ndarray = None,
+    target_end=None,
+    cpu_budget: int = None,
+    max_bin: int = 256
+) -> Dict[Tuple[int, int], xgb.Booster]:
+    """
+    Entraîner un booster par tranche, en parallèle, sur les origines `rows`.
+
+    Les bins viennent d'une seule QuantileDMatrix de référence partagée ; chaque tranche
+    est quantifiée lot par lot (un horizon à la fois). Seules les cibles antérieures à
+    target_end sont utilisées. Le budget CPU est réparti entre les entraînements concurrents.
+    """
+    cpu_budget = cpu_budget or os.cpu_count() or 1
+    n_concurrent = max(1, min(len(buckets), cpu_budget))
+    threads_per_model = max(1, cpu_budget // n_concurrent)
+
+    horizons = [h for bucket in buckets for h in range(bucket[0], bucket[1] + 1)]
+    reference = design.reference(rows, horizons, max_bin, cpu_budget)
+
+    def _train(bucket):
+        origins = {h: design.origins(h, rows, target_end=target_end) for h in range(bucket[0], bucket[1] + 1)}
+        if not any(len(o) for o in origins.values()):
+            return bucket, None
+        dtrain = xgb.QuantileDMatrix(
+            _HorizonBatches(design, origins), ref=reference, max_bin=max_bin, nthread=threads_per_model
+        )
+        bucket_params = {**params, 'tree_method': 'hist', 'max_bin': max_bin, 'nthread': threads_per_model}
+        return bucket, xgb.train(bucket_params, dtrain, num_boost_round=num_boost_round)
+
+    # xgb.train libère le GIL : des threads suffisent pour paralléliser
+    with ThreadPoolExecutor(max_workers=n_concurrent) as executor:
+        return {bucket: booster for bucket, booster in executor.map(_train, list(buckets)) if booster is not None}
+
+def save_horizon_models(models: Dict[Tuple[int, int], xgb.Booster], directory: str) -> None:
+    """Sauvegarder les boosters (un fichier UBJSON par tranche)"""
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    for bucket, booster in models.items():
+        booster.save_model(str(Path(directory) / f"{bucket_name(bucket)}.ubj"))
+
+def load_horizon_models(directory: str) -> Dict[Tuple[int, int], xgb.Booster]:
+    """Charger les boosters sauvegardés par save_horizon_models"""
+    models = {}
+    for path in sorted(Path(directory).glob("h*_*.ubj")):
+        lower, upper = path.stem[1:].split("_")
+        booster = xgb.Booster()
+        booster.load_model(str(path))
+        models[(int(lower), int(upper))] = booster
+    return models
@@ -0,0 +1,110 @@
+"""
+Optimisation de la production : stock de sécurité (newsvendor) et couverture multi-semaines
+"""
+from statistics import NormalDist
+from typing import Dict, List
+
+import numpy as np
+
+# Coefficient des intervalles de confiance du prédicteur (±1.96 σ)
+INTERVAL_Z = 1.96
+POLICIES = ['newsvendor', 'coverage']
+
+def demand_sigma(predicted: np.ndarray, lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+    """
+    Écart-type de la demande, déduit de l'intervalle de confiance.
+
+    Plancher poissonnien (√prévision) : un intervalle dégénéré (une seule série
+    dans le batch) ne doit pas supprimer le stock de sécurité.
+    """
+    sigma = (np.asarray(upper, dtype=np.float64) - lower) / (2 * INTERVAL_Z)
+    return np.maximum(sigma, np.sqrt(np.maximum(predicted, 0)))
+
+def safety_factor(service_level: float) -> float:
+    """Facteur z du niveau de service (fractile critique du newsvendor)"""
+    if not 0 < service_level < 1:
+        raise ValueError("service_level must be in (0, 1)")
+    return NormalDist().inv_cdf(service_level)
+
+def apply_order_constraints(quantities: np.ndarray, moq: int = 0, lot_size: int = 1) -> np.ndarray:
+    """Arrondi à l'unité supérieure, minimum de commande et multiples de lot (0 reste 0)"""
+    quantities = np.ceil(np.maximum(quantities, 0))
+    constrained = np.maximum(quantities, moq)
+    if lot_size > 1:
+        constrained = np.ceil(constrained / lot_size) * lot_size
+    return np.where(quantities > 0, constrained, 0).astype(np.int64)
+
+class InventoryOptimizer:
+    """
+    Quantités de production recommandées pour des grilles semaine × série, en une passe.
+
+    - newsvendor : chaque semaine est couverte indépendamment au quantile du niveau
+      de service (prévision + z·σ)
+    - coverage : politique order-up-to ; le stock cible couvre la demande cumulée
+      sur le délai de fabrication + 1 semaine (σ cumulés en quadrature), la production
+      de chaque semaine complète la position de stock projetée
+    """
+
+    def __init__(
+        self,
+        service_level: float = 0.95,
+        lead_time_weeks: int = 2,
+        moq: int = 0,
+        lot_size: int = 1,
+        policy: str = 'newsvendor'
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy '{policy}', expected one of {POLICIES}")
+        self.z = safety_factor(service_level)
+        self.lead_time_weeks = max(0, lead_time_weeks)
+        self.moq = max(0, moq)
+        self.lot_size = max(1, lot_size)
+        self.policy = policy
+
+    def newsvendor(self, mean: np.ndarray, sigma: np.ndarray) -> np.ndarray:
+        """Quantité par semaine au quantile du niveau de service"""
+        return apply_order_constraints(mean + self.z * sigma, self.moq, self.lot_size)
+
+    def coverage(self, mean: np.ndarray, sigma: np.ndarray, on_hand: np.ndarray = 0) -> np.ndarray:
+        """
+        Production par semaine (matrices semaines × séries) couvrant la demande cumulée.
+
+        Le stock cible de la semaine t couvre les semaines t..t+délai (fenêtre tronquée
+        en fin d'horizon) ; la production cumulée suit le maximum courant des besoins
+        cumulés, nette du stock initial.
+        """
+        n_weeks = mean.shape[0]
+        window = self.lead_time_weeks + 1
+        cum_mean = np.vstack([np.zeros((1, mean.shape[1])), np.cumsum(mean, axis=0)])
+        cum_var = np.vstack([np.zeros((1, mean.shape[1])), np.cumsum(np.square(sigma), axis=0)])
+        end = np.minimum(np.arange(n_weeks) + window, n_weeks)
+
+        target = (cum_mean[end] - cum_mean[:-1]) + self.z * np.sqrt(cum_var[end] - cum_var[:-1])
+        # Besoin cumulé = demande déjà consommée + stock cible, jamais décroissant
+        required = np.maximum.accumulate(cum_mean[:-1] + target, axis=0) - on_hand
+
+        # Boucle sur les semaines (≤ 52), vectorisée sur les séries : MOQ et lots génèrent
+        # un surplus reporté sur les semaines suivantes
+        orders = np.zeros(mean.shape, dtype=np.int64)
+        produced = np.zeros(mean.shape[1])
+        for week in range(n_weeks):
+            orders[week] = apply_order_constraints(required[week] - produced, self.moq, self.lot_size)
+            produced += orders[week]
+        return orders
+
+    def recommend(self, predictions: List[Dict], on_hand: np.ndarray = 0) -> np.ndarray:
+        """
+        Production recommandée pour la sortie de predict / predict_recursive,
+        à plat dans le même ordre (semaine par semaine).
+        """
+        mean = np.vstack([np.asarray(pred['predicted_quantity'], dtype=np.float64) for pred in predictions])
+        sigma = demand_sigma(
+            mean,
+            np.vstack([pred['confidence_interval'][0] for pred in predictions]),
+            np.vstack([pred['confidence_interval'][1] for pred in predictions])
+        )
+        mean = np.maximum(mean, 0)
+
+        if self.policy == 'coverage':
+            return self.coverage(mean, sigma, on_hand).ravel()
+        return self.newsvendor(mean, sigma).ravel()
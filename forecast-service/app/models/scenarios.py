@@ -0,0 +1,77 @@
+"""
+Scénarios what-if (prix, mix canal, décalage du lancement) sur une matrice de features partagée
+"""
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Nombre maximal de scénarios par requête (la matrice empilée grandit linéairement)
+MAX_SCENARIOS = 50
+# Colonnes nécessaires au routage (tranche d'horizon, segment) des lignes empilées
+ROUTING_COLS = ['product_id', 'forecast_week', 'price', 'collection', 'is_iconic_model']
+
+def feature_overrides(feature_engine, base_rows: pd.DataFrame, feature_cols: List[str], **overrides) -> Dict[int, np.ndarray]:
+    """
+    Colonnes de la matrice modifiées par un override, calculées sur quelques lignes sonde.
+
+    Les features sont recalculées sur base_rows seulement ; les colonnes qui changent
+    (ex: price -> price, price_tier_encoded) sont retournées avec leur valeur par ligne sonde.
+    """
+    reference = feature_engine.to_matrix(feature_engine.create_features(base_rows), feature_cols)
+    probe = feature_engine.to_matrix(feature_engine.create_features(base_rows.assign(**overrides)), feature_cols)
+    changed = np.flatnonzero((probe != reference).any(axis=0))
+    return {j: probe[:, j] for j in changed}
+
+def stack_scenarios(
+    feature_engine,
+    df_future: pd.DataFrame,
+    df_features: pd.DataFrame,
+    X: np.ndarray,
+    feature_cols: List[str],
+    scenarios: List[Dict]
+) -> Tuple[np.ndarray, pd.DataFrame, List[Tuple[int, float]]]:
+    """
+    Matrice empilée (un bloc par scénario et par canal du mix) dérivée de X par deltas en colonne.
+
+    Retourne la matrice, le frame de routage aligné et, pour chaque bloc, (index du scénario, poids).
+    """
+    weeks = df_features['forecast_week'].to_numpy()
+    # Une ligne par semaine d'horizon : sonde des features dépendant de la date
+    week_rows = df_future.loc[~df_features['forecast_week'].duplicated()].sort_values('forecast_week')
+    first_row = df_future.iloc[[0]]
+    routing_cols = [col for col in ROUTING_COLS if col in df_features.columns]
+    routing = df_features[routing_cols].reset_index(drop=True)
+    default_channel = df_future['channel'].iloc[0] if 'channel' in df_future.columns else 'All'
+
+    blocks, frames, weights = [], [], []
+    for i, scenario in enumerate(scenarios):
+        X_scenario = X.copy()
+        routing_scenario = routing
+
+        shift = scenario.get('start_shift_weeks') or 0
+        if shift:
+            shifted = feature_overrides(
+                feature_engine, week_rows, feature_cols,
+                date=pd.to_datetime(week_rows['date']) + pd.Timedelta(weeks=shift)
+            )
+            for j, values in shifted.items():
+                X_scenario[:, j] = values[weeks]
+
+        if scenario.get('price') is not None:
+            for j, values in feature_overrides(feature_engine, first_row, feature_cols, price=scenario['price']).items():
+                X_scenario[:, j] = values[0]
+            routing_scenario = routing_scenario.assign(price=scenario['price'])
+
+        # Mix normalisé : la prévision reste un volume total, réparti entre canaux
+        mix = scenario.get('channel_mix') or {default_channel: 1.0}
+        total = sum(mix.values())
+        for channel, weight in mix.items():
+            X_channel = X_scenario.copy()
+            for j, values in feature_overrides(feature_engine, first_row, feature_cols, channel=channel).items():
+                X_channel[:, j] = values[0]
+            blocks.append(X_channel)
+            frames.append(routing_scenario)
+            weights.append((i, float(weight) / total))
+
+    return np.vstack(blocks), pd.concat(frames, ignore_index=True), weights
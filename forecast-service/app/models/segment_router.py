@@ -0,0 +1,269 @@
+"""
+Routage par segment (famille, collection, gamme de prix) vers des boosters dédiés
+"""
+import os
+import re
+import json
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from features.feature_engineering import PRICE_TIER_BINS, PRICE_TIER_LABELS
+from models.explanations import booster_contribs
+from models.horizon_models import (
+    HORIZON_BUCKETS, DirectDesign, assign_buckets, bucket_name, predict_direct, train_horizon_models
+)
+
+# Sous-répertoire des artifacts MLflow / fichier manifeste des modèles par segment
+SEGMENT_ARTIFACT_PATH = "segment_models"
+SEGMENT_MANIFEST = "segments.json"
+SEGMENT_BY_OPTIONS = ['family', 'collection', 'price_tier', 'iconic']
+
+# Modèles d'un segment : un booster même semaine (anciens manifestes) ou un booster direct par tranche
+SegmentModels = Union[xgb.Booster, Dict[Tuple[int, int], xgb.Booster]]
+
+def segment_filename(segment: str, bucket: Tuple[int, int] = None) -> str:
+    """Nom de fichier sûr pour un segment (caractères filtrés + hash : pas de collision ni de chemin)"""
+    slug = re.sub(r'[^A-Za-z0-9_-]+', '_', str(segment)).strip('_')[:64] or 'segment'
+    suffix = f"-{bucket_name(bucket)}" if bucket is not None else ""
+    return f"{slug}-{hashlib.sha1(str(segment).encode()).hexdigest()[:8]}{suffix}.ubj"
+
+def segment_keys(df_features: pd.DataFrame, segment_by: str) -> np.ndarray:
+    """Segment de chaque ligne, calculé en colonne"""
+    if segment_by == 'family':
+        # BAG-001 -> BAG
+        return df_features['product_id'].astype(str).str.split('-', n=1).str[0].to_numpy()
+    if segment_by == 'collection':
+        if 'collection' not in df_features.columns:
+            return np.full(len(df_features), 'default', dtype=object)
+        return df_features['collection'].fillna('default').astype(str).to_numpy()
+    if segment_by == 'price_tier':
+        # Recalculé depuis le prix : disponible aussi dans les matrices mises en cache
+        tiers = pd.cut(df_features['price'], bins=PRICE_TIER_BINS, labels=PRICE_TIER_LABELS)
+        return tiers.astype(str).to_numpy()
+    if segment_by == 'iconic':
+        return np.where(df_features['is_iconic_model'].to_numpy() == 1, 'iconic', 'core').astype(object)
+    raise ValueError(f"Unknown segment_by '{segment_by}', expected one of {SEGMENT_BY_OPTIONS}")
+
+class SegmentModelRegistry:
+    """
+    Boosters par segment chargés à la demande, gardés dans un LRU borné en mémoire.
+
+    Un segment est un booster (manifestes antérieurs, modèle même semaine) ou un dict
+    {tranche: booster direct}. La taille est estimée par la taille sérialisée ; quand le total
+    dépasse max_bytes, les segments les moins récemment utilisés sont libérés
+    (ils seront rechargés au besoin).
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], Tuple[SegmentModels, int]],
+        segments: List[str],
+        max_bytes: int = 512 * 1024 * 1024
+    ):
+        self.loader = loader
+        self.segments = set(segments)
+        self.max_bytes = max_bytes
+        self._cache: "OrderedDict[str, Tuple[SegmentModels, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+        # Threads XGBoost des boosters chargés (None = défaut XGBoost)
+        self.nthread = None
+
+    def get(self, segment: str) -> Optional[SegmentModels]:
+        """Booster(s) du segment (None si le segment n'a pas de modèle dédié)"""
+        if segment not in self.segments:
+            return None
+        with self._lock:
+            if segment in self._cache:
+                self._cache.move_to_end(segment)
+                return self._cache[segment][0]
+
+        # Chargement hors verrou : un autre thread peut charger le même segment en parallèle
+        models, size = self.loader(segment)
+        if self.nthread is not None:
+            for booster in (models.values() if isinstance(models, dict) else [models]):
+                booster.set_param('nthread', self.nthread)
+
+        with self._lock:
+            if segment not in self._cache:
+                self._cache[segment] = (models, size)
+                self._bytes += size
+                self.loads += 1
+            self._cache.move_to_end(segment)
+            while self._bytes > self.max_bytes and len(self._cache) > 1:
+                _, (_, evicted_size) = self._cache.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+            return self._cache[segment][0]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'segments': len(self.segments),
+                'loaded': len(self._cache),
+                'loaded_bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'loads': self.loads,
+                'evictions': self.evictions,
+            }
+
+class SegmentRouter:
+    """
+    Partitionne un batch par segment, puis par tranche d'horizon : un predict vectorisé
+    par (segment, tranche) présent.
+
+    buckets=None : anciens boosters même semaine (un par segment, sans routage par horizon) ;
+    ils ne sont combinés qu'avec un modèle principal sans boosters directs (voir
+    model_registry.attach_segment_router).
+    """
+
+    def __init__(self, registry: SegmentModelRegistry, segment_by: str, buckets: List[Tuple[int, int]] = None):
+        self.registry = registry
+        self.segment_by = segment_by
+        self.buckets = buckets
+
+    def predict(
+        self,
+        X: np.ndarray,
+        df_features: pd.DataFrame,
+        fallback: Callable[[np.ndarray], np.ndarray],
+        contribs: bool = False
+    ) -> np.ndarray:
+        """
+        Prédictions par segment ; fallback(rows) pour les lignes sans modèle dédié
+        (segment non entraîné, tranche absente du segment ou horizon hors tranches).
+
+        Avec contribs=True, contributions par feature (n, n_features + 1) au lieu des prédictions.
+        """
+        codes, uniques = pd.factorize(segment_keys(df_features, self.segment_by))
+        order = np.argsort(codes, kind='stable')
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(uniques)))])
+        horizons = None
+        if self.buckets is not None and 'forecast_week' in df_features.columns:
+            horizons = df_features['forecast_week'].to_numpy() + 1
+
+        pred = np.empty((len(X), X.shape[1] + 1) if contribs else len(X), dtype=np.float32)
+        fallback_rows = []
+        for i, segment in enumerate(uniques):
+            rows = order[bounds[i]:bounds[i + 1]]
+            models = self.registry.get(segment)
+            if models is None or (self.buckets is not None and horizons is None):
+                fallback_rows.append(rows)
+            elif self.buckets is None:
+                pred[rows] = booster_contribs(models, X[rows]) if contribs else models.inplace_predict(X[rows])
+            else:
+                bucket_idx = assign_buckets(horizons[rows], self.buckets)
+                for j, bucket in enumerate(self.buckets):
+                    bucket_rows = rows[bucket_idx == j]
+                    if not len(bucket_rows):
+                        continue
+                    if bucket in models:
+                        pred[bucket_rows] = predict_direct(models[bucket], X[bucket_rows], horizons[bucket_rows], contribs)
+                    else:
+                        fallback_rows.append(bucket_rows)
+                fallback_rows.append(rows[bucket_idx < 0])
+
+        if fallback_rows:
+            rows = np.sort(np.concatenate(fallback_rows))
+            if len(rows):
+                pred[rows] = fallback(rows)
+        return pred
+
+def directory_loader(directory: str, files: Dict) -> Callable[[str], Tuple[SegmentModels, int]]:
+    """
+    Loader de boosters sauvegardés sous directory, fichiers donnés par le manifeste :
+    {segment: fichier} (même semaine) ou {segment: {tranche: fichier}} (directs).
+    """
+    root = Path(directory).resolve()
+    def _read(name: str) -> Tuple[xgb.Booster, int]:
+        path = (root / name).resolve()
+        if path.parent != root:
+            raise ValueError(f"Segment model path outside {root}: {name}")
+        booster = xgb.Booster()
+        booster.load_model(str(path))
+        return booster, os.path.getsize(path)
+    def _load(segment: str) -> Tuple[SegmentModels, int]:
+        if isinstance(files[segment], str):
+            return _read(files[segment])
+        models, total = {}, 0
+        for name, filename in files[segment].items():
+            lower, upper = name[1:].split("_")
+            models[(int(lower), int(upper))], size = _read(filename)
+            total += size
+        return models, total
+    return _load
+
+def load_segment_router(directory: str, max_bytes: int) -> SegmentRouter:
+    """Routeur à partir d'un répertoire de modèles par segment (manifeste + fichiers .ubj)"""
+    manifest = json.loads((Path(directory) / SEGMENT_MANIFEST).read_text())
+    # Manifestes antérieurs sans 'files' : fichiers nommés <segment>.ubj
+    files = manifest.get('files') or {segment: f"{segment}.ubj" for segment in manifest['segments']}
+    # Sans 'buckets' : un booster même semaine par segment
+    buckets = [tuple(bucket) for bucket in manifest['buckets']] if 'buckets' in manifest else None
+    registry = SegmentModelRegistry(directory_loader(directory, files), manifest['segments'], max_bytes)
+    return SegmentRouter(registry, manifest['segment_by'], buckets)
+
+def train_segment_models(
+    design: DirectDesign,
+    segments: np.ndarray,
+    params: Dict,
+    num_boost_round: int,
+    directory: str,
+    segment_by: str,
+    rows: np.ndarray = None,
+    target_end=None,
+    buckets: List[Tuple[int, int]] = HORIZON_BUCKETS,
+    min_rows: int = 200,
+    cpu_budget: int = None
+) -> List[str]:
+    """
+    Entraîner, pour chaque segment ayant assez d'historique, un booster direct par
+    tranche d'horizon (comme le modèle global) et les écrire sur disque.
+
+    segments est aligné sur les lignes de design ; seules les origines `rows` et les
+    cibles antérieures à target_end sont utilisées. Les segments trop petits ne sont
+    pas entraînés : ils restent servis par les boosters globaux.
+    """
+    cpu_budget = cpu_budget or os.cpu_count() or 1
+    rows = np.arange(len(segments)) if rows is None else np.asarray(rows)
+    codes, uniques = pd.factorize(segments[rows])
+    counts = np.bincount(codes, minlength=len(uniques))
+    eligible = [i for i in range(len(uniques)) if counts[i] >= min_rows]
+    Path(directory).mkdir(parents=True, exist_ok=True)
+
+    def _train(i):
+        segment = str(uniques[i])
+        models = train_horizon_models(
+            design, params, num_boost_round, buckets=buckets,
+            rows=rows[codes == i], target_end=target_end, cpu_budget=1
+        )
+        files = {}
+        for bucket, booster in models.items():
+            files[bucket_name(bucket)] = segment_filename(segment, bucket)
+            booster.save_model(str(Path(directory) / files[bucket_name(bucket)]))
+        return segment, files
+
+    with ThreadPoolExecutor(max_workers=cpu_budget) as executor:
+        trained = dict(executor.map(_train, eligible))
+
+    write_segment_manifest(directory, segment_by, buckets, trained)
+    return list(trained)
+
+def write_segment_manifest(directory: str, segment_by: str, buckets: List[Tuple[int, int]], files: Dict) -> None:
+    """Manifeste des boosters directs par segment : {segment: {tranche: fichier}}"""
+    (Path(directory) / SEGMENT_MANIFEST).write_text(json.dumps({
+        'segment_by': segment_by,
+        'segments': list(files),
+        'buckets': [list(bucket) for bucket in buckets],
+        'files': files,
+    }))
@@ -5,25 +5,45 @@ from sklearn.model_selection import TimeSeriesSplit
 import mlflow
 from typing import List, Dict
 
-from features.feature_engineering import LuxuryForecastFeatureEngine
+from models.horizon_models import assign_buckets, load_horizon_models, predict_direct
+from models.explanations import MAX_TOP_K, booster_contribs, top_contributions, row_keys
+from models.scenarios import stack_scenarios
+from features.feature_engineering import (
+    LuxuryForecastFeatureEngine, LAG_WEEKS, ROLLING_WINDOWS, DEFAULT_ROLLING_SALES
+)
+
+# Clés identifiant une série temporelle
+SERIES_KEYS = ['product_id', 'country', 'channel']
 
 class LuxuryDemandPredictor:
     def __init__(self):
         self.model = None
         self.feature_engine = LuxuryForecastFeatureEngine()
+        self.feature_cols = None
+        # Boosters directs par tranche d'horizon (optionnels)
+        self.horizon_models = {}
+        # Sketches de drift des features servies (optionnel)
+        self.drift_monitor = None
+        # Routage vers des boosters par segment (optionnel)
+        self.segment_router = None
         
-    def train(self, df, target='quantity'):
-        """Entraînement avec validation temporelle"""
-        # Feature engineering
-        df_features = self.feature_engine.create_features(df)
-        
-        # Sélection des features
-        exclude_cols = ['date', 'product_id', 'quantity', 'product_name', 'forecast_week']
-        feature_cols = [col for col in df_features.columns 
-                       if col not in exclude_cols and not col.startswith('Unnamed')]
-        
-        X = df_features[feature_cols].fillna(0)
-        y = df_features[target]
+    def train(self, df, target='quantity', feature_cache=None):
+        """Entraînement avec validation temporelle (features en cache si feature_cache est fourni)"""
+        if feature_cache is not None:
+            features = feature_cache.get_or_build(df, self.feature_engine, target)
+            self.feature_cols = features.feature_cols
+            X = pd.DataFrame(features.X, columns=features.feature_cols)
+            y = pd.Series(features.y, name=target)
+        else:
+            # Feature engineering
+            df_features = self.feature_engine.create_features(df)
+            
+            # Sélection des features
+            self.feature_cols = [col for col in self.feature_engine.get_feature_columns(df_features)
+                                 if col != target]
+            
+            X = df_features[self.feature_cols].fillna(0)
+            y = df_features[target]
         
         # Split temporel (pas de shuffle!)
         tscv = TimeSeriesSplit(n_splits=5)
@@ -84,24 +104,22 @@ class LuxuryDemandPredictor:
     
     def predict(self, df_future, horizon_weeks=13) -> List[Dict]:
         """Prédiction pour les N prochaines semaines"""
-        # Si pas de modèle entraîné, créer un modèle simple pour démo
-        if self.model is None:
-            self._create_dummy_model()
-        
         predictions = []
         
         # Feature engineering
         df_features = self.feature_engine.create_features(df_future)
+        if self.drift_monitor is not None:
+            self.drift_monitor.update(df_features)
         
-        # Sélection des features
-        exclude_cols = ['date', 'product_id', 'quantity', 'product_name', 'forecast_week']
-        feature_cols = [col for col in df_features.columns 
-                       if col not in exclude_cols and not col.startswith('Unnamed')]
+        # Sélection des features (alignées sur celles du modèle)
+        X = self.feature_engine.to_matrix(df_features, self._resolve_feature_columns(df_features))
         
-        X = df_features[feature_cols].fillna(0)
+        # Si pas de modèle entraîné, créer un modèle simple pour démo
+        if self.model is None:
+            self._create_dummy_model(X.shape[1])
         
-        # Prédiction
-        pred = self.model.predict(X)
+        # Prédiction (routée par tranche d'horizon si des modèles directs sont chargés)
+        pred = self._predict_matrix(X, df_features)
         
         # Grouper par semaine
         if 'forecast_week' in df_features.columns:
@@ -127,6 +145,228 @@ class LuxuryDemandPredictor:
         
         return predictions
     
+    def load_horizon_models(self, directory: str) -> int:
+        """Charger les boosters directs multi-horizon depuis un répertoire"""
+        self.horizon_models = load_horizon_models(directory)
+        return len(self.horizon_models)
+    
+    def set_threads(self, n_threads: int):
+        """Threads XGBoost de tous les boosters (modèle principal, tranches, segments)"""
+        if hasattr(self.model, 'set_params'):
+            self.model.set_params(n_jobs=n_threads)
+        for booster in self.horizon_models.values():
+            booster.set_param('nthread', n_threads)
+        if self.segment_router is not None:
+            self.segment_router.registry.nthread = n_threads
+    
+    def _predict_matrix(self, X, df_features, contribs=False) -> np.ndarray:
+        """Boosters par segment si configurés, sinon (et pour les segments sans modèle) routage par horizon"""
+        forecast_weeks = df_features['forecast_week'].to_numpy() if 'forecast_week' in df_features.columns else None
+        if self.segment_router is None:
+            return self._predict_by_horizon(X, forecast_weeks, contribs)
+        
+        return self.segment_router.predict(
+            X, df_features,
+            fallback=lambda rows: self._predict_by_horizon(
+                X[rows], forecast_weeks[rows] if forecast_weeks is not None else None, contribs
+            ),
+            contribs=contribs
+        )
+    
+    def _predict_by_horizon(self, X, forecast_weeks, contribs=False) -> np.ndarray:
+        """Un predict par tranche d'horizon, modèle principal pour les lignes hors tranches"""
+        if not self.horizon_models or forecast_weeks is None:
+            return booster_contribs(self.model, X) if contribs else self.model.predict(X)
+        
+        buckets = sorted(self.horizon_models)
+        bucket_idx = assign_buckets(forecast_weeks + 1, buckets)
+        pred = np.empty((len(X), X.shape[1] + 1) if contribs else len(X), dtype=np.float32)
+        for i, bucket in enumerate(buckets):
+            rows = np.flatnonzero(bucket_idx == i)
+            if len(rows):
+                pred[rows] = predict_direct(self.horizon_models[bucket], X[rows], forecast_weeks[rows] + 1, contribs)
+        
+        rest = np.flatnonzero(bucket_idx < 0)
+        if len(rest):
+            pred[rest] = booster_contribs(self.model, X[rest]) if contribs else self.model.predict(X[rest])
+        return pred
+    
+    def explain(self, df_future, top_k=5, cache=None, model_version=None) -> Dict:
+        """
+        Top-k contributions TreeSHAP par ligne, sur la même matrice que predict.
+
+        Les contributions viennent du booster qui a produit la prédiction (segment,
+        tranche d'horizon ou modèle principal). Avec un cache, seules les lignes
+        absentes pour cette version du modèle sont calculées, en un seul batch.
+        """
+        if self.model is None:
+            raise ValueError("Explanations require a trained model")
+        
+        df_features = self.feature_engine.create_features(df_future)
+        feature_cols = self._resolve_feature_columns(df_features)
+        keys = row_keys(df_features)
+        
+        entries = cache.get_many(keys, str(model_version)) if cache is not None else [None] * len(keys)
+        missing = np.array([i for i, entry in enumerate(entries) if entry is None], dtype=np.int64)
+        if len(missing):
+            X = self.feature_engine.to_matrix(df_features.iloc[missing], feature_cols)
+            contribs = self._predict_matrix(X, df_features.iloc[missing].reset_index(drop=True), contribs=True)
+            top_idx, top_values = top_contributions(contribs, MAX_TOP_K)
+            computed = [
+                {
+                    'prediction': float(contribs[row].sum()),
+                    'base_value': float(contribs[row, -1]),
+                    'features': [feature_cols[j] for j in top_idx[row]],
+                    'values': top_values[row].tolist(),
+                }
+                for row in range(len(missing))
+            ]
+            for i, entry in zip(missing, computed):
+                entries[i] = entry
+            if cache is not None:
+                cache.put_many(keys[missing], str(model_version), computed)
+        
+        return {
+            'product_id': df_features['product_id'].to_numpy(),
+            'country': df_features['country'].to_numpy(),
+            'channel': df_features['channel'].to_numpy(),
+            'week': df_features['forecast_week'].to_numpy(),
+            'explanations': [
+                {**entry, 'features': entry['features'][:top_k], 'values': entry['values'][:top_k]}
+                for entry in entries
+            ],
+        }
+    
+    def predict_scenarios(self, df_future, scenarios: List[Dict]) -> List[Dict]:
+        """
+        Prévisions par scénario what-if, en un seul predict sur la matrice empilée.
+
+        Les features de la requête de base sont calculées une fois ; chaque scénario
+        (prix, mix canal pondéré, décalage du départ) n'en modifie que quelques colonnes.
+        Le suivi de drift n'est pas alimenté : ce trafic n'est pas de la demande réelle.
+        """
+        df_features = self.feature_engine.create_features(df_future)
+        feature_cols = self._resolve_feature_columns(df_features)
+        X = self.feature_engine.to_matrix(df_features, feature_cols)
+        if self.model is None:
+            self._create_dummy_model(X.shape[1])
+        
+        X_stacked, routing, blocks = stack_scenarios(
+            self.feature_engine, df_future, df_features, X, feature_cols, scenarios
+        )
+        pred = self._predict_matrix(X_stacked, routing).reshape(len(blocks), len(X))
+        
+        # Somme pondérée des blocs (un par canal du mix) de chaque scénario
+        combined = np.zeros((len(scenarios), len(X)), dtype=np.float32)
+        for block, (scenario_idx, weight) in enumerate(blocks):
+            combined[scenario_idx] += weight * pred[block]
+        
+        weeks = df_features['forecast_week'].to_numpy()
+        results = []
+        for scenario_pred in combined:
+            lower, upper = np.empty_like(scenario_pred), np.empty_like(scenario_pred)
+            for week in np.unique(weeks):
+                mask = weeks == week
+                lower[mask], upper[mask] = self._calculate_confidence_interval(scenario_pred[mask])
+            results.append({
+                'product_id': df_features['product_id'].to_numpy(),
+                'week': weeks,
+                'predicted_quantity': scenario_pred,
+                'confidence_interval': (lower, upper)
+            })
+        return results
+    
+    def predict_recursive(self, df_future, horizon_weeks=13, history=None) -> List[Dict]:
+        """
+        Prédiction récursive : les prévisions des semaines précédentes alimentent les lags.
+
+        Un seul predict vectorisé par semaine d'horizon, sur toutes les séries à la fois.
+        df_future doit contenir les mêmes séries pour chaque forecast_week ; history
+        (optionnel) fournit les ventes réelles récentes (date, quantity + clés de série).
+        """
+        df_future = df_future.sort_values('forecast_week', kind='stable').reset_index(drop=True)
+        week_counts = df_future['forecast_week'].value_counts()
+        n_series = len(df_future) // horizon_weeks
+        if len(week_counts) != horizon_weeks or not (week_counts == n_series).all():
+            raise ValueError("Recursive forecasting requires the same series for every forecast week")
+        
+        # Features calculées une seule fois pour toute la grille : (semaines, séries, features)
+        df_features = self.feature_engine.create_features(df_future)
+        if self.drift_monitor is not None:
+            self.drift_monitor.update(df_features)
+        feature_cols = self._resolve_feature_columns(df_features)
+        X = self.feature_engine.to_matrix(df_features, feature_cols).reshape(horizon_weeks, n_series, -1)
+        
+        if self.model is None:
+            self._create_dummy_model(X.shape[2])
+        
+        lag_idx = {lag: feature_cols.index(f'sales_lag_{lag}w')
+                   for lag in LAG_WEEKS if f'sales_lag_{lag}w' in feature_cols}
+        rolling_idx = {window: feature_cols.index(f'sales_rolling_{window}w')
+                       for window in ROLLING_WINDOWS if f'sales_rolling_{window}w' in feature_cols}
+        
+        series = df_future.iloc[:n_series]
+        series_features = df_features.iloc[:n_series]
+        sales = self._init_sales_buffer(series, history)
+        
+        predictions = []
+        for week in range(horizon_weeks):
+            X_week = X[week]
+            for lag, idx in lag_idx.items():
+                X_week[:, idx] = np.nan_to_num(sales[:, -lag], nan=0.0)
+            for window, idx in rolling_idx.items():
+                recent = sales[:, -window:]
+                known = (~np.isnan(recent)).sum(axis=1)
+                X_week[:, idx] = np.where(
+                    known > 0, np.nansum(recent, axis=1) / np.maximum(known, 1), DEFAULT_ROLLING_SALES
+                )
+            
+            if self.segment_router is not None:
+                week_pred = self.segment_router.predict(
+                    X_week, series_features, fallback=lambda rows: self.model.predict(X_week[rows])
+                )
+            else:
+                week_pred = self.model.predict(X_week)
+            
+            # Décalage en place de l'historique : la prévision devient la dernière vente connue
+            sales[:, :-1] = sales[:, 1:]
+            sales[:, -1] = np.maximum(week_pred, 0)
+            
+            predictions.append({
+                'product_id': series['product_id'].values,
+                'week': week,
+                'predicted_quantity': week_pred,
+                'confidence_interval': self._calculate_confidence_interval(week_pred)
+            })
+        
+        return predictions
+    
+    def _init_sales_buffer(self, series, history=None) -> np.ndarray:
+        """Ventes des dernières semaines par série (NaN = inconnue), la plus récente en dernier"""
+        depth = max(LAG_WEEKS + ROLLING_WINDOWS)
+        sales = np.full((len(series), depth), np.nan, dtype=np.float32)
+        if history is None or len(history) == 0:
+            return sales
+        
+        keys = [col for col in SERIES_KEYS if col in series.columns and col in history.columns]
+        recent = history.sort_values('date')
+        recent = recent.assign(_age=recent.groupby(keys).cumcount(ascending=False))
+        recent = recent[recent['_age'] < depth]
+        
+        rows = pd.MultiIndex.from_frame(series[keys]).get_indexer(pd.MultiIndex.from_frame(recent[keys]))
+        found = rows >= 0
+        sales[rows[found], depth - 1 - recent['_age'].values[found]] = recent['quantity'].values[found]
+        return sales
+    
+    def _resolve_feature_columns(self, df_features) -> List[str]:
+        """Colonnes attendues par le modèle (entraînement, MLflow ou déduites)"""
+        if self.feature_cols is not None:
+            return self.feature_cols
+        model_features = getattr(self.model, 'feature_names_in_', None)
+        if model_features is not None:
+            return list(model_features)
+        return self.feature_engine.get_feature_columns(df_features)
+    
     def _calculate_confidence_interval(self, predictions, confidence=0.95):
         """Intervalle de confiance basé sur l'erreur historique"""
         if len(predictions) == 0:
@@ -142,13 +382,13 @@ class LuxuryDemandPredictor:
         
         return (lower, upper)
     
-    def _create_dummy_model(self):
+    def _create_dummy_model(self, n_features=10):
         """Créer un modèle simple pour la démo"""
         from sklearn.ensemble import RandomForestRegressor
         
         # Créer des données d'exemple pour entraîner un modèle simple
         np.random.seed(42)
-        X_dummy = np.random.rand(100, 10)
+        X_dummy = np.random.rand(100, n_features)
         y_dummy = np.random.poisson(lam=50, size=100)
         
         self.model = RandomForestRegressor(n_estimators=10, random_state=42)
@@ -0,0 +1,211 @@
+"""
+Jobs de prévision asynchrones : exécution par chunks, file bornée, résultats sur disque
+"""
+import time
+import uuid
+import queue
+import shutil
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import pandas as pd
+
+class JobQueueFullError(Exception):
+    """File d'attente pleine : le job doit être resoumis plus tard"""
+
+class ForecastJobManager:
+    """
+    Pool de workers in-process pour les grosses requêtes de prévision.
+
+    Chaque job est découpé en chunks de produits ; les chunks passent par une
+    file commune consommée par un nombre fixe de threads. Les résultats de chaque
+    chunk sont écrits en Parquet dans le spool du job, seules les métadonnées
+    restent en mémoire. Un job est refusé si la file contient déjà trop de chunks.
+    """
+
+    def __init__(
+        self,
+        score_chunk: Callable[[Dict, List[str]], pd.DataFrame],
+        spool_dir: str,
+        workers: int = 2,
+        chunk_size: int = 100,
+        max_pending_chunks: int = 200,
+        job_ttl_seconds: int = 3600
+    ):
+        self.score_chunk = score_chunk
+        self.spool_dir = Path(spool_dir)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.max_pending_chunks = max_pending_chunks
+        self.job_ttl_seconds = job_ttl_seconds
+
+        self._queue = queue.Queue()
+        self._jobs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._pending_chunks = 0
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        """Démarrer les workers"""
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"forecast-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        """Arrêter les workers : les chunks encore en file sont abandonnés, leurs jobs marqués en échec"""
+        abandoned = set()
+        while True:
+            try:
+                task = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if task is not None:
+                abandoned.add(task[0])
+                with self._lock:
+                    self._pending_chunks -= 1
+        with self._lock:
+            for job_id in abandoned:
+                job = self._jobs.get(job_id)
+                if job is not None and job['status'] in ('queued', 'running'):
+                    job['status'] = 'failed'
+                    job['error'] = 'Service stopped before the job completed'
+                    job['finished_at'] = time.time()
+
+        # Les chunks en cours se terminent ; les workers s'arrêtent ensuite sur la sentinelle
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    def submit(self, params: Dict, product_ids: List[str]) -> Dict:
+        """Soumettre un job ; lève JobQueueFullError si la file est saturée"""
+        self._evict_expired()
+
+        chunks = [product_ids[i:i + self.chunk_size] for i in range(0, len(product_ids), self.chunk_size)]
+        job_id = uuid.uuid4().hex
+
+        with self._lock:
+            if self._pending_chunks + len(chunks) > self.max_pending_chunks:
+                raise JobQueueFullError(
+                    f"{self._pending_chunks} chunks pending, limit is {self.max_pending_chunks}"
+                )
+            self._pending_chunks += len(chunks)
+            self._jobs[job_id] = {
+                'job_id': job_id,
+                'status': 'queued',
+                'n_chunks': len(chunks),
+                'completed_chunks': 0,
+                'chunk_rows': [0] * len(chunks),
+                'error': None,
+                'created_at': time.time(),
+                'finished_at': None,
+            }
+
+        (self.spool_dir / job_id).mkdir(parents=True, exist_ok=True)
+        for chunk_id, chunk in enumerate(chunks):
+            self._queue.put((job_id, chunk_id, params, chunk))
+
+        return self.status(job_id)
+
+    def status(self, job_id: str) -> Dict:
+        """État d'un job (KeyError si inconnu ou expiré)"""
+        self._evict_expired()
+        with self._lock:
+            job = self._jobs[job_id]
+            return {
+                'job_id': job_id,
+                'status': job['status'],
+                'n_chunks': job['n_chunks'],
+                'completed_chunks': job['completed_chunks'],
+                'total_rows': sum(job['chunk_rows']),
+                'error': job['error'],
+            }
+
+    def results(self, job_id: str, page: int = 1, page_size: int = 1000) -> Dict:
+        """Page de résultats d'un job terminé, lue depuis les seuls chunks concernés"""
+        self._evict_expired()
+        with self._lock:
+            job = self._jobs[job_id]
+            if job['status'] != 'completed':
+                raise ValueError(f"Job {job_id} is {job['status']}")
+            chunk_rows = list(job['chunk_rows'])
+
+        start = (page - 1) * page_size
+        end = start + page_size
+        frames = []
+        offset = 0
+        for chunk_id, n_rows in enumerate(chunk_rows):
+            if offset + n_rows > start and offset < end:
+                chunk = pd.read_parquet(self._chunk_path(job_id, chunk_id))
+                frames.append(chunk.iloc[max(0, start - offset):end - offset])
+            offset += n_rows
+
+        items = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        return {
+            'job_id': job_id,
+            'page': page,
+            'page_size': page_size,
+            'total_rows': offset,
+            'items': items.to_dict(orient='records'),
+        }
+
+    def _chunk_path(self, job_id: str, chunk_id: int) -> Path:
+        return self.spool_dir / job_id / f"chunk-{chunk_id:05d}.parquet"
+
+    def _worker_loop(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+            job_id, chunk_id, params, product_ids = task
+
+            with self._lock:
+                job = self._jobs.get(job_id)
+                skip = job is None or job['status'] == 'failed'
+                if not skip:
+                    job['status'] = 'running'
+            if not skip:
+                self._run_chunk(job_id, chunk_id, params, product_ids)
+
+            with self._lock:
+                self._pending_chunks -= 1
+
+    def _run_chunk(self, job_id: str, chunk_id: int, params: Dict, product_ids: List[str]):
+        try:
+            frame = self.score_chunk(params, product_ids)
+            frame.to_parquet(self._chunk_path(job_id, chunk_id), index=False)
+        except Exception as e:
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is not None and job['status'] != 'failed':
+                    job['status'] = 'failed'
+                    job['error'] = str(e)
+                    job['finished_at'] = time.time()
+            return
+
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['status'] == 'failed':
+                return
+            job['chunk_rows'][chunk_id] = len(frame)
+            job['completed_chunks'] += 1
+            if job['completed_chunks'] == job['n_chunks']:
+                job['status'] = 'completed'
+                job['finished_at'] = time.time()
+
+    def _evict_expired(self):
+        """Supprimer les jobs terminés depuis plus de job_ttl_seconds (mémoire + disque)"""
+        now = time.time()
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job['finished_at'] is not None and now - job['finished_at'] > self.job_ttl_seconds
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        for job_id in expired:
+            shutil.rmtree(self.spool_dir / job_id, ignore_errors=True)
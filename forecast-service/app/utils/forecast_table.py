@@ -0,0 +1,164 @@
+"""
+Table de prévisions précalculées par version de modèle (memory-mapped, index trié)
+"""
+import os
+import json
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+FORECAST_TABLE_DIR = os.getenv("FORECAST_TABLE_DIR", os.path.join(tempfile.gettempdir(), "forecast-tables"))
+# Pointeur vers la table publiée (remplacé atomiquement)
+CURRENT_FILE = "CURRENT.json"
+KEY_SEPARATOR = "|"
+
+def table_keys(product_ids: List[str], country: str, channel: str, start_date) -> np.ndarray:
+    """Clés 'produit|pays|canal|YYYY-MM-DD' (bytes, comparables à l'index trié)"""
+    start = pd.Timestamp(start_date).date().isoformat()
+    suffix = f"{KEY_SEPARATOR}{country}{KEY_SEPARATOR}{channel}{KEY_SEPARATOR}{start}"
+    return np.array([f"{product_id}{suffix}" for product_id in product_ids], dtype=np.bytes_)
+
+class ForecastTable:
+    """
+    Index trié de clés (np.searchsorted) et matrice de prévisions (clés × semaines),
+    relus en memory-map : seules les pages des lignes demandées sont lues.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.meta = json.loads((self.directory / "meta.json").read_text())
+        self.model_version = str(self.meta['model_version'])
+        self.horizon = int(self.meta['horizon'])
+        self.keys = np.load(self.directory / "keys.npy", mmap_mode='r')
+        self.values = np.load(self.directory / "values.npy", mmap_mode='r')
+
+    def lookup(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Masque des clés trouvées et prévisions (n_trouvées, horizon) correspondantes"""
+        if len(self.keys) == 0:
+            return np.zeros(len(keys), dtype=bool), np.empty((0, self.horizon), dtype=np.float32)
+        idx = np.searchsorted(self.keys, keys.astype(self.keys.dtype))
+        idx_clipped = np.minimum(idx, len(self.keys) - 1)
+        found = (idx < len(self.keys)) & (self.keys[idx_clipped] == keys)
+        return found, np.asarray(self.values[idx_clipped[found]])
+
+def publish_table(
+    root: str,
+    model_version: str,
+    keys: np.ndarray,
+    values: np.ndarray,
+    keep: int = 2
+) -> Path:
+    """
+    Écrire une table (tri des clés) puis la publier en remplaçant le pointeur CURRENT.
+
+    Les services la prennent en compte au prochain poll ; les `keep` tables les plus
+    récentes sont conservées (une table encore mappée par un service reste lisible).
+    """
+    root_path = Path(root)
+    root_path.mkdir(parents=True, exist_ok=True)
+    name = f"v{model_version}-{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    tmp_dir = Path(tempfile.mkdtemp(prefix=f".{name}-", dir=root_path))
+
+    order = np.argsort(keys, kind='stable')
+    np.save(tmp_dir / "keys.npy", keys[order])
+    np.save(tmp_dir / "values.npy", np.ascontiguousarray(values[order], dtype=np.float32))
+    (tmp_dir / "meta.json").write_text(json.dumps({
+        'model_version': str(model_version),
+        'horizon': int(values.shape[1]),
+        'rows': int(len(keys)),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+    }))
+    os.rename(tmp_dir, root_path / name)
+
+    pointer_tmp = root_path / f".{CURRENT_FILE}.tmp"
+    pointer_tmp.write_text(json.dumps({'path': name, 'model_version': str(model_version)}))
+    os.replace(pointer_tmp, root_path / CURRENT_FILE)
+
+    tables = sorted((p for p in root_path.glob("v*") if p.is_dir()), key=lambda p: p.stat().st_mtime)
+    for stale in tables[:-keep]:
+        shutil.rmtree(stale, ignore_errors=True)
+    return root_path / name
+
+class ForecastTableStore:
+    """
+    Table publiée courante, rechargée à chaud quand le pointeur CURRENT change.
+
+    Un thread relit le pointeur toutes les `poll_seconds` ; le remplacement de la
+    table est une simple affectation, les requêtes en cours gardent l'ancienne.
+    """
+
+    def __init__(self, root: str = FORECAST_TABLE_DIR, poll_seconds: float = 30.0):
+        self.root = Path(root)
+        self.poll_seconds = poll_seconds
+        self.table: Optional[ForecastTable] = None
+        self._current_path = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.hits = 0
+        self.misses = 0
+        self.swaps = 0
+
+    def refresh(self) -> bool:
+        """Charger la table publiée si le pointeur a changé (True si swap)"""
+        pointer = self.root / CURRENT_FILE
+        try:
+            current = json.loads(pointer.read_text())
+        except (OSError, ValueError):
+            return False
+        if current['path'] == self._current_path:
+            return False
+        try:
+            table = ForecastTable(str(self.root / current['path']))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️  Table de prévisions illisible ({current['path']}): {e}")
+            return False
+        self.table, self._current_path = table, current['path']
+        self.swaps += 1
+        print(f"📚 Table de prévisions {current['path']} chargée ({len(table.keys):,} clés)")
+        return True
+
+    def start(self):
+        self.refresh()
+        self._thread = threading.Thread(target=self._poll_loop, name="forecast-table-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_seconds):
+            self.refresh()
+
+    def current(self, model_version) -> Optional[ForecastTable]:
+        """Table courante si elle a été générée par la version servie"""
+        table = self.table
+        if table is None or table.model_version != str(model_version):
+            return None
+        return table
+
+    def record(self, hits: int, misses: int):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def stats(self) -> Dict:
+        table = self.table
+        with self._lock:
+            return {
+                'table': self._current_path,
+                'model_version': table.model_version if table is not None else None,
+                'keys': int(len(table.keys)) if table is not None else 0,
+                'horizon': table.horizon if table is not None else None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'swaps': self.swaps,
+            }
@@ -1,9 +1,25 @@
 """
 MLflow model registry utilities
 """
+import os
 import mlflow
 import mlflow.xgboost
 from pathlib import Path
+from typing import Optional
+
+from models.horizon_models import HORIZON_ARTIFACT_PATH
+from models.xgboost_predictor import LuxuryDemandPredictor
+from features.drift import DriftMonitor
+from models.segment_router import SEGMENT_ARTIFACT_PATH, load_segment_router
+
+# Jeu de test (features + quantité) enregistré avec chaque run d'entraînement
+HOLDOUT_ARTIFACT_PATH = "holdout"
+HOLDOUT_FILE = "holdout.parquet"
+# Sketches de référence des features d'entraînement (détection de drift)
+DRIFT_ARTIFACT_PATH = "drift"
+DRIFT_REFERENCE_FILE = "reference.json"
+# Budget mémoire du LRU des boosters par segment
+SEGMENT_CACHE_MB = int(os.getenv("SEGMENT_CACHE_MB", "512"))
 
 def log_model_to_registry(model, model_name: str, run_name: str = None):
     """Enregistrer un modèle dans MLflow"""
@@ -31,3 +47,71 @@ def load_model_from_registry(model_name: str, stage: str = "production"):
     except Exception as e:
         print(f"Error loading model from MLflow: {e}")
         return None
+
+def download_horizon_models(run_id: str) -> Optional[str]:
+    """Télécharger les boosters multi-horizon d'une run (None si la run n'en a pas)"""
+    try:
+        return mlflow.artifacts.download_artifacts(run_id=run_id, artifact_path=HORIZON_ARTIFACT_PATH)
+    except Exception as e:
+        print(f"No horizon models for run {run_id}: {e}")
+        return None
+
+def load_predictor(
+    model_name: str,
+    version: str,
+    run_id: str = None,
+    segment_cache_mb: int = SEGMENT_CACHE_MB
+) -> LuxuryDemandPredictor:
+    """Prédicteur complet pour une version du registry (modèle, modèles par horizon et par segment)"""
+    predictor = LuxuryDemandPredictor()
+    predictor.model = mlflow.xgboost.load_model(f"models:/{model_name}/{version}")
+    if run_id:
+        horizon_dir = download_horizon_models(run_id)
+        if horizon_dir:
+            predictor.load_horizon_models(horizon_dir)
+        segment_dir = download_segment_models(run_id)
+        if segment_dir:
+            attach_segment_router(predictor, segment_dir, segment_cache_mb * 1024 * 1024)
+    return predictor
+
+def attach_segment_router(predictor: LuxuryDemandPredictor, segment_dir: str, max_bytes: int) -> bool:
+    """
+    Brancher les boosters par segment sur le prédicteur.
+
+    Les anciens boosters par segment (même semaine, sans tranche d'horizon) sont refusés
+    quand le prédicteur a des boosters directs : ils court-circuiteraient le routage par
+    horizon pour toutes les semaines prévues des segments entraînés.
+    """
+    router = load_segment_router(segment_dir, max_bytes)
+    if router.buckets is None and predictor.horizon_models:
+        print(f"⚠️  Modèles par segment ignorés ({segment_dir}) : boosters même semaine, "
+              f"incompatibles avec les modèles par tranche d'horizon (réentraîner avec SEGMENT_BY)")
+        return False
+    predictor.segment_router = router
+    return True
+
+def download_holdout(run_id: str) -> Optional[str]:
+    """Télécharger le jeu de test d'une run (None si absent)"""
+    try:
+        artifact_dir = mlflow.artifacts.download_artifacts(run_id=run_id, artifact_path=HOLDOUT_ARTIFACT_PATH)
+        return str(Path(artifact_dir) / HOLDOUT_FILE)
+    except Exception as e:
+        print(f"No holdout for run {run_id}: {e}")
+        return None
+
+def download_drift_reference(run_id: str) -> Optional[DriftMonitor]:
+    """Charger les sketches de référence d'une run (None si absents)"""
+    try:
+        artifact_dir = mlflow.artifacts.download_artifacts(run_id=run_id, artifact_path=DRIFT_ARTIFACT_PATH)
+        return DriftMonitor.from_json((Path(artifact_dir) / DRIFT_REFERENCE_FILE).read_text())
+    except Exception as e:
+        print(f"No drift reference for run {run_id}: {e}")
+        return None
+
+def download_segment_models(run_id: str) -> Optional[str]:
+    """Télécharger les boosters par segment d'une run (None si la run n'en a pas)"""
+    try:
+        return mlflow.artifacts.download_artifacts(run_id=run_id, artifact_path=SEGMENT_ARTIFACT_PATH)
+    except Exception as e:
+        print(f"No segment models for run {run_id}: {e}")
+        return None
@@ -0,0 +1,125 @@
+"""
+Scoring shadow d'un modèle challenger, hors du chemin de la requête
+"""
+import time
+import queue
+import threading
+from typing import Callable, Dict, List
+
+import numpy as np
+
+class ShadowStats:
+    """Statistiques cumulées champion vs challenger, mises à jour par batch (vectorisé)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+        self.dropped_batches = 0
+        self.failed_batches = 0
+        self.sum_champion = 0.0
+        self.sum_challenger = 0.0
+        self.sum_diff = 0.0
+        self.sum_abs_diff = 0.0
+        self.sum_sq_diff = 0.0
+        self.sum_abs_pct_diff = 0.0
+        self.max_abs_diff = 0.0
+        self.challenger_seconds = 0.0
+
+    def update(self, champion: np.ndarray, challenger: np.ndarray, elapsed: float):
+        """Ajouter un batch de prédictions alignées ligne à ligne"""
+        diff = challenger.astype(np.float64) - champion
+        abs_diff = np.abs(diff)
+        pct_diff = abs_diff / np.maximum(np.abs(champion), 1.0)
+        with self._lock:
+            self.batches += 1
+            self.rows += len(diff)
+            self.sum_champion += float(champion.sum())
+            self.sum_challenger += float(challenger.sum())
+            self.sum_diff += float(diff.sum())
+            self.sum_abs_diff += float(abs_diff.sum())
+            self.sum_sq_diff += float(np.square(diff).sum())
+            self.sum_abs_pct_diff += float(pct_diff.sum())
+            self.max_abs_diff = max(self.max_abs_diff, float(abs_diff.max(initial=0.0)))
+            self.challenger_seconds += elapsed
+
+    def record_dropped(self):
+        with self._lock:
+            self.dropped_batches += 1
+
+    def record_failed(self):
+        with self._lock:
+            self.failed_batches += 1
+
+    def summary(self) -> Dict:
+        """Moyennes dérivées des sommes cumulées"""
+        with self._lock:
+            n = max(self.rows, 1)
+            return {
+                'batches': self.batches,
+                'rows': self.rows,
+                'dropped_batches': self.dropped_batches,
+                'failed_batches': self.failed_batches,
+                'mean_champion': self.sum_champion / n,
+                'mean_challenger': self.sum_challenger / n,
+                'mean_diff': self.sum_diff / n,
+                'mean_abs_diff': self.sum_abs_diff / n,
+                'rmse_diff': (self.sum_sq_diff / n) ** 0.5,
+                'mean_abs_pct_diff': self.sum_abs_pct_diff / n * 100,
+                'max_abs_diff': self.max_abs_diff,
+                'challenger_ms_per_batch': self.challenger_seconds / max(self.batches, 1) * 1000,
+            }
+
+class ShadowScorer:
+    """
+    Worker unique qui rejoue les requêtes sur le challenger.
+
+    La file est bornée : si le worker est en retard, les nouveaux batches sont
+    abandonnés (et comptés) plutôt que d'ajouter de la latence au champion.
+    """
+
+    def __init__(self, score_fn: Callable[[object], List[Dict]], max_queue: int = 32):
+        self.score_fn = score_fn
+        self.stats = ShadowStats()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._worker_loop, name="shadow-scorer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        if self._thread is None:
+            return
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def submit(self, request, champion_predictions: List[Dict]):
+        """Planifier le scoring shadow d'une requête (non bloquant)"""
+        try:
+            self._queue.put_nowait((request, champion_predictions))
+        except queue.Full:
+            self.stats.record_dropped()
+
+    def _worker_loop(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+            request, champion_predictions = task
+            try:
+                started = time.perf_counter()
+                challenger_predictions = self.score_fn(request)
+                elapsed = time.perf_counter() - started
+                self.stats.update(
+                    np.concatenate([pred['predicted_quantity'] for pred in champion_predictions]),
+                    np.concatenate([pred['predicted_quantity'] for pred in challenger_predictions]),
+                    elapsed
+                )
+            except Exception as e:
+                print(f"⚠️  Erreur scoring shadow: {e}")
+                self.stats.record_failed()
@@ -4,6 +4,12 @@ Validation utilities for forecast requests
 from typing import List
 from datetime import datetime
 
+from models.inventory_optimizer import POLICIES
+from models.scenarios import MAX_SCENARIOS
+
+# Limite des jobs asynchrones (traités par chunks, résultats sur disque)
+MAX_JOB_PRODUCTS = 50000
+
 def validate_product_ids(product_ids: List[str]) -> bool:
     """Valider les IDs de produits"""
     if not product_ids:
@@ -12,6 +18,10 @@ def validate_product_ids(product_ids: List[str]) -> bool:
         return False
     return True
 
+def validate_job_product_ids(product_ids: List[str]) -> bool:
+    """Valider les IDs de produits d'un job asynchrone"""
+    return bool(product_ids) and len(product_ids) <= MAX_JOB_PRODUCTS
+
 def validate_date(date_str: str) -> bool:
     """Valider le format de date"""
     try:
@@ -23,3 +33,31 @@ def validate_date(date_str: str) -> bool:
 def validate_horizon(weeks: int) -> bool:
     """Valider l'horizon de prévision"""
     return 1 <= weeks <= 52  # Entre 1 semaine et 1 an
+
+def validate_production_params(request) -> bool:
+    """Valider les paramètres de l'optimisation de production"""
+    return (
+        request.production_policy in POLICIES
+        and 0 < request.service_level < 1
+        and 0 <= request.lead_time_weeks <= 52
+        and request.moq >= 0
+        and request.lot_size >= 1
+    )
+
+def validate_scenarios(scenarios) -> bool:
+    """Valider les scénarios what-if (noms uniques, prix, mix canal, décalage)"""
+    if not 1 <= len(scenarios) <= MAX_SCENARIOS:
+        return False
+    if len({scenario.name for scenario in scenarios}) != len(scenarios):
+        return False
+    for scenario in scenarios:
+        if scenario.price is not None and scenario.price <= 0:
+            return False
+        # Poids positifs ou nuls, de somme non nulle (normalisés à 1 au scoring)
+        if scenario.channel_mix is not None and (
+            any(weight < 0 for weight in scenario.channel_mix.values()) or sum(scenario.channel_mix.values()) <= 0
+        ):
+            return False
+        if abs(scenario.start_shift_weeks) > 52:
+            return False
+    return True
@@ -0,0 +1,76 @@
+"""
+Warm-up au démarrage : requêtes synthétiques sur le chemin de prédiction complet
+"""
+import time
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+def parse_warmup_sizes(spec: str) -> List[Tuple[int, int]]:
+    """Tailles de requêtes 'produitsxsemaines', ex: '1x13,20x13,100x52'"""
+    sizes = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        n_products, horizon = item.lower().split("x")
+        sizes.append((int(n_products), int(horizon)))
+    return sizes
+
+def synthetic_product_ids(n_products: int) -> List[str]:
+    """Identifiants au format du catalogue (BAG-001, ...)"""
+    return [f"BAG-{i:03d}" for i in range(1, n_products + 1)]
+
+class Warmup:
+    """
+    Exécute des requêtes synthétiques de tailles représentatives dans un thread
+    au démarrage (imports paresseux, premières DMatrix, pools de threads XGBoost,
+    chemins pandas, modèle par défaut). Le service n'est prêt qu'une fois terminé.
+    """
+
+    def __init__(
+        self,
+        run_fn: Callable[[Dict], None],
+        sizes: List[Tuple[int, int]],
+        rounds: int = 2,
+        on_done: Optional[Callable[[], None]] = None
+    ):
+        self.run_fn = run_fn
+        self.sizes = sizes
+        self.rounds = rounds
+        self.on_done = on_done
+        self.done = threading.Event()
+        self.requests = 0
+        self.seconds = 0.0
+        self.error = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def run(self):
+        started = time.perf_counter()
+        try:
+            for _ in range(self.rounds):
+                for n_products, horizon in self.sizes:
+                    self.run_fn({
+                        'product_ids': synthetic_product_ids(n_products),
+                        'forecast_horizon_weeks': horizon,
+                        # Le chemin récursif a ses propres premiers appels
+                        'recursive': self.requests % 2 == 1,
+                    })
+                    self.requests += 1
+        except Exception as e:
+            # Un warm-up en échec n'empêche pas de servir : le premier appel paiera le coût
+            self.error = str(e)
+            print(f"⚠️  Erreur warm-up: {e}")
+        self.seconds = time.perf_counter() - started
+        if self.on_done is not None:
+            self.on_done()
+        self.done.set()
+        print(f"🔥 Warm-up terminé: {self.requests} requêtes en {self.seconds:.1f}s")
+
+    def status(self) -> Dict:
+        return {
+            'done': self.done.is_set(),
+            'requests': self.requests,
+            'seconds': round(self.seconds, 3),
+            'error': self.error,
+        }
@@ -0,0 +1,67 @@
+"""
+Format binaire colonne (Arrow IPC stream) pour /forecast
+"""
+import json
+from typing import Dict, List, Optional
+
+import numpy as np
+import pyarrow as pa
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# Paramètres scalaires de ForecastRequest transmis dans les métadonnées du schéma
+_REQUEST_METADATA_FIELDS = [
+    'start_date', 'forecast_horizon_weeks', 'channel', 'countries', 'recursive',
+    'production_policy', 'service_level', 'lead_time_weeks', 'moq', 'lot_size'
+]
+
+def accepts_arrow(accept_header: Optional[str]) -> bool:
+    """Le client demande-t-il une réponse Arrow ?"""
+    return bool(accept_header) and ARROW_STREAM_MEDIA_TYPE in accept_header
+
+def is_arrow(content_type: Optional[str]) -> bool:
+    """Le corps de la requête est-il un stream Arrow ?"""
+    return bool(content_type) and content_type.split(";")[0].strip() == ARROW_STREAM_MEDIA_TYPE
+
+def forecast_request_from_arrow(body: bytes) -> Dict:
+    """
+    Décoder une requête Arrow : colonne product_id + paramètres en métadonnées.
+
+    Chaque valeur de métadonnée est encodée en JSON (ex: countries = '["FR", "US"]').
+    """
+    reader = pa.ipc.open_stream(body)
+    table = reader.read_all()
+    if 'product_id' not in table.column_names:
+        raise ValueError("Arrow request must have a 'product_id' column")
+
+    metadata = {key.decode(): value.decode() for key, value in (table.schema.metadata or {}).items()}
+    payload = {key: json.loads(metadata[key]) for key in _REQUEST_METADATA_FIELDS if key in metadata}
+    payload['product_ids'] = table.column('product_id').to_pylist()
+    return payload
+
+def predictions_to_arrow(predictions: List[Dict], recommended_production: np.ndarray) -> bytes:
+    """
+    Encoder les prédictions en un record batch Arrow, directement depuis les tableaux NumPy.
+
+    Mêmes colonnes que ForecastResponse ; product_id est encodé en dictionnaire
+    (chaque produit se répète une fois par semaine d'horizon).
+    """
+    sizes = [len(pred['predicted_quantity']) for pred in predictions]
+    product_ids = pa.array(np.concatenate([pred['product_id'] for pred in predictions]), type=pa.string())
+
+    batch = pa.record_batch([
+        product_ids.dictionary_encode(),
+        pa.array(np.repeat([pred['week'] for pred in predictions], sizes).astype(np.int16)),
+        pa.array(np.concatenate([pred['predicted_quantity'] for pred in predictions]).astype(np.float32)),
+        pa.array(np.concatenate([pred['confidence_interval'][0] for pred in predictions]).astype(np.float32)),
+        pa.array(np.concatenate([pred['confidence_interval'][1] for pred in predictions]).astype(np.float32)),
+        pa.array(np.asarray(recommended_production, dtype=np.int64)),
+    ], names=[
+        'product_id', 'week_offset', 'predicted_quantity',
+        'confidence_lower', 'confidence_upper', 'recommended_production'
+    ])
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,154 @@
+"""
+Historique des ventes en Parquet partitionné (année/semaine ISO, famille produit)
+"""
+import os
+import sys
+import uuid
+import argparse
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+SALES_STORE_DIR = os.getenv("SALES_STORE_DIR", str(Path(__file__).parent / "sales_store"))
+# Colonnes de partition (hive : year=2024/week=7/family=BAG)
+PARTITION_COLS = ['year', 'week', 'family']
+# Colonnes lues par le feature engineering
+SALES_COLUMNS = ['date', 'product_id', 'country', 'channel', 'quantity', 'price', 'collection']
+PARTITIONING = ds.partitioning(
+    pa.schema([('year', pa.int16()), ('week', pa.int8()), ('family', pa.string())]),
+    flavor='hive'
+)
+
+def product_family(product_ids: pd.Series) -> pd.Series:
+    """Famille produit : préfixe de l'identifiant (BAG-001 -> BAG)"""
+    return product_ids.astype(str).str.split('-', n=1).str[0]
+
+def _iso_year_week(date: pd.Timestamp):
+    iso = pd.Timestamp(date).isocalendar()
+    return iso[0], iso[1]
+
+class SalesStore:
+    """
+    Ventes hebdomadaires stockées en Parquet, une partition par semaine ISO et famille.
+
+    Chaque append écrit de nouveaux fichiers dans les partitions de la semaine, sans
+    réécrire l'existant (replace=True remplace les partitions touchées, pour rejouer
+    un export). Les lectures projettent les colonnes demandées et poussent les
+    filtres date/produit jusqu'aux partitions et aux statistiques des row groups.
+    """
+
+    def __init__(self, root: str = SALES_STORE_DIR):
+        self.root = Path(root)
+
+    def exists(self) -> bool:
+        return self.root.exists() and any(self.root.glob("year=*"))
+
+    def append(self, df: pd.DataFrame, replace: bool = False) -> int:
+        """Ajouter des ventes (colonnes date, product_id, country, channel, quantity, ...)"""
+        missing = {'date', 'product_id', 'quantity'} - set(df.columns)
+        if missing:
+            raise ValueError(f"Sales data is missing columns: {sorted(missing)}")
+
+        df = df.copy()
+        df['date'] = pd.to_datetime(df['date']).astype('datetime64[ms]')
+        iso = df['date'].dt.isocalendar()
+        df['year'] = iso['year'].astype(np.int16)
+        df['week'] = iso['week'].astype(np.int8)
+        df['family'] = product_family(df['product_id'])
+
+        # Tri par date/produit : statistiques de row groups sélectives pour les filtres
+        table = pa.Table.from_pandas(df.sort_values(['date', 'product_id']), preserve_index=False)
+        ds.write_dataset(
+            table,
+            self.root,
+            format='parquet',
+            partitioning=PARTITIONING,
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior='delete_matching' if replace else 'overwrite_or_ignore'
+        )
+        return table.num_rows
+
+    def read(
+        self,
+        columns: Optional[List[str]] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        product_ids: Optional[List[str]] = None
+    ) -> pd.DataFrame:
+        """Ventes entre start_date et end_date (inclus), pour les produits demandés
+
+        Les colonnes de partition ne sont retournées que si elles sont demandées.
+        """
+        if not self.exists():
+            raise FileNotFoundError(f"No sales store at {self.root}")
+
+        dataset = ds.dataset(self.root, format='parquet', partitioning=PARTITIONING)
+        expression = None
+
+        def _and(condition):
+            return condition if expression is None else expression & condition
+
+        # Élagage des partitions sur (année, semaine) ISO, ordonnées comme les dates
+        if start_date is not None:
+            year, week = _iso_year_week(start_date)
+            expression = _and((ds.field('year') > year) | ((ds.field('year') == year) & (ds.field('week') >= week)))
+            expression = _and(ds.field('date') >= pd.Timestamp(start_date))
+        if end_date is not None:
+            year, week = _iso_year_week(end_date)
+            expression = _and((ds.field('year') < year) | ((ds.field('year') == year) & (ds.field('week') <= week)))
+            expression = _and(ds.field('date') <= pd.Timestamp(end_date))
+        if product_ids is not None:
+            families = product_family(pd.Series(product_ids)).unique().tolist()
+            expression = _and(ds.field('family').isin(families))
+            expression = _and(ds.field('product_id').isin(list(product_ids)))
+
+        if columns is None:
+            columns = [name for name in dataset.schema.names if name not in PARTITION_COLS]
+        else:
+            columns = [name for name in columns if name in dataset.schema.names]
+        table = dataset.to_table(columns=columns, filter=expression)
+        df = table.to_pandas()
+        if 'date' in df.columns:
+            df['date'] = df['date'].astype('datetime64[ns]')
+            df = df.sort_values('date', kind='stable').reset_index(drop=True)
+        return df
+
+    def latest_date(self) -> Optional[pd.Timestamp]:
+        """Dernière semaine chargée (lecture de la seule partition la plus récente)"""
+        if not self.exists():
+            return None
+        latest_year = max(int(p.name.split('=')[1]) for p in self.root.glob("year=*"))
+        latest_week = max(int(p.name.split('=')[1]) for p in (self.root / f"year={latest_year}").glob("week=*"))
+        dataset = ds.dataset(self.root, format='parquet', partitioning=PARTITIONING)
+        table = dataset.to_table(
+            columns=['date'], filter=(ds.field('year') == latest_year) & (ds.field('week') == latest_week)
+        )
+        return pd.Timestamp(pc.max(table['date']).as_py())
+
+def load_sales_export(path: str) -> pd.DataFrame:
+    """Export de ventes (CSV du DataAggregationService ou Parquet)"""
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, parse_dates=['date'])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ajouter un export de ventes au store Parquet partitionné")
+    parser.add_argument("export", type=str, help="Export de ventes (CSV ou Parquet)")
+    parser.add_argument("--store", type=str, default=SALES_STORE_DIR, help="Répertoire du store")
+    parser.add_argument("--replace", action="store_true",
+                        help="Remplacer les partitions des semaines présentes dans l'export")
+
+    args = parser.parse_args()
+
+    try:
+        store = SalesStore(args.store)
+        rows = store.append(load_sales_export(args.export), replace=args.replace)
+        print(f"✅ {rows:,} lignes ajoutées à {store.root} (dernière semaine: {store.latest_date().date()})")
+    except Exception as e:
+        print(f"❌ Erreur lors de l'ajout des ventes: {e}")
+        sys.exit(1)
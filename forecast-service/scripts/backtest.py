@@ -0,0 +1,350 @@
+"""
+Backtest rolling-origin : erreurs par horizon et par segment sur plusieurs dates de planification,
+modèles directs par tranche d'horizon comparés au modèle principal
+"""
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+# Ajouter le répertoire app au path (imports internes au service) et training/ pour les données
+sys.path.append(str(Path(__file__).parent.parent / "app"))
+sys.path.append(str(Path(__file__).parent.parent / "training"))
+
+from models.xgboost_predictor import SERIES_KEYS
+from models.horizon_models import (
+    HORIZON_BUCKETS, HORIZON_FEATURE, assign_buckets, horizon_design_matrix, shifted_target
+)
+from models.segment_router import SEGMENT_BY_OPTIONS, segment_keys
+from features.feature_engineering import LuxuryForecastFeatureEngine
+from features.feature_cache import FEATURE_CACHE_DIR, FeatureMatrixCache
+
+# Configuration
+BACKTEST_TRACKING_URI = os.getenv("BACKTEST_TRACKING_URI", "")
+EXPERIMENT_NAME = "luxury_demand_forecast_backtest"
+DEFAULT_HORIZONS = [1, 4, 13, 26]
+
+# Mêmes hyperparamètres que train_pipeline_mlflow.py
+BOOSTER_PARAMS = {
+    'max_depth': 6,
+    'learning_rate': 0.05,
+    'subsample': 0.8,
+    'colsample_bytree': 0.8,
+    'min_child_weight': 3,
+    'gamma': 0.1,
+    'reg_alpha': 0.1,
+    'reg_lambda': 1.0,
+    'objective': 'reg:squarederror',
+    'tree_method': 'hist',
+    'seed': 42
+}
+
+# Features (memory-mapped) et cibles décalées, chargées une seule fois par processus worker
+_worker_state = {}
+
+def load_backtest_data(data_path: str = None) -> pd.DataFrame:
+    """Historique des ventes (CSV/Parquet, sinon comme l'entraînement : store partitionné ou synthétique)"""
+    if data_path is None:
+        from train_pipeline import load_training_data
+        return load_training_data(data_path)
+    if data_path.endswith(".parquet"):
+        return pd.read_parquet(data_path)
+    return pd.read_csv(data_path, parse_dates=['date'])
+
+def select_origins(
+    dates: np.ndarray,
+    n_origins: int,
+    step_weeks: int,
+    max_horizon: int,
+    min_train_weeks: int
+) -> List[pd.Timestamp]:
+    """
+    Dates d'origine, de la plus récente vers le passé, espacées de `step_weeks`.
+
+    La dernière origine laisse `max_horizon` semaines observées pour mesurer l'erreur ;
+    la première garde au moins `min_train_weeks` semaines d'historique d'entraînement.
+    """
+    unique_dates = np.unique(dates)
+    last = len(unique_dates) - 1 - max_horizon
+    candidates = range(last, min_train_weeks - 1, -step_weeks)
+    return sorted(pd.Timestamp(unique_dates[i]) for i in list(candidates)[:n_origins])
+
+def backtest_buckets(horizons: List[int]) -> List[tuple]:
+    """Tranches d'horizon servies contenant au moins un horizon évalué"""
+    idx = assign_buckets(np.asarray(horizons), HORIZON_BUCKETS)
+    if (idx < 0).any():
+        raise ValueError(f"Horizons outside the served buckets: {np.asarray(horizons)[idx < 0].tolist()}")
+    return [HORIZON_BUCKETS[i] for i in sorted(set(idx))]
+
+def _init_worker(cache_dir: str, cache_key: str, horizons: List[int], threads_per_worker: int):
+    """Relire les features du cache (memory-map, pas de copie) et décaler les cibles une fois"""
+    features = FeatureMatrixCache(cache_dir).load(cache_key)
+    frame = features.keys.copy()
+    frame['quantity'] = features.y
+    bucket_horizons = [h for bucket in backtest_buckets(horizons) for h in range(bucket[0], bucket[1] + 1)]
+    _worker_state.update({
+        'X': features.X,
+        'y': features.y,
+        'dates': features.keys['date'].to_numpy(),
+        'feature_cols': features.feature_cols,
+        'feature_engine': LuxuryForecastFeatureEngine(),
+        'targets': {h: shifted_target(frame, 'quantity', h, SERIES_KEYS) for h in bucket_horizons},
+        'threads': threads_per_worker,
+    })
+
+def _train_bucket(bucket, origin, params: Dict, num_boost_round: int) -> xgb.Booster:
+    """Booster direct d'une tranche, entraîné comme en production sur les cibles connues à l'origine"""
+    X, dates, feature_cols = _worker_state['X'], _worker_state['dates'], _worker_state['feature_cols']
+    parts_X, parts_y = [], []
+    for h in range(bucket[0], bucket[1] + 1):
+        target = _worker_state['targets'][h]
+        rows = np.flatnonzero((dates <= origin - np.timedelta64(7 * h, 'D')) & ~np.isnan(target))
+        parts_X.append(horizon_design_matrix(
+            X[rows], dates[rows], np.full(len(rows), h), feature_cols, _worker_state['feature_engine']
+        ))
+        parts_y.append(target[rows])
+    dtrain = xgb.DMatrix(np.vstack(parts_X), label=np.concatenate(parts_y),
+                         feature_names=feature_cols + [HORIZON_FEATURE])
+    return xgb.train(params, dtrain, num_boost_round=num_boost_round)
+
+def _run_origin(origin: pd.Timestamp, horizons: List[int], num_boost_round: int) -> Dict:
+    """
+    Entraîner, avec l'information disponible à l'origine, le modèle principal et un booster
+    direct par tranche d'horizon, puis prévoir chaque série depuis la semaine d'origine.
+
+    Les deux modèles reçoivent les lignes telles que servies (features de l'origine,
+    calendrier de la semaine cible) ; seul le booster direct lit la colonne horizon.
+    """
+    X = _worker_state['X']
+    dates = _worker_state['dates']
+    feature_cols = _worker_state['feature_cols']
+    origin = np.datetime64(origin)
+    anchor_rows = np.flatnonzero(dates == origin)
+    params = {**BOOSTER_PARAMS, 'nthread': _worker_state['threads']}
+
+    started = time.perf_counter()
+    single_rows = np.flatnonzero(dates <= origin)
+    single = xgb.train(params, xgb.DMatrix(X[single_rows], label=_worker_state['y'][single_rows],
+                                           feature_names=feature_cols), num_boost_round=num_boost_round)
+    buckets = {bucket: _train_bucket(bucket, origin, params, num_boost_round) for bucket in backtest_buckets(horizons)}
+
+    rows, horizon_col, model_col, predicted, actual = [], [], [], [], []
+    for h in horizons:
+        target = _worker_state['targets'][h]
+        eval_rows = anchor_rows[~np.isnan(target[anchor_rows])]
+        X_served = horizon_design_matrix(
+            X[eval_rows], dates[eval_rows], np.full(len(eval_rows), h), feature_cols, _worker_state['feature_engine']
+        )
+        bucket = HORIZON_BUCKETS[assign_buckets(np.array([h]), HORIZON_BUCKETS)[0]]
+        for model, pred in [('bucket', buckets[bucket].inplace_predict(X_served)),
+                            ('single', single.inplace_predict(X_served[:, :-1]))]:
+            rows.append(eval_rows)
+            horizon_col.append(np.full(len(eval_rows), h, dtype=np.int16))
+            model_col.append(np.full(len(eval_rows), model))
+            predicted.append(pred)
+            actual.append(target[eval_rows])
+
+    return {
+        'origin': pd.Timestamp(origin),
+        'rows': np.concatenate(rows),
+        'horizon': np.concatenate(horizon_col),
+        'model': np.concatenate(model_col),
+        'predicted': np.maximum(np.concatenate(predicted), 0).astype(np.float32),
+        'actual': np.concatenate(actual).astype(np.float32),
+        'seconds': time.perf_counter() - started,
+    }
+
+def error_table(predictions: pd.DataFrame, group_cols: List[str]) -> pd.DataFrame:
+    """Erreurs agrégées (MAE, RMSE, biais, WAPE, MAPE) par groupe, calculées en colonnes"""
+    frame = predictions.assign(
+        error=predictions['predicted'] - predictions['actual'],
+        abs_error=(predictions['predicted'] - predictions['actual']).abs(),
+        sq_error=(predictions['predicted'] - predictions['actual']) ** 2,
+        abs_pct_error=((predictions['predicted'] - predictions['actual']).abs()
+                       / predictions['actual'].where(predictions['actual'] != 0))
+    )
+    table = frame.groupby(group_cols, observed=True).agg(
+        n=('error', 'size'),
+        actual_sum=('actual', 'sum'),
+        mae=('abs_error', 'mean'),
+        rmse=('sq_error', 'mean'),
+        bias=('error', 'mean'),
+        abs_error_sum=('abs_error', 'sum'),
+        mape=('abs_pct_error', 'mean'),
+    ).reset_index()
+    table['rmse'] = np.sqrt(table['rmse'])
+    table['wape'] = table['abs_error_sum'] / table['actual_sum'].where(table['actual_sum'] != 0) * 100
+    table['mape'] = table['mape'] * 100
+    return table.drop(columns=['abs_error_sum'])
+
+def run_backtest(
+    output_dir: str,
+    data_path: str = None,
+    n_origins: int = 12,
+    step_weeks: int = 4,
+    horizons: List[int] = DEFAULT_HORIZONS,
+    min_train_weeks: int = 52,
+    num_boost_round: int = 200,
+    segment_by: str = 'family',
+    workers: int = None,
+    threads_per_worker: int = 1,
+    tracking_uri: str = BACKTEST_TRACKING_URI
+) -> pd.DataFrame:
+    """
+    Backtest rolling-origin en parallèle (un processus par origine à la fois).
+
+    Les features sont calculées une seule fois (cache disque) puis relues en
+    memory-map par chaque worker, qui découpe les lignes par date d'origine.
+    Écrit predictions.parquet, errors_by_horizon_segment.parquet et
+    errors_by_origin.parquet, et log un résumé dans un store MLflow local.
+    """
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    horizons = sorted(set(horizons))
+    backtest_buckets(horizons)
+    workers = workers or max(1, (os.cpu_count() or 2) // threads_per_worker)
+
+    print("📊 Chargement des données et features...")
+    df = load_backtest_data(data_path)
+    cache = FeatureMatrixCache(FEATURE_CACHE_DIR)
+    cache_key = cache.key(df, 'quantity')
+    features = cache.get_or_build(df, LuxuryForecastFeatureEngine(), target='quantity')
+
+    origins = select_origins(
+        features.keys['date'].to_numpy(), n_origins, step_weeks, max(horizons), min_train_weeks
+    )
+    if not origins:
+        raise ValueError("Not enough history for the requested horizons and min_train_weeks")
+    print(f"🧪 {len(origins)} origines ({origins[0].date()} → {origins[-1].date()}) "
+          f"× horizons {horizons} sur {workers} processus")
+
+    started = time.time()
+    results = []
+    # 'spawn' : pas de fork d'un processus ayant déjà démarré les threads OpenMP
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(str(cache.cache_dir), cache_key, horizons, threads_per_worker)
+    ) as executor:
+        futures = [executor.submit(_run_origin, origin, horizons, num_boost_round) for origin in origins]
+        for done, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            results.append(result)
+            print(f"⏳ [{done}/{len(origins)}] origine {result['origin'].date()} "
+                  f"- {len(result['rows'])} prévisions - {result['seconds']:.1f}s")
+
+    # Assemblage : une ligne par (origine, horizon, série), segments calculés en colonne
+    rows = np.concatenate([r['rows'] for r in results])
+    keys = features.keys.iloc[rows].reset_index(drop=True)
+    predictions = pd.DataFrame({
+        'origin': np.repeat([r['origin'] for r in results], [len(r['rows']) for r in results]),
+        'horizon': np.concatenate([r['horizon'] for r in results]),
+        'model': np.concatenate([r['model'] for r in results]),
+        'product_id': keys['product_id'].to_numpy(),
+        'country': keys['country'].to_numpy(),
+        'channel': keys['channel'].to_numpy(),
+        'predicted': np.concatenate([r['predicted'] for r in results]),
+        'actual': np.concatenate([r['actual'] for r in results]),
+    })
+    segment_frame = keys.copy()
+    for col in ['price', 'is_iconic_model']:
+        if col in features.feature_cols:
+            segment_frame[col] = features.X[rows, features.feature_cols.index(col)]
+    predictions['segment'] = segment_keys(segment_frame, segment_by)
+    predictions = predictions.sort_values(['origin', 'horizon', 'model', 'product_id', 'country', 'channel'])
+
+    by_segment = error_table(predictions, ['model', 'horizon', 'segment'])
+    by_horizon = error_table(predictions, ['model', 'horizon'])
+    by_origin = error_table(predictions, ['model', 'origin', 'horizon'])
+
+    predictions.to_parquet(output_path / "predictions.parquet", index=False)
+    by_segment.to_parquet(output_path / "errors_by_horizon_segment.parquet", index=False)
+    by_origin.to_parquet(output_path / "errors_by_origin.parquet", index=False)
+
+    print(f"✅ Backtest terminé: {len(predictions):,} prévisions en {time.time() - started:.1f}s")
+    single_mae = by_horizon[by_horizon['model'] == 'single'].set_index('horizon')['mae']
+    for _, row in by_horizon[by_horizon['model'] == 'bucket'].iterrows():
+        print(f"   - h={int(row['horizon']):>2}: MAE {row['mae']:.2f} (modèle principal {single_mae[row['horizon']]:.2f}) "
+              f"- WAPE {row['wape']:.1f}% - biais {row['bias']:+.2f}")
+
+    _log_summary(output_path, tracking_uri, by_horizon, {
+        'origins': len(origins),
+        'first_origin': str(origins[0].date()),
+        'last_origin': str(origins[-1].date()),
+        'step_weeks': step_weeks,
+        'horizons': horizons,
+        'min_train_weeks': min_train_weeks,
+        'num_boost_round': num_boost_round,
+        'segment_by': segment_by,
+    })
+    print(f"   Résultats: {output_path}")
+    return by_segment
+
+def _log_summary(output_path: Path, tracking_uri: str, by_horizon: pd.DataFrame, params: Dict):
+    """Métriques par horizon et tables d'erreurs dans un store MLflow local"""
+    import mlflow
+
+    mlflow.set_tracking_uri(tracking_uri or (output_path / "mlruns").resolve().as_uri())
+    mlflow.set_experiment(EXPERIMENT_NAME)
+    with mlflow.start_run(run_name=f"backtest_{time.strftime('%Y%m%d_%H%M%S')}"):
+        mlflow.log_params(params)
+        for _, row in by_horizon.iterrows():
+            # Tranches d'horizon : mae_h4 ; modèle principal : single_mae_h4
+            prefix = '' if row['model'] == 'bucket' else f"{row['model']}_"
+            h = int(row['horizon'])
+            mlflow.log_metrics({f"{prefix}mae_h{h}": row['mae'], f"{prefix}rmse_h{h}": row['rmse'],
+                                f"{prefix}wape_h{h}": row['wape'], f"{prefix}bias_h{h}": row['bias']})
+        for model, group in by_horizon.groupby('model'):
+            prefix = '' if model == 'bucket' else f"{model}_"
+            total_abs = (group['mae'] * group['n']).sum()
+            mlflow.log_metrics({
+                f"{prefix}mae": total_abs / group['n'].sum(),
+                f"{prefix}wape": total_abs / group['actual_sum'].sum() * 100,
+            })
+        for name in ["errors_by_horizon_segment.parquet", "errors_by_origin.parquet"]:
+            mlflow.log_artifact(str(output_path / name), artifact_path="backtest")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest rolling-origin du modèle de demande")
+    parser.add_argument("--output-dir", type=str, required=True, help="Répertoire Parquet de sortie")
+    parser.add_argument("--data", type=str, default=None, help="Historique des ventes (CSV ou Parquet)")
+    parser.add_argument("--origins", type=int, default=12, help="Nombre de dates d'origine")
+    parser.add_argument("--step-weeks", type=int, default=4, help="Écart entre deux origines (semaines)")
+    parser.add_argument("--horizons", type=int, nargs="+", default=DEFAULT_HORIZONS, help="Horizons (semaines)")
+    parser.add_argument("--min-train-weeks", type=int, default=52, help="Historique minimal avant la première origine")
+    parser.add_argument("--num-boost-round", type=int, default=200, help="Arbres par booster")
+    parser.add_argument("--segment-by", type=str, default="family", choices=SEGMENT_BY_OPTIONS,
+                        help="Segmentation des tables d'erreurs")
+    parser.add_argument("--workers", type=int, default=None, help="Nombre de processus")
+    parser.add_argument("--threads-per-worker", type=int, default=1, help="Threads XGBoost par processus")
+    parser.add_argument("--tracking-uri", type=str, default=BACKTEST_TRACKING_URI,
+                        help="Store MLflow (défaut: <output-dir>/mlruns)")
+
+    args = parser.parse_args()
+
+    try:
+        run_backtest(
+            output_dir=args.output_dir,
+            data_path=args.data,
+            n_origins=args.origins,
+            step_weeks=args.step_weeks,
+            horizons=args.horizons,
+            min_train_weeks=args.min_train_weeks,
+            num_boost_round=args.num_boost_round,
+            segment_by=args.segment_by,
+            workers=args.workers,
+            threads_per_worker=args.threads_per_worker,
+            tracking_uri=args.tracking_uri
+        )
+    except Exception as e:
+        print(f"❌ Erreur lors du backtest: {e}")
+        sys.exit(1)
@@ -0,0 +1,352 @@
+"""
+Scoring batch hors ligne du catalogue complet (produit × pays × canal × semaines)
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Ajouter le répertoire app au path (imports internes au service) et la racine du service (data/)
+sys.path.append(str(Path(__file__).parent.parent / "app"))
+sys.path.append(str(Path(__file__).parent.parent))
+
+from models.xgboost_predictor import LuxuryDemandPredictor, SERIES_KEYS
+from features.feature_engineering import LAG_WEEKS, ROLLING_WINDOWS, prepare_future_dataframe
+from data.sales_store import SalesStore
+from models.inventory_optimizer import POLICIES, InventoryOptimizer
+
+# Configuration
+MLFLOW_TRACKING_URI = os.getenv("MLFLOW_TRACKING_URI", "http://localhost:5000")
+MODEL_NAME = os.getenv("MODEL_NAME", "luxury_demand_forecast")
+MODEL_STAGE = os.getenv("MODEL_STAGE", "Production")
+
+DEFAULT_COUNTRIES = ['FR', 'US', 'CN', 'JP', 'UK']
+DEFAULT_CHANNELS = ['Boutique', 'Online', 'VIP']
+MANIFEST_FILE = "_manifest.json"
+SUCCESS_FILE = "_SUCCESS"
+
+# Prédicteur chargé une seule fois par processus worker
+_worker_predictor = None
+
+def load_catalog(catalog_path: str) -> pd.DataFrame:
+    """Charger le catalogue produits (CSV ou Parquet, colonne product_id obligatoire)"""
+    if catalog_path.endswith(".parquet"):
+        catalog = pd.read_parquet(catalog_path)
+    else:
+        catalog = pd.read_csv(catalog_path)
+
+    if 'product_id' not in catalog.columns:
+        raise ValueError("Catalog must have a 'product_id' column")
+
+    keep_cols = [col for col in ['product_id', 'price', 'collection'] if col in catalog.columns]
+    return catalog[keep_cols].drop_duplicates('product_id').reset_index(drop=True)
+
+def build_catalog_frame(
+    catalog_chunk: pd.DataFrame,
+    start_date: str,
+    horizon: int,
+    countries: List[str],
+    channels: List[str]
+) -> pd.DataFrame:
+    """Grille future semaine × pays × canal × produit, construite sans boucle Python"""
+    start = pd.to_datetime(start_date)
+    n_products = len(catalog_chunk)
+    n_series = n_products * len(countries) * len(channels)
+
+    # Ordre semaine-majeur, comme prepare_future_dataframe
+    weeks = np.repeat(np.arange(horizon), n_series)
+    countries_col = np.tile(np.repeat(countries, len(channels) * n_products), horizon)
+    channels_col = np.tile(np.repeat(channels, n_products), horizon * len(countries))
+    row_idx = np.tile(np.arange(n_products), horizon * len(countries) * len(channels))
+
+    frame = catalog_chunk.iloc[row_idx].reset_index(drop=True)
+    frame['date'] = start + pd.to_timedelta(weeks * 7, unit='D')
+    frame['forecast_week'] = weeks
+    frame['country'] = countries_col
+    frame['channel'] = channels_col
+    return frame
+
+def resolve_model_version(model_uri: str):
+    """Version du registry désignée par '<nom>/<stage>' ou '<nom>/<version>' (None si model_uri vide)"""
+    if not model_uri:
+        return None
+    from mlflow.tracking import MlflowClient
+
+    model_name, ref = model_uri.split("/", 1)
+    client = MlflowClient(tracking_uri=MLFLOW_TRACKING_URI)
+    if ref.isdigit():
+        return client.get_model_version(model_name, ref)
+    versions = client.get_latest_versions(model_name, stages=[ref])
+    if not versions:
+        raise ValueError(f"No {ref} version of {model_name}")
+    return versions[0]
+
+def prime_feature_encoders(predictor: LuxuryDemandPredictor, start_date) -> None:
+    """Encodeurs catégoriels ajustés comme dans le service (première requête : valeurs par défaut)"""
+    predictor.predict(prepare_future_dataframe(['WARMUP-000'], start_date, 1), 1)
+
+def _init_worker(model_name: str, model_version: str, run_id: str, start_date: str, threads_per_worker: int):
+    """Chargement du prédicteur complet (comme /forecast) dans chaque processus worker"""
+    global _worker_predictor
+
+    if model_version is None:
+        print(f"⚠️  [pid {os.getpid()}] Pas de modèle, utilisation d'un modèle par défaut")
+        _worker_predictor = LuxuryDemandPredictor()
+    else:
+        from utils.model_registry import load_predictor
+        import mlflow
+
+        mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
+        _worker_predictor = load_predictor(model_name, model_version, run_id)
+        # Éviter la sur-souscription CPU : les workers se partagent les cœurs
+        _worker_predictor.set_threads(threads_per_worker)
+    prime_feature_encoders(_worker_predictor, start_date)
+
+def _score_chunk(
+    chunk_id: int,
+    catalog_chunk: pd.DataFrame,
+    output_dir: str,
+    start_date: str,
+    horizon: int,
+    countries: List[str],
+    channels: List[str],
+    recursive: bool = False,
+    production: Dict = None,
+    sales_store: str = None
+) -> Dict:
+    """Scorer un chunk du catalogue et l'écrire en Parquet (écriture atomique)"""
+    frame = build_catalog_frame(catalog_chunk, start_date, horizon, countries, channels)
+    if recursive:
+        history = load_recent_sales(sales_store, catalog_chunk['product_id'].tolist(), start_date) if sales_store else None
+        predictions = _worker_predictor.predict_recursive(frame, horizon, history=history)
+    else:
+        predictions = _worker_predictor.predict(frame, horizon)
+
+    # Les prédictions sont groupées par semaine dans l'ordre de la grille
+    predicted = np.concatenate([p['predicted_quantity'] for p in predictions])
+    lower = np.concatenate([p['confidence_interval'][0] for p in predictions])
+    upper = np.concatenate([p['confidence_interval'][1] for p in predictions])
+    recommended = InventoryOptimizer(**(production or {})).recommend(predictions)
+
+    table = pa.table({
+        'product_id': frame['product_id'].to_numpy(),
+        'country': frame['country'].to_numpy(),
+        'channel': frame['channel'].to_numpy(),
+        'week_offset': frame['forecast_week'].to_numpy(dtype=np.int16),
+        'forecast_date': frame['date'].to_numpy(),
+        'predicted_quantity': predicted.astype(np.float32),
+        'confidence_lower': lower.astype(np.float32),
+        'confidence_upper': upper.astype(np.float32),
+        # Même moteur que /forecast (niveau de service, délai, MOQ)
+        'recommended_production': recommended,
+    })
+
+    part_path = Path(output_dir) / f"part-{chunk_id:05d}.parquet"
+    tmp_path = part_path.with_suffix(f".tmp-{os.getpid()}")
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, part_path)
+
+    return {'chunk_id': chunk_id, 'rows': table.num_rows}
+
+def load_recent_sales(sales_store: str, product_ids: List[str], start_date: str) -> pd.DataFrame:
+    """Dernières semaines de ventes des produits du chunk (seules partitions lues : semaines × familles)"""
+    depth = max(LAG_WEEKS + ROLLING_WINDOWS)
+    start = pd.to_datetime(start_date)
+    return SalesStore(sales_store).read(
+        columns=['date'] + SERIES_KEYS + ['quantity'],
+        start_date=start - pd.Timedelta(weeks=depth),
+        end_date=start - pd.Timedelta(days=1),
+        product_ids=product_ids
+    )
+
+def _catalog_fingerprint(catalog: pd.DataFrame) -> str:
+    """Empreinte du catalogue pour détecter un changement entre deux reprises"""
+    hashed = pd.util.hash_pandas_object(catalog, index=False).to_numpy()
+    return hashlib.sha256(hashed.tobytes()).hexdigest()
+
+def _prepare_output_dir(output_dir: Path, manifest: Dict, overwrite: bool) -> None:
+    """Créer le répertoire de sortie ou vérifier qu'une reprise est compatible"""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / MANIFEST_FILE
+
+    if manifest_path.exists() and not overwrite:
+        existing = json.loads(manifest_path.read_text())
+        if existing.get('model_version') != manifest['model_version']:
+            raise ValueError(
+                f"{output_dir} was scored with model version {existing.get('model_version')}, "
+                f"{manifest['model_uri']} now resolves to {manifest['model_version']}; "
+                "use --overwrite to restart from scratch"
+            )
+        if existing != manifest:
+            raise ValueError(
+                f"{output_dir} contains a run with different parameters; "
+                "use --overwrite to restart from scratch"
+            )
+        return
+
+    for stale in output_dir.glob("part-*"):
+        stale.unlink()
+    (output_dir / SUCCESS_FILE).unlink(missing_ok=True)
+    manifest_path.write_text(json.dumps(manifest, indent=2))
+
+def run_batch_scoring(
+    catalog_path: str,
+    output_dir: str,
+    start_date: str,
+    horizon: int = 52,
+    countries: List[str] = DEFAULT_COUNTRIES,
+    channels: List[str] = DEFAULT_CHANNELS,
+    chunk_size: int = 200,
+    workers: int = None,
+    threads_per_worker: int = 1,
+    model_uri: str = f"{MODEL_NAME}/{MODEL_STAGE}",
+    recursive: bool = False,
+    production: Dict = None,
+    sales_store: str = None,
+    overwrite: bool = False
+) -> int:
+    """
+    Scoring du catalogue en parallèle, un fichier Parquet par chunk de produits.
+
+    Un run interrompu reprend là où il s'est arrêté : les chunks déjà écrits
+    sont ignorés tant que les paramètres du run (manifest, version du modèle
+    résolue incluse) sont identiques.
+    """
+    catalog = load_catalog(catalog_path)
+    workers = workers or max(1, (os.cpu_count() or 2) // threads_per_worker)
+    output_path = Path(output_dir)
+    # Version résolue une fois : tous les workers scorent le même modèle
+    version_info = resolve_model_version(model_uri)
+    model_name = model_uri.split("/", 1)[0] if model_uri else None
+    model_version = str(version_info.version) if version_info is not None else None
+
+    manifest = {
+        'catalog_sha256': _catalog_fingerprint(catalog),
+        'start_date': start_date,
+        'horizon': horizon,
+        'countries': list(countries),
+        'channels': list(channels),
+        'chunk_size': chunk_size,
+        'model_uri': model_uri,
+        # Version résolue : un stage peut pointer vers une autre version entre deux reprises
+        'model_version': model_version,
+        'model_run_id': version_info.run_id if version_info is not None else None,
+        'recursive': recursive,
+        'production': production or {},
+        'sales_store': sales_store,
+    }
+    _prepare_output_dir(output_path, manifest, overwrite)
+
+    n_chunks = (len(catalog) + chunk_size - 1) // chunk_size
+    pending = [
+        chunk_id for chunk_id in range(n_chunks)
+        if not (output_path / f"part-{chunk_id:05d}.parquet").exists()
+    ]
+
+    print(f"📦 Catalogue: {len(catalog)} produits, {n_chunks} chunks"
+          + (f" - modèle {model_name} v{model_version}" if model_version else ""))
+    print(f"   - {len(countries)} pays × {len(channels)} canaux × {horizon} semaines")
+    if len(pending) < n_chunks:
+        print(f"🔁 Reprise: {n_chunks - len(pending)} chunks déjà écrits")
+
+    started = time.time()
+    total_rows = 0
+    already_done = n_chunks - len(pending)
+    done = already_done
+
+    # 'spawn' : pas de fork d'un processus ayant déjà démarré les threads OpenMP
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(model_name, model_version, version_info.run_id if version_info is not None else None,
+                  start_date, threads_per_worker)
+    ) as executor:
+        futures = [
+            executor.submit(
+                _score_chunk, chunk_id,
+                catalog.iloc[chunk_id * chunk_size:(chunk_id + 1) * chunk_size],
+                output_dir, start_date, horizon, list(countries), list(channels), recursive, production, sales_store
+            )
+            for chunk_id in pending
+        ]
+
+        for future in as_completed(futures):
+            result = future.result()
+            done += 1
+            total_rows += result['rows']
+            elapsed = time.time() - started
+            rate = total_rows / elapsed if elapsed > 0 else 0.0
+            eta = elapsed / (done - already_done) * (n_chunks - done)
+            print(f"⏳ [{done}/{n_chunks}] chunk {result['chunk_id']:05d} "
+                  f"- {total_rows:,} lignes - {rate:,.0f} lignes/s - ETA {eta:.0f}s")
+
+    (output_path / SUCCESS_FILE).write_text(time.strftime('%Y-%m-%dT%H:%M:%S'))
+    print(f"✅ Scoring terminé: {total_rows:,} lignes en {time.time() - started:.1f}s")
+    print(f"   Résultats: {output_path}")
+    return total_rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scoring batch du catalogue complet")
+    parser.add_argument("--catalog", type=str, required=True, help="Fichier catalogue (CSV ou Parquet)")
+    parser.add_argument("--output-dir", type=str, required=True, help="Répertoire Parquet de sortie")
+    parser.add_argument("--start-date", type=str, required=True, help="Date de début (YYYY-MM-DD)")
+    parser.add_argument("--horizon", type=int, default=52, help="Horizon en semaines")
+    parser.add_argument("--countries", nargs="+", default=DEFAULT_COUNTRIES, help="Pays à scorer")
+    parser.add_argument("--channels", nargs="+", default=DEFAULT_CHANNELS, help="Canaux à scorer")
+    parser.add_argument("--chunk-size", type=int, default=200, help="Produits par chunk")
+    parser.add_argument("--workers", type=int, default=None, help="Nombre de processus")
+    parser.add_argument("--threads-per-worker", type=int, default=1, help="Threads XGBoost par processus")
+    parser.add_argument("--model-uri", type=str, default=f"{MODEL_NAME}/{MODEL_STAGE}",
+                        help="Modèle MLflow '<nom>/<stage>' (vide = modèle par défaut)")
+    parser.add_argument("--recursive", action="store_true",
+                        help="Prévision récursive (les prévisions alimentent les lags)")
+    parser.add_argument("--sales-store", type=str, default=None,
+                        help="Store de ventes partitionné : historique récent pour --recursive")
+    parser.add_argument("--production-policy", type=str, default="newsvendor", choices=POLICIES,
+                        help="Politique de production (newsvendor ou coverage)")
+    parser.add_argument("--service-level", type=float, default=0.95, help="Niveau de service cible")
+    parser.add_argument("--lead-time-weeks", type=int, default=2, help="Délai de fabrication (semaines)")
+    parser.add_argument("--moq", type=int, default=0, help="Quantité minimale de production")
+    parser.add_argument("--lot-size", type=int, default=1, help="Taille de lot de production")
+    parser.add_argument("--overwrite", action="store_true", help="Ignorer un run existant et repartir de zéro")
+
+    args = parser.parse_args()
+
+    try:
+        run_batch_scoring(
+            catalog_path=args.catalog,
+            output_dir=args.output_dir,
+            start_date=args.start_date,
+            horizon=args.horizon,
+            countries=args.countries,
+            channels=args.channels,
+            chunk_size=args.chunk_size,
+            workers=args.workers,
+            threads_per_worker=args.threads_per_worker,
+            model_uri=args.model_uri,
+            recursive=args.recursive,
+            production={
+                'policy': args.production_policy,
+                'service_level': args.service_level,
+                'lead_time_weeks': args.lead_time_weeks,
+                'moq': args.moq,
+                'lot_size': args.lot_size,
+            },
+            sales_store=args.sales_store,
+            overwrite=args.overwrite
+        )
+    except Exception as e:
+        print(f"❌ Erreur lors du scoring batch: {e}")
+        sys.exit(1)
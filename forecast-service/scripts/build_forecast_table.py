@@ -0,0 +1,129 @@
+"""
+Génération de la table de prévisions précalculée servie par /forecast
+"""
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pandas as pd
+import mlflow
+from mlflow.tracking import MlflowClient
+
+# Ajouter le répertoire app au path (imports internes au service)
+sys.path.append(str(Path(__file__).parent.parent / "app"))
+sys.path.append(str(Path(__file__).parent))
+
+from batch_score import load_catalog, build_catalog_frame, prime_feature_encoders
+from utils.model_registry import load_predictor
+from utils.forecast_table import FORECAST_TABLE_DIR, publish_table, table_keys
+
+# Configuration
+MLFLOW_TRACKING_URI = os.getenv("MLFLOW_TRACKING_URI", "http://localhost:5000")
+MODEL_NAME = os.getenv("MODEL_NAME", "luxury_demand_forecast")
+MODEL_STAGE = os.getenv("MODEL_STAGE", "Production")
+
+# Valeurs par défaut de ForecastRequest incluses ("All")
+DEFAULT_COUNTRIES = ['All', 'FR', 'US', 'CN', 'JP', 'UK']
+DEFAULT_CHANNELS = ['All', 'Boutique', 'Online', 'VIP']
+# Horizon stocké : toute requête d'horizon inférieur lit un préfixe de la ligne
+TABLE_HORIZON = 52
+
+def next_monday(date=None) -> pd.Timestamp:
+    date = pd.Timestamp(date or pd.Timestamp.now().normalize())
+    return date + pd.Timedelta(days=(7 - date.weekday()) % 7)
+
+def build_forecast_table(
+    catalog_path: str,
+    start_date: str = None,
+    weeks: int = 4,
+    countries: List[str] = DEFAULT_COUNTRIES,
+    channels: List[str] = DEFAULT_CHANNELS,
+    model_version: str = None,
+    output_dir: str = FORECAST_TABLE_DIR,
+    chunk_size: int = 500,
+    keep: int = 2
+) -> Path:
+    """
+    Prévoir TABLE_HORIZON semaines pour chaque (produit, pays, canal, lundi de départ)
+    avec une version du registry, puis publier la table pour cette version.
+
+    La grille est construite sans prix ni collection, comme les requêtes /forecast,
+    pour que les valeurs de la table soient celles de l'inférence en direct.
+    """
+    mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
+    client = MlflowClient(tracking_uri=MLFLOW_TRACKING_URI)
+    if model_version is None:
+        versions = client.get_latest_versions(MODEL_NAME, stages=[MODEL_STAGE])
+        if not versions:
+            raise ValueError(f"No {MODEL_STAGE} version of {MODEL_NAME}")
+        version_info = versions[0]
+    else:
+        version_info = client.get_model_version(MODEL_NAME, model_version)
+    model_version = str(version_info.version)
+
+    predictor = load_predictor(MODEL_NAME, model_version, version_info.run_id)
+
+    prime_feature_encoders(predictor, next_monday(start_date))
+
+    catalog = load_catalog(catalog_path)[['product_id']]
+    starts = [next_monday(start_date) + pd.Timedelta(weeks=i) for i in range(weeks)]
+    n_rows = len(catalog) * len(countries) * len(channels) * len(starts)
+    print(f"📦 Table v{model_version}: {len(catalog)} produits × {len(countries)} pays × "
+          f"{len(channels)} canaux × {len(starts)} départs = {n_rows:,} clés")
+
+    keys, values = [], []
+    started = time.time()
+    for start in starts:
+        for offset in range(0, len(catalog), chunk_size):
+            chunk = catalog.iloc[offset:offset + chunk_size]
+            frame = build_catalog_frame(chunk, start, TABLE_HORIZON, list(countries), list(channels))
+            predictions = predictor.predict(frame, TABLE_HORIZON)
+
+            # Grille semaine-majeure : la première semaine donne l'ordre des séries
+            series = frame[frame['forecast_week'] == 0]
+            for (country, channel), group in series.groupby(['country', 'channel'], sort=False):
+                keys.append(table_keys(group['product_id'].tolist(), country, channel, start))
+            values.append(np.column_stack([pred['predicted_quantity'] for pred in predictions]).astype(np.float32))
+        print(f"⏳ Départ {start.date()} - {sum(len(k) for k in keys):,}/{n_rows:,} clés "
+              f"- {time.time() - started:.1f}s")
+
+    all_keys = np.concatenate(keys)
+    table_dir = publish_table(output_dir, model_version, all_keys, np.concatenate(values), keep=keep)
+    print(f"✅ Table publiée: {table_dir} ({len(all_keys):,} clés en {time.time() - started:.1f}s)")
+    return table_dir
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Précalcul de la table de prévisions servie par /forecast")
+    parser.add_argument("--catalog", type=str, required=True, help="Fichier catalogue (CSV ou Parquet)")
+    parser.add_argument("--start-date", type=str, default=None,
+                        help="Premier lundi de départ (défaut: lundi prochain)")
+    parser.add_argument("--weeks", type=int, default=4, help="Nombre de lundis de départ consécutifs")
+    parser.add_argument("--countries", nargs="+", default=DEFAULT_COUNTRIES, help="Pays précalculés")
+    parser.add_argument("--channels", nargs="+", default=DEFAULT_CHANNELS, help="Canaux précalculés")
+    parser.add_argument("--model-version", type=str, default=None,
+                        help=f"Version du registry (défaut: version en {MODEL_STAGE})")
+    parser.add_argument("--output-dir", type=str, default=FORECAST_TABLE_DIR, help="Répertoire des tables")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Produits prédits par lot")
+    parser.add_argument("--keep", type=int, default=2, help="Tables conservées après publication")
+
+    args = parser.parse_args()
+
+    try:
+        build_forecast_table(
+            catalog_path=args.catalog,
+            start_date=args.start_date,
+            weeks=args.weeks,
+            countries=args.countries,
+            channels=args.channels,
+            model_version=args.model_version,
+            output_dir=args.output_dir,
+            chunk_size=args.chunk_size,
+            keep=args.keep
+        )
+    except Exception as e:
+        print(f"❌ Erreur lors de la génération de la table: {e}")
+        sys.exit(1)
@@ -0,0 +1,415 @@
+"""
+Test de charge de bout en bout : registre MLflow local, service démarré, trafic /forecast
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+SERVICE_DIR = Path(__file__).parent.parent
+MODEL_NAME = "luxury_demand_forecast"
+
+# Mix de requêtes 'produitsxsemaines:poids', calqué sur le trafic de planification
+# (beaucoup de consultations unitaires, quelques plans de collection complets)
+DEFAULT_MIX = "1x13:50,10x13:25,50x26:15,100x52:10"
+DEFAULT_RESULTS_DIR = SERVICE_DIR / "load_test_results"
+# Drain de l'ancienne instance après bascule (équivalent du preStop de k8s/deployment.yaml)
+SWAP_DRAIN_SECONDS = 3.0
+
+def parse_mix(spec: str) -> List[Tuple[int, int, float]]:
+    """Mix '1x13:50,100x52:10' -> [(produits, semaines, poids), ...]"""
+    mix = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        size, weight = item.split(":")
+        n_products, horizon = size.lower().split("x")
+        mix.append((int(n_products), int(horizon), float(weight)))
+    return mix
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _http(method: str, url: str, payload: Dict = None, timeout: float = 60.0) -> Tuple[int, bytes]:
+    data = json.dumps(payload).encode() if payload is not None else None
+    request = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+def process_tree_rss_mb(pid: int) -> float:
+    """RSS cumulé d'un processus et de ses descendants (workers uvicorn), via /proc"""
+    parents = {}
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            fields = stat.read_text().rsplit(")", 1)[1].split()
+            parents[int(stat.parent.name)] = int(fields[1])
+        except (OSError, IndexError, ValueError):
+            continue
+
+    tree, frontier = {pid}, [pid]
+    while frontier:
+        parent = frontier.pop()
+        children = [child for child, ppid in parents.items() if ppid == parent and child not in tree]
+        tree.update(children)
+        frontier.extend(children)
+
+    rss_kb = 0
+    for member in tree:
+        try:
+            for line in Path(f"/proc/{member}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    rss_kb += int(line.split()[1])
+        except OSError:
+            continue
+    return rss_kb / 1024
+
+class LocalRegistry:
+    """Registre MLflow fichier avec des versions entraînées par train_pipeline_mlflow.py"""
+
+    def __init__(self, registry_dir: str):
+        self.tracking_uri = Path(registry_dir).resolve().as_uri()
+
+    def _client(self):
+        import mlflow
+        from mlflow.tracking import MlflowClient
+
+        mlflow.set_tracking_uri(self.tracking_uri)
+        return MlflowClient(tracking_uri=self.tracking_uri)
+
+    def versions(self) -> List[str]:
+        try:
+            found = self._client().search_model_versions(f"name='{MODEL_NAME}'")
+        except Exception:
+            return []
+        return sorted((str(v.version) for v in found), key=int)
+
+    def ensure_versions(self, count: int) -> List[str]:
+        """Entraîner jusqu'à avoir `count` versions enregistrées"""
+        while len(self.versions()) < count:
+            print(f"🎯 Entraînement d'une version de modèle ({len(self.versions()) + 1}/{count})...")
+            subprocess.run(
+                [sys.executable, "train_pipeline_mlflow.py"],
+                cwd=SERVICE_DIR / "training",
+                env={**os.environ, "MLFLOW_TRACKING_URI": self.tracking_uri},
+                check=True,
+                stdout=subprocess.DEVNULL
+            )
+        return self.versions()
+
+    def promote(self, version: str):
+        self._client().transition_model_version_stage(
+            MODEL_NAME, version, "Production", archive_existing_versions=True
+        )
+
+class ServiceProcess:
+    """Instance du service (uvicorn) démarrée contre le registre local"""
+
+    def __init__(self, tracking_uri: str, workers: int = 1, env: Dict = None):
+        self.port = _free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.started = time.perf_counter()
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", str(SERVICE_DIR / "app"),
+             "--host", "127.0.0.1", "--port", str(self.port), "--workers", str(workers), "--log-level", "warning"],
+            env={**os.environ, "MLFLOW_TRACKING_URI": tracking_uri, **(env or {})},
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+
+    def wait_for(self, path: str, timeout: float = 300.0) -> float:
+        """Secondes depuis le lancement jusqu'au premier 200 sur `path`"""
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Service exited with code {self.process.returncode}")
+            try:
+                if _http("GET", self.base_url + path, timeout=2.0)[0] == 200:
+                    return time.perf_counter() - self.started
+            except OSError:
+                pass
+            time.sleep(0.1)
+        raise TimeoutError(f"{path} not ready after {timeout:.0f}s")
+
+    def rss_mb(self) -> float:
+        return process_tree_rss_mb(self.process.pid)
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+class LoadGenerator:
+    """
+    Boucle fermée : `concurrency` clients envoient des requêtes tirées du mix,
+    chacun dès la réponse précédente reçue. La cible peut changer en cours de run.
+    """
+
+    def __init__(self, mix: List[Tuple[int, int, float]], concurrency: int, seed: int = 42):
+        self.mix = mix
+        self.concurrency = concurrency
+        self.weights = np.array([w for _, _, w in mix]) / sum(w for _, _, w in mix)
+        self.rng = random.Random(seed)
+        self.base_url = None
+        self.started = None
+        self._lock = threading.Lock()
+        self.samples = []  # (t, latence, statut, lignes)
+
+    def _payload(self) -> Tuple[Dict, int]:
+        with self._lock:
+            n_products, horizon, _ = self.mix[self.rng.choices(range(len(self.mix)), self.weights)[0]]
+            offset = self.rng.randint(1, 500)
+        product_ids = [f"BAG-{(offset + i) % 1000:03d}" for i in range(n_products)]
+        payload = {'product_ids': product_ids, 'start_date': '2025-01-06', 'forecast_horizon_weeks': horizon}
+        return payload, n_products * horizon
+
+    def _client_loop(self, started: float, duration: float):
+        while time.perf_counter() - started < duration:
+            payload, rows = self._payload()
+            t0 = time.perf_counter()
+            try:
+                status, _ = _http("POST", self.base_url + "/forecast", payload)
+            except OSError:
+                status = 0
+            with self._lock:
+                self.samples.append((t0 - started, time.perf_counter() - t0, status, rows))
+
+    def run(self, duration: float, on_tick=None, tick_seconds: float = 1.0) -> Dict:
+        """Envoyer du trafic pendant `duration` secondes ; on_tick(t) appelé chaque seconde"""
+        self.samples = []
+        started = self.started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = [executor.submit(self._client_loop, started, duration) for _ in range(self.concurrency)]
+            while not all(future.done() for future in futures):
+                if on_tick is not None:
+                    on_tick(time.perf_counter() - started)
+                time.sleep(tick_seconds)
+            for future in futures:
+                future.result()
+        return summarize(self.samples, time.perf_counter() - started)
+
+def summarize(samples: List[Tuple], elapsed: float) -> Dict:
+    """Débit, percentiles de latence et taux d'erreur (statuts != 200)"""
+    if not samples:
+        return {'requests': 0}
+    latencies = np.array([s[1] for s in samples]) * 1000
+    ok = np.array([s[2] == 200 for s in samples])
+    rows = np.array([s[3] for s in samples])
+    return {
+        'requests': len(samples),
+        'duration_s': round(elapsed, 3),
+        'throughput_rps': len(samples) / elapsed,
+        'throughput_rows_s': float(rows[ok].sum()) / elapsed,
+        'latency_p50_ms': float(np.percentile(latencies, 50)),
+        'latency_p95_ms': float(np.percentile(latencies, 95)),
+        'latency_p99_ms': float(np.percentile(latencies, 99)),
+        'latency_max_ms': float(latencies.max()),
+        'error_rate': float(1 - ok.mean()),
+    }
+
+def scenario_cold_start(registry: LocalRegistry, workers: int) -> Dict:
+    """Temps jusqu'au /health et au /ready, puis latence de la première requête"""
+    service = ServiceProcess(registry.tracking_uri, workers)
+    try:
+        health_s = service.wait_for("/health")
+        ready_s = service.wait_for("/ready")
+        t0 = time.perf_counter()
+        status, _ = _http("POST", service.base_url + "/forecast",
+                          {'product_ids': ['BAG-001'], 'start_date': '2025-01-06', 'forecast_horizon_weeks': 13})
+        return {
+            'time_to_health_s': health_s,
+            'time_to_ready_s': ready_s,
+            'first_request_ms': (time.perf_counter() - t0) * 1000,
+            'first_request_status': status,
+            'rss_mb': service.rss_mb(),
+        }
+    finally:
+        service.stop()
+
+def scenario_steady(registry: LocalRegistry, generator: LoadGenerator, workers: int, duration: float) -> Dict:
+    """Charge soutenue sur un service prêt, RSS échantillonné chaque seconde"""
+    service = ServiceProcess(registry.tracking_uri, workers)
+    try:
+        service.wait_for("/ready")
+        generator.base_url = service.base_url
+        rss = []
+        result = generator.run(duration, on_tick=lambda t: rss.append((round(t, 1), service.rss_mb())))
+        result['rss_mb'] = rss
+        result['latency_by_second_p95_ms'] = _p95_by_second(generator.samples)
+        return result
+    finally:
+        service.stop()
+
+def scenario_model_swap(
+    registry: LocalRegistry,
+    generator: LoadGenerator,
+    versions: List[str],
+    workers: int,
+    duration: float
+) -> Dict:
+    """
+    Changement de version en pleine charge, comme un rolling update : la nouvelle
+    version est promue, une nouvelle instance démarre et ne reçoit le trafic
+    qu'une fois /ready, puis l'ancienne est arrêtée.
+    """
+    old_version, new_version = versions[-2], versions[-1]
+    registry.promote(old_version)
+    old_service = ServiceProcess(registry.tracking_uri, workers)
+    old_service.wait_for("/ready")
+    generator.base_url = old_service.base_url
+
+    swap = {}
+    services = {'current': old_service}
+    rss = []
+
+    def _swap_in_background():
+        registry.promote(new_version)
+        new_service = ServiceProcess(registry.tracking_uri, workers)
+        services['new'] = new_service
+        swap['new_ready_after_s'] = new_service.wait_for("/ready")
+        generator.base_url = new_service.base_url
+        swap['switched_at_s'] = time.perf_counter() - generator.started
+        services['current'] = new_service
+        time.sleep(SWAP_DRAIN_SECONDS)
+        old_service.stop()
+
+    def _on_tick(t: float):
+        rss.append((round(t, 1), services['current'].rss_mb()))
+        if t >= duration / 3 and 'requested_at_s' not in swap:
+            swap['requested_at_s'] = t
+            threading.Thread(target=_swap_in_background, daemon=True).start()
+
+    try:
+        result = generator.run(duration, on_tick=_on_tick)
+    finally:
+        for service in {id(s): s for s in [old_service, services.get('new')] if s is not None}.values():
+            service.stop()
+
+    result.update({
+        'from_version': old_version,
+        'to_version': new_version,
+        'swap': swap,
+        'rss_mb': rss,
+        'latency_by_second_p95_ms': _p95_by_second(generator.samples),
+    })
+    return result
+
+def _p95_by_second(samples: List[Tuple]) -> List[Tuple[int, float]]:
+    """p95 de latence par seconde de run (pour repérer les pics autour d'un swap)"""
+    if not samples:
+        return []
+    seconds = np.array([int(s[0]) for s in samples])
+    latencies = np.array([s[1] for s in samples]) * 1000
+    return [(int(sec), float(np.percentile(latencies[seconds == sec], 95))) for sec in np.unique(seconds)]
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def run_load_test(
+    scenarios: List[str],
+    registry_dir: str = None,
+    concurrency: int = 8,
+    duration: float = 30.0,
+    mix: str = DEFAULT_MIX,
+    workers: int = 1,
+    results_dir: str = str(DEFAULT_RESULTS_DIR)
+) -> Path:
+    """Exécuter les scénarios et écrire un JSON de résultats comparable d'un commit à l'autre"""
+    registry_dir = registry_dir or os.path.join(tempfile.gettempdir(), "luxury-load-test-mlruns")
+    registry = LocalRegistry(registry_dir)
+    versions = registry.ensure_versions(2 if 'model_swap' in scenarios else 1)
+    registry.promote(versions[-1])
+    print(f"📦 Registre local: {registry.tracking_uri} (versions {', '.join(versions)})")
+
+    generator = LoadGenerator(parse_mix(mix), concurrency)
+    commit = _git_commit()
+    results = {
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'config': {'concurrency': concurrency, 'duration_s': duration, 'mix': mix, 'workers': workers,
+                   'cpu_count': os.cpu_count()},
+        'scenarios': {},
+    }
+
+    for scenario in scenarios:
+        print(f"🚦 Scénario {scenario}...")
+        if scenario == 'cold_start':
+            result = scenario_cold_start(registry, workers)
+        elif scenario == 'steady':
+            result = scenario_steady(registry, generator, workers, duration)
+        else:
+            result = scenario_model_swap(registry, generator, versions, workers, duration)
+            registry.promote(versions[-1])
+        results['scenarios'][scenario] = result
+        _print_summary(scenario, result)
+
+    output_path = Path(results_dir) / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}-{commit}.json"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(results, indent=2))
+    print(f"✅ Résultats: {output_path}")
+    return output_path
+
+def _print_summary(scenario: str, result: Dict):
+    if scenario == 'cold_start':
+        print(f"   - /health {result['time_to_health_s']:.1f}s - /ready {result['time_to_ready_s']:.1f}s "
+              f"- 1re requête {result['first_request_ms']:.0f}ms - RSS {result['rss_mb']:.0f} Mo")
+        return
+    if not result.get('requests'):
+        print("   - aucune requête")
+        return
+    print(f"   - {result['requests']} requêtes - {result['throughput_rps']:.1f} req/s "
+          f"- {result['throughput_rows_s']:,.0f} lignes/s")
+    print(f"   - p50 {result['latency_p50_ms']:.0f}ms - p95 {result['latency_p95_ms']:.0f}ms "
+          f"- p99 {result['latency_p99_ms']:.0f}ms - erreurs {result['error_rate']:.2%}")
+    if result.get('rss_mb'):
+        print(f"   - RSS max {max(r for _, r in result['rss_mb']):.0f} Mo")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test de charge de bout en bout du service de prévision")
+    parser.add_argument("--scenarios", nargs="+", default=['cold_start', 'steady', 'model_swap'],
+                        choices=['cold_start', 'steady', 'model_swap'], help="Scénarios à exécuter")
+    parser.add_argument("--registry-dir", type=str, default=None, help="Répertoire du registre MLflow local")
+    parser.add_argument("--concurrency", type=int, default=8, help="Clients concurrents")
+    parser.add_argument("--duration", type=float, default=30.0, help="Durée de chaque scénario en charge (s)")
+    parser.add_argument("--mix", type=str, default=DEFAULT_MIX, help="Mix 'produitsxsemaines:poids,...'")
+    parser.add_argument("--workers", type=int, default=1, help="Workers uvicorn")
+    parser.add_argument("--results-dir", type=str, default=str(DEFAULT_RESULTS_DIR), help="Répertoire des JSON")
+
+    args = parser.parse_args()
+
+    try:
+        run_load_test(
+            scenarios=args.scenarios,
+            registry_dir=args.registry_dir,
+            concurrency=args.concurrency,
+            duration=args.duration,
+            mix=args.mix,
+            workers=args.workers,
+            results_dir=args.results_dir
+        )
+    except Exception as e:
+        print(f"❌ Erreur lors du test de charge: {e}")
+        sys.exit(1)
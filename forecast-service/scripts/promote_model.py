@@ -3,8 +3,24 @@ Script pour promouvoir un modèle de 'Staging' vers 'Production' dans MLflow
 """
 import os
 import sys
+import json
+import time
+from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import mlflow
 from mlflow.tracking import MlflowClient
+from sklearn.metrics import mean_absolute_error, r2_score
+
+# Ajouter le répertoire app au path (imports internes au service)
+sys.path.append(str(Path(__file__).parent.parent / "app"))
+
+from features.feature_engineering import prepare_future_dataframe
+from utils.model_registry import load_predictor, download_holdout
 
 # Configuration
 MLFLOW_TRACKING_URI = os.getenv("MLFLOW_TRACKING_URI", "http://localhost:5000")
@@ -14,14 +30,170 @@ MODEL_NAME = "luxury_demand_forecast"
 MIN_R2_SCORE = 0.80
 MAX_MAPE = 15.0
 
-def promote_to_production(run_id: str = None, model_name: str = MODEL_NAME):
+# Seuils de non-régression face au champion (rejeu holdout + requêtes)
+MAX_MAPE_REGRESSION = 0.05      # MAPE candidat <= MAPE champion × 1.05
+MAX_LATENCY_REGRESSION = 1.25   # p50/p99 candidat <= p50/p99 champion × 1.25
+MIN_THROUGHPUT_RATIO = 0.80     # débit candidat >= débit champion × 0.80
+REPLAY_ROUNDS = 3
+# Taille max d'une clause IN dans les recherches de runs
+RUN_QUERY_BATCH_SIZE = 100
+
+def fetch_runs(client: MlflowClient, run_ids: List[str]) -> Dict:
+    """Récupérer plusieurs runs en quelques requêtes search_runs au lieu d'un get_run par run"""
+    run_ids = list(dict.fromkeys(run_id for run_id in run_ids if run_id))
+    if not run_ids:
+        return {}
+
+    experiment_ids = [experiment.experiment_id for experiment in client.search_experiments()]
+    runs = {}
+    for i in range(0, len(run_ids), RUN_QUERY_BATCH_SIZE):
+        batch = run_ids[i:i + RUN_QUERY_BATCH_SIZE]
+        in_clause = ", ".join(f"'{run_id}'" for run_id in batch)
+        for run in client.search_runs(
+            experiment_ids,
+            filter_string=f"attributes.run_id IN ({in_clause})",
+            max_results=len(batch)
+        ):
+            runs[run.info.run_id] = run
+    return runs
+
+def default_request_set() -> List[Dict]:
+    """Requêtes représentatives du trafic de planification (si aucun jeu enregistré)"""
+    products = [f"BAG-{i:03d}" for i in range(1, 101)]
+    return (
+        [{'product_ids': products[:5], 'start_date': '2025-01-06', 'forecast_horizon_weeks': 13}] * 10
+        + [{'product_ids': products[:50], 'start_date': '2025-01-06', 'forecast_horizon_weeks': 26}] * 5
+        + [{'product_ids': products, 'start_date': '2025-01-06', 'forecast_horizon_weeks': 52}] * 2
+    )
+
+def load_request_set(path: Optional[str]) -> List[Dict]:
+    """Charger un jeu de requêtes /forecast enregistrées (liste JSON de corps de requête)"""
+    if not path:
+        return default_request_set()
+    with open(path) as f:
+        return json.load(f)
+
+def replay(predictor, holdout: pd.DataFrame, request_set: List[Dict], rounds: int = REPLAY_ROUNDS) -> Dict:
+    """
+    Précision sur le holdout + latence/débit sur le jeu de requêtes pour un modèle.
+
+    Le holdout passe par le même routage que /forecast (segment, tranche d'horizon via
+    forecast_week) ; les anciens holdouts sans forecast_week sont scorés par le modèle principal.
+    """
+    X = predictor.feature_engine.to_matrix(holdout, predictor._resolve_feature_columns(holdout))
+    y_true = holdout['quantity'].to_numpy()
+    y_pred = predictor._predict_matrix(X, holdout)
+    mask = y_true != 0
+    mape = float(np.mean(np.abs((y_true[mask] - y_pred[mask]) / y_true[mask])) * 100) if mask.any() else 0.0
+
+    frames = [
+        (prepare_future_dataframe(
+            product_ids=req['product_ids'],
+            start_date=req['start_date'],
+            horizon=req.get('forecast_horizon_weeks', 13),
+            channel=req.get('channel', 'All'),
+            countries=req.get('countries', ['All'])
+        ), req.get('forecast_horizon_weeks', 13))
+        for req in request_set
+    ]
+
+    # Premier appel hors mesure (chargement paresseux, pools de threads)
+    predictor.predict(*frames[0])
+
+    latencies = []
+    rows = 0
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for frame, horizon in frames:
+            t0 = time.perf_counter()
+            predictor.predict(frame, horizon)
+            latencies.append(time.perf_counter() - t0)
+            rows += len(frame)
+    elapsed = time.perf_counter() - started
+
+    return {
+        'mae': float(mean_absolute_error(y_true, y_pred)),
+        'mape': mape,
+        'r2': float(r2_score(y_true, y_pred)),
+        'latency_p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'latency_p99_ms': float(np.percentile(latencies, 99) * 1000),
+        'throughput_rows_s': rows / elapsed,
+    }
+
+def replay_gate(model_name: str, candidate, champion, request_set: List[Dict]) -> bool:
+    """
+    Rejouer holdout et requêtes contre le candidat et le champion, en parallèle.
+
+    Le holdout du candidat (données les plus récentes) sert aux deux modèles.
+    Refuse la promotion en cas de régression de précision, de latence ou de débit.
+    """
+    holdout_path = download_holdout(candidate.run_id)
+    if holdout_path is None:
+        print("❌ Pas de holdout enregistré pour le candidat, rejeu impossible")
+        return False
+    holdout = pd.read_parquet(holdout_path)
+
+    contenders = {'candidate': candidate}
+    if champion is not None:
+        contenders['champion'] = champion
+
+    threads = max(1, (os.cpu_count() or 2) // len(contenders))
+    predictors = {}
+    for role, version in contenders.items():
+        predictors[role] = load_predictor(model_name, version.version, version.run_id)
+        # Les deux rejeux se partagent les cœurs à parts égales (tous les boosters du prédicteur)
+        predictors[role].set_threads(threads)
+
+    print(f"🔁 Rejeu: {len(holdout)} lignes de holdout, {len(request_set)} requêtes × {REPLAY_ROUNDS}")
+    with ThreadPoolExecutor(max_workers=len(predictors)) as executor:
+        futures = {role: executor.submit(replay, p, holdout, request_set) for role, p in predictors.items()}
+        results = {role: future.result() for role, future in futures.items()}
+
+    for role, result in results.items():
+        print(f"   - {role} v{contenders[role].version}: MAPE {result['mape']:.1f}%, R² {result['r2']:.3f}, "
+              f"p50 {result['latency_p50_ms']:.1f}ms, p99 {result['latency_p99_ms']:.1f}ms, "
+              f"{result['throughput_rows_s']:,.0f} lignes/s")
+
+    if champion is None:
+        print("ℹ️  Aucun champion en Production, pas de comparaison")
+        return True
+
+    cand, champ = results['candidate'], results['champion']
+    failures = []
+    if cand['mape'] > champ['mape'] * (1 + MAX_MAPE_REGRESSION):
+        failures.append(f"MAPE {cand['mape']:.1f}% > champion {champ['mape']:.1f}% (+{MAX_MAPE_REGRESSION:.0%})")
+    for key in ['latency_p50_ms', 'latency_p99_ms']:
+        if cand[key] > champ[key] * MAX_LATENCY_REGRESSION:
+            failures.append(f"{key} {cand[key]:.1f} > champion {champ[key]:.1f} × {MAX_LATENCY_REGRESSION}")
+    if cand['throughput_rows_s'] < champ['throughput_rows_s'] * MIN_THROUGHPUT_RATIO:
+        failures.append(f"débit {cand['throughput_rows_s']:,.0f} < champion "
+                        f"{champ['throughput_rows_s']:,.0f} × {MIN_THROUGHPUT_RATIO}")
+
+    if failures:
+        print("❌ Régression face au champion:")
+        for failure in failures:
+            print(f"   - {failure}")
+        return False
+
+    print("✅ Pas de régression face au champion")
+    return True
+
+def promote_to_production(
+    run_id: str = None,
+    model_name: str = MODEL_NAME,
+    request_set_path: str = None,
+    skip_replay: bool = False
+):
     """
     Promouvoir un modèle de 'Staging' vers 'Production'
     
     Args:
         run_id: ID de la run à promouvoir (optionnel, utilise le dernier modèle en Staging si non fourni)
         model_name: Nom du modèle dans MLflow Registry
+        request_set_path: Requêtes /forecast enregistrées à rejouer (JSON, optionnel)
+        skip_replay: Ne pas rejouer holdout et requêtes contre le champion
     """
+    mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
     client = MlflowClient(tracking_uri=MLFLOW_TRACKING_URI)
     
     try:
@@ -72,12 +244,18 @@ def promote_to_production(run_id: str = None, model_name: str = MODEL_NAME):
         print(f"✅ Le modèle respecte les seuils de qualité")
         print(f"   Seuils: MAPE < {MAX_MAPE}%, R² > {MIN_R2_SCORE}")
         
-        # 3. Archiver l'ancien modèle en production
         current_prod_versions = client.get_latest_versions(
             model_name, 
             stages=["Production"]
         )
         
+        # 3. Rejeu holdout + requêtes : précision, latence et débit face au champion
+        if not skip_replay:
+            champion = next((v for v in current_prod_versions if v.version != version), None)
+            if not replay_gate(model_name, version_info, champion, load_request_set(request_set_path)):
+                return False
+        
+        # 4. Archiver l'ancien modèle en production
         for prod_version in current_prod_versions:
             client.transition_model_version_stage(
                 name=model_name,
@@ -87,7 +265,7 @@ def promote_to_production(run_id: str = None, model_name: str = MODEL_NAME):
             )
             print(f"📦 Modèle v{prod_version.version} archivé")
         
-        # 4. Promouvoir le nouveau modèle
+        # 5. Promouvoir le nouveau modèle
         client.transition_model_version_stage(
             name=model_name,
             version=version,
@@ -96,7 +274,7 @@ def promote_to_production(run_id: str = None, model_name: str = MODEL_NAME):
         
         print(f"✅ Modèle v{version} promu en PRODUCTION")
         
-        # 5. Ajouter une description
+        # 6. Ajouter une description
         description = (
             f"Promoted on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}. "
             f"MAPE: {mape:.1f}%, R²: {r2:.3f}, MAE: {mae:.2f}, RMSE: {rmse:.2f}"
@@ -137,18 +315,21 @@ def list_models(model_name: str = MODEL_NAME):
         print(f"\n📦 Modèles pour '{model_name}':")
         print("-" * 80)
         
+        # Métriques de toutes les versions en requêtes groupées
+        runs = fetch_runs(client, [version.run_id for version in versions])
+        
         for version in sorted(versions, key=lambda v: int(v.version), reverse=True):
             stage = version.current_stage
             run_id = version.run_id
             
             # Récupérer les métriques
-            try:
-                run = client.get_run(run_id)
+            run = runs.get(run_id)
+            if run is not None:
                 mape = run.data.metrics.get('mape', 'N/A')
                 r2 = run.data.metrics.get('r2_score', 'N/A')
                 metrics_str = f"MAPE: {mape:.1f}%" if isinstance(mape, float) else "N/A"
                 metrics_str += f", R²: {r2:.3f}" if isinstance(r2, float) else ""
-            except:
+            else:
                 metrics_str = "N/A"
             
             print(f"Version {version.version} ({stage})")
@@ -167,11 +348,13 @@ if __name__ == "__main__":
     parser.add_argument("--run-id", type=str, help="Run ID du modèle à promouvoir")
     parser.add_argument("--list", action="store_true", help="Lister tous les modèles")
     parser.add_argument("--model-name", type=str, default=MODEL_NAME, help="Nom du modèle")
+    parser.add_argument("--request-set", type=str, help="Requêtes /forecast enregistrées à rejouer (JSON)")
+    parser.add_argument("--skip-replay", action="store_true", help="Ne pas rejouer contre le champion")
     
     args = parser.parse_args()
     
     if args.list:
         list_models(args.model_name)
     else:
-        success = promote_to_production(args.run_id, args.model_name)
+        success = promote_to_production(args.run_id, args.model_name, args.request_set, args.skip_replay)
         sys.exit(0 if success else 1)
@@ -1,11 +1,20 @@
 """
 Hyperparameter tuning pour le modèle XGBoost
 """
+import sys
+from pathlib import Path
 import xgboost as xgb
 from sklearn.model_selection import TimeSeriesSplit, GridSearchCV
 import pandas as pd
 import numpy as np
 
+# Ajouter le répertoire parent au path (et app/ pour les imports internes du service)
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "app"))
+
+from app.features.feature_engineering import LuxuryForecastFeatureEngine
+from app.features.feature_cache import FeatureMatrixCache
+
 def tune_hyperparameters(X, y):
     """Recherche de grille pour optimiser les hyperparamètres"""
     
@@ -45,7 +54,14 @@ def tune_hyperparameters(X, y):
     
     return grid_search.best_estimator_, grid_search.best_params_
 
+def load_tuning_data(df: pd.DataFrame):
+    """Matrice de features et cible, depuis le cache si les données n'ont pas changé"""
+    features = FeatureMatrixCache().get_or_build(df, LuxuryForecastFeatureEngine(), target='quantity')
+    return pd.DataFrame(features.X, columns=features.feature_cols), features.y
+
 if __name__ == "__main__":
-    # Exemple d'utilisation
-    print("Hyperparameter tuning example")
-    print("Note: This requires training data. Use train_pipeline.py first.")
+    from train_pipeline import load_training_data
+    
+    print("Hyperparameter tuning")
+    X, y = load_tuning_data(load_training_data("data/training_data.csv"))
+    tune_hyperparameters(X, y)
@@ -0,0 +1,345 @@
+"""
+Entraînement incrémental à partir du booster en Production (warm start)
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+import mlflow
+import mlflow.xgboost
+from mlflow.tracking import MlflowClient
+from sklearn.metrics import mean_absolute_error
+import xgboost as xgb
+
+from train_pipeline_mlflow import MLFLOW_TRACKING_URI, PARAMS, load_training_data
+from app.models.xgboost_predictor import LuxuryDemandPredictor, SERIES_KEYS
+from app.models.horizon_models import (
+    HORIZON_BUCKETS, HORIZON_ARTIFACT_PATH, HORIZON_FEATURE, DirectDesign, bucket_name,
+    save_horizon_models, train_horizon_models
+)
+from app.models.segment_router import SEGMENT_ARTIFACT_PATH, SEGMENT_MANIFEST, directory_loader, segment_keys
+from app.features.feature_engineering import LuxuryForecastFeatureEngine
+from app.features.feature_cache import FeatureMatrixCache
+from app.utils.model_registry import (
+    HOLDOUT_ARTIFACT_PATH, HOLDOUT_FILE, SEGMENT_CACHE_MB,
+    load_predictor, attach_segment_router, download_segment_models
+)
+
+MODEL_NAME = os.getenv("MODEL_NAME", "luxury_demand_forecast")
+MODEL_STAGE = os.getenv("MODEL_STAGE", "Production")
+MODES = ['continue', 'refresh']
+# Artifacts de la run parente réutilisés tels quels (les boosters servis sont mis à jour)
+CARRIED_ARTIFACTS = ['drift']
+# Au-delà, un rebuild complet est recommandé (les arbres ajoutés s'accumulent)
+MAX_INCREMENTAL_UPDATES = int(os.getenv("MAX_INCREMENTAL_UPDATES", "8"))
+# Écart de MAE toléré face à un rebuild complet avant de recommander un rebuild
+MAX_MAE_GAP_VS_FULL = 0.05
+
+def _mape(y_true: np.ndarray, y_pred: np.ndarray) -> float:
+    mask = y_true != 0
+    return float(np.mean(np.abs((y_true[mask] - y_pred[mask]) / y_true[mask])) * 100) if mask.any() else 0.0
+
+def _as_regressor(booster: xgb.Booster) -> xgb.XGBRegressor:
+    """Booster natif -> XGBRegressor, le format servi par l'API"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = str(Path(tmp_dir) / "model.json")
+        booster.save_model(path)
+        regressor = xgb.XGBRegressor()
+        regressor.load_model(path)
+    return regressor
+
+def _served_booster(model: xgb.XGBRegressor) -> xgb.Booster:
+    """Arbres réellement servis : XGBRegressor.predict s'arrête à best_iteration (early stopping)"""
+    booster = model.get_booster()
+    best_iteration = booster.attr('best_iteration')
+    return booster[: int(best_iteration) + 1] if best_iteration is not None else booster
+
+def _update_booster(booster: xgb.Booster, X: np.ndarray, y: np.ndarray, params: Dict, mode: str,
+                    num_boost_round: int) -> xgb.Booster:
+    """continue : nouveaux arbres (xgb_model) ; refresh : feuilles recalculées (process_type='update')"""
+    dtrain = xgb.DMatrix(X, label=y, feature_names=booster.feature_names)
+    if mode == 'continue':
+        return xgb.train(params, dtrain, num_boost_round=num_boost_round, xgb_model=booster)
+    refresh_params = {**params, 'process_type': 'update', 'updater': 'refresh', 'refresh_leaf': True}
+    return xgb.train(refresh_params, dtrain, num_boost_round=booster.num_boosted_rounds(), xgb_model=booster)
+
+def _update_direct(booster: xgb.Booster, bucket: Tuple[int, int], design: DirectDesign, rows, window,
+                   params: Dict, mode: str, num_boost_round: int) -> xgb.Booster:
+    """Booster direct d'une tranche mis à jour sur les semaines cibles de la fenêtre (inchangé sans ligne)"""
+    X_w, y_w = design.matrix(range(bucket[0], bucket[1] + 1), rows=rows, target_start=window[0], target_end=window[1])
+    if not len(y_w):
+        return booster
+    # Anciens boosters par tranche entraînés sans la colonne horizon
+    if HORIZON_FEATURE not in (booster.feature_names or []):
+        X_w = X_w[:, :-1]
+    return _update_booster(booster, X_w, y_w, params, mode, num_boost_round)
+
+def _update_segment_models(parent_dir: str, output_dir: Path, design: DirectDesign, window_rows: np.ndarray,
+                           window, params: Dict, mode: str, num_boost_round: int) -> int:
+    """
+    Mettre à jour les boosters par segment de la run parente et les écrire (mêmes fichiers, même manifeste).
+
+    Boosters directs : par tranche, comme les tranches globales ; anciens boosters même
+    semaine : sur les lignes de la fenêtre du segment, comme le modèle principal.
+    """
+    manifest = json.loads((Path(parent_dir) / SEGMENT_MANIFEST).read_text())
+    files = manifest.get('files') or {segment: f"{segment}.ubj" for segment in manifest['segments']}
+    load = directory_loader(parent_dir, files)
+    segments = segment_keys(design.frame, manifest['segment_by'])
+    y = design.frame[design.target].to_numpy(dtype=np.float32)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    for segment in manifest['segments']:
+        models, _ = load(segment)
+        segment_rows = np.flatnonzero(segments == segment)
+        if isinstance(models, dict):
+            for bucket, booster in models.items():
+                updated = _update_direct(booster, bucket, design, segment_rows, window, params, mode, num_boost_round)
+                updated.save_model(str(output_dir / files[segment][bucket_name(bucket)]))
+        else:
+            rows = np.intersect1d(segment_rows, window_rows)
+            if len(rows):
+                models = _update_booster(models, design.X[rows], y[rows], params, mode, num_boost_round)
+            models.save_model(str(output_dir / files[segment]))
+    shutil.copy(Path(parent_dir) / SEGMENT_MANIFEST, output_dir / SEGMENT_MANIFEST)
+    return len(manifest['segments'])
+
+def train_incremental(
+    mode: str = 'continue',
+    num_boost_round: int = 50,
+    refresh_weeks: int = 52,
+    holdout_weeks: int = 4,
+    compare_full: bool = False,
+    allow_worse: bool = False
+) -> str:
+    """
+    Mettre à jour les boosters servis par la version en Production sur les nouvelles semaines
+    et enregistrer le résultat : modèle principal, boosters par tranche d'horizon et par segment.
+
+    - continue : ajoute `num_boost_round` arbres (xgb_model) entraînés sur les semaines
+      postérieures à la fin d'entraînement de la version en Production
+    - refresh : recalcule les valeurs des feuilles des arbres existants (process_type='update')
+      sur les `refresh_weeks` dernières semaines, sans changer la structure
+
+    Les boosters directs sont mis à jour sur les lignes (origine, horizon) dont la semaine
+    cible est dans la fenêtre. Les `holdout_weeks` dernières semaines ne servent qu'à la
+    validation, par le même routage que /forecast ; la version en Production y est évaluée
+    comme référence (et un rebuild complet avec compare_full). Une mise à jour moins précise
+    que sa parente est loggée mais pas enregistrée dans le registry, sauf avec allow_worse.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode '{mode}', expected one of {MODES}")
+
+    client = MlflowClient(tracking_uri=MLFLOW_TRACKING_URI)
+    production = client.get_latest_versions(MODEL_NAME, stages=[MODEL_STAGE])
+    if not production:
+        raise ValueError(f"No {MODEL_STAGE} version of {MODEL_NAME}: run a full training first")
+    parent = production[0]
+    parent_run = client.get_run(parent.run_id)
+    print(f"📦 Version de départ: v{parent.version} (run {parent.run_id[:8]})")
+
+    # Prédicteur servi (modèle, tranches, segments) ; point de départ : les arbres servis,
+    # pas ceux ajoutés après le meilleur tour
+    parent_predictor = load_predictor(MODEL_NAME, parent.version, parent.run_id)
+    booster = _served_booster(parent_predictor.model)
+
+    # Features (cache) réordonnées comme celles du booster
+    print("🔧 Feature engineering...")
+    df = load_training_data()
+    feature_engine = LuxuryForecastFeatureEngine()
+    features = FeatureMatrixCache().get_or_build(df, feature_engine, target='quantity')
+    feature_names = booster.feature_names or features.feature_cols
+    missing = set(feature_names) - set(features.feature_cols)
+    if missing:
+        raise ValueError(f"Features changed since v{parent.version} ({sorted(missing)}): full retrain required")
+    X = features.X[:, [features.feature_cols.index(col) for col in feature_names]]
+    y = np.asarray(features.y)
+    dates = features.keys['date'].to_numpy()
+    design = DirectDesign(X, features.to_frame(), 'quantity', SERIES_KEYS, feature_names, feature_engine)
+
+    unique_dates = np.unique(dates)
+    holdout_start = unique_dates[-holdout_weeks]
+    parent_end = parent_run.data.params.get('train_end_date')
+
+    if mode == 'continue':
+        if parent_end is None:
+            raise ValueError(f"v{parent.version} has no train_end_date: full retrain required")
+        window_start = np.datetime64(pd.Timestamp(parent_end) + pd.Timedelta(days=1))
+    else:
+        window_start = unique_dates[max(0, len(unique_dates) - holdout_weeks - refresh_weeks)]
+    window = (window_start, holdout_start)
+    window_rows = np.flatnonzero((dates >= window_start) & (dates < holdout_start))
+    if len(window_rows) == 0:
+        print("✅ Aucune nouvelle semaine avant le holdout : rien à mettre à jour")
+        return None
+    window_weeks = len(np.unique(dates[window_rows]))
+    print(f"🗓️  Fenêtre: {window_weeks} semaines ({len(window_rows)} lignes), holdout: {holdout_weeks} semaines")
+
+    booster_params = {k: v for k, v in PARAMS.items() if k != 'n_estimators'}
+    work_dir = Path(tempfile.mkdtemp(prefix="incremental_"))
+    try:
+        started = time.perf_counter()
+        updated = _update_booster(booster, X[window_rows], y[window_rows], booster_params, mode, num_boost_round)
+        updated_predictor = LuxuryDemandPredictor()
+        updated_predictor.model = _as_regressor(updated)
+        updated_predictor.horizon_models = {
+            bucket: _update_direct(horizon_booster, bucket, design, None, window, booster_params, mode, num_boost_round)
+            for bucket, horizon_booster in parent_predictor.horizon_models.items()
+        }
+        parent_segment_dir = download_segment_models(parent.run_id)
+        if parent_segment_dir:
+            n_segments = _update_segment_models(
+                parent_segment_dir, work_dir / SEGMENT_ARTIFACT_PATH, design, window_rows, window,
+                booster_params, mode, num_boost_round
+            )
+            print(f"🧩 {n_segments} segments mis à jour")
+            attach_segment_router(updated_predictor, str(work_dir / SEGMENT_ARTIFACT_PATH), SEGMENT_CACHE_MB * 1024 * 1024)
+        incremental_seconds = time.perf_counter() - started
+
+        # Validation sur le holdout : lignes servies (horizons 1 à 52) dont la semaine cible est dans le holdout
+        holdout = design.evaluation_frame(range(1, HORIZON_BUCKETS[-1][1] + 1), target_start=holdout_start)
+        X_holdout = holdout[feature_names].to_numpy(dtype=np.float32)
+        y_holdout = holdout['quantity'].to_numpy()
+        pred_incremental = updated_predictor._predict_matrix(X_holdout, holdout)
+        pred_parent = parent_predictor._predict_matrix(X_holdout, holdout)
+        metrics = {
+            'mae': mean_absolute_error(y_holdout, pred_incremental),
+            'mape': _mape(y_holdout, pred_incremental),
+            'parent_mae': mean_absolute_error(y_holdout, pred_parent),
+            'incremental_seconds': incremental_seconds,
+        }
+
+        # Référence : rebuild complet (modèle principal + tranches) sur tout l'historique avant le holdout
+        if compare_full:
+            print("🏗️  Rebuild complet de référence...")
+            full_rows = np.flatnonzero(dates < holdout_start)
+            started = time.perf_counter()
+            full_predictor = LuxuryDemandPredictor()
+            full_predictor.model = xgb.XGBRegressor(**PARAMS, random_state=42)
+            full_predictor.model.fit(X[full_rows], y[full_rows], verbose=False)
+            if parent_predictor.horizon_models:
+                full_predictor.horizon_models = train_horizon_models(
+                    design, {**booster_params, 'seed': 42}, num_boost_round=PARAMS['n_estimators'],
+                    target_end=holdout_start
+                )
+            metrics['full_seconds'] = time.perf_counter() - started
+            metrics['full_mae'] = mean_absolute_error(y_holdout, full_predictor._predict_matrix(X_holdout, holdout))
+            metrics['speedup_vs_full'] = metrics['full_seconds'] / max(incremental_seconds, 1e-9)
+
+        updates_since_full = int(parent_run.data.tags.get('incremental_updates_since_full', 0)) + 1
+        rebuild_reasons = []
+        if updates_since_full >= MAX_INCREMENTAL_UPDATES:
+            rebuild_reasons.append(f"{updates_since_full} incremental updates since last full retrain")
+        if 'full_mae' in metrics and metrics['mae'] > metrics['full_mae'] * (1 + MAX_MAE_GAP_VS_FULL):
+            rebuild_reasons.append("MAE worse than a full retrain")
+        worse_than_parent = metrics['mae'] > metrics['parent_mae']
+        metrics['mae_delta_vs_parent'] = metrics['mae'] - metrics['parent_mae']
+        register = allow_worse or not worse_than_parent
+
+        print(f"✅ Résultats ({mode}, {incremental_seconds:.1f}s):")
+        print(f"   - MAE holdout: {metrics['mae']:.2f} (v{parent.version}: {metrics['parent_mae']:.2f})")
+        if compare_full:
+            print(f"   - Rebuild complet: MAE {metrics['full_mae']:.2f} en {metrics['full_seconds']:.1f}s "
+                  f"(incrémental {metrics['speedup_vs_full']:.0f}× plus rapide)")
+        for reason in rebuild_reasons:
+            print(f"⚠️  Rebuild complet recommandé: {reason}")
+        if worse_than_parent:
+            print(f"⚠️  MAE moins bonne que v{parent.version} "
+                  f"({'enregistrée quand même (--allow-worse)' if register else 'non enregistrée dans le registry'})")
+
+        run_name = f"xgboost_incremental_{mode}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        with mlflow.start_run(run_name=run_name):
+            mlflow.log_params({
+                **booster_params,
+                'training_mode': mode,
+                'parent_version': parent.version,
+                'parent_run_id': parent.run_id,
+                'window_start': str(pd.Timestamp(window_start).date()),
+                'window_weeks': window_weeks,
+                'window_rows': len(window_rows),
+                'holdout_weeks': holdout_weeks,
+                'num_boost_round': num_boost_round if mode == 'continue' else 0,
+                'total_trees': updated.num_boosted_rounds(),
+                'features_count': len(feature_names),
+                'train_end_date': str(pd.Timestamp(dates[window_rows].max()).date()),
+            })
+            mlflow.log_metrics(metrics)
+
+            holdout_path = work_dir / HOLDOUT_FILE
+            holdout.to_parquet(holdout_path, index=False)
+            mlflow.log_artifact(str(holdout_path), artifact_path=HOLDOUT_ARTIFACT_PATH)
+
+            # Boosters servis mis à jour ; référence de drift reprise de la run parente
+            if updated_predictor.horizon_models:
+                save_horizon_models(updated_predictor.horizon_models, str(work_dir / HORIZON_ARTIFACT_PATH))
+                mlflow.log_artifacts(str(work_dir / HORIZON_ARTIFACT_PATH), artifact_path=HORIZON_ARTIFACT_PATH)
+            if parent_segment_dir:
+                mlflow.log_artifacts(str(work_dir / SEGMENT_ARTIFACT_PATH), artifact_path=SEGMENT_ARTIFACT_PATH)
+            for artifact_path in CARRIED_ARTIFACTS:
+                try:
+                    local_dir = mlflow.artifacts.download_artifacts(run_id=parent.run_id, artifact_path=artifact_path)
+                    mlflow.log_artifacts(local_dir, artifact_path=artifact_path)
+                except Exception:
+                    pass
+
+            mlflow.xgboost.log_model(
+                updated_predictor.model,
+                artifact_path="model",
+                registered_model_name=MODEL_NAME if register else None,
+                model_format="json"
+            )
+
+            mlflow.set_tag("model_type", "xgboost")
+            mlflow.set_tag("training_mode", mode)
+            mlflow.set_tag("incremental_updates_since_full", str(updates_since_full))
+            mlflow.set_tag("full_rebuild_recommended", str(bool(rebuild_reasons)).lower())
+            mlflow.set_tag("worse_than_parent", str(worse_than_parent).lower())
+            mlflow.set_tag("registered", str(register).lower())
+            mlflow.set_tag("training_date", datetime.now().strftime('%Y-%m-%d'))
+
+            run_id = mlflow.active_run().info.run_id
+            if register:
+                print(f"🎯 Run ID: {run_id} (promotion via scripts/promote_model.py)")
+            else:
+                print(f"🎯 Run ID: {run_id} (non enregistrée)")
+            return run_id
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entraînement incrémental depuis la version en Production")
+    parser.add_argument("--mode", type=str, default="continue", choices=MODES,
+                        help="continue: nouveaux arbres ; refresh: mise à jour des feuilles")
+    parser.add_argument("--num-boost-round", type=int, default=50, help="Arbres ajoutés (mode continue)")
+    parser.add_argument("--refresh-weeks", type=int, default=52, help="Semaines utilisées (mode refresh)")
+    parser.add_argument("--holdout-weeks", type=int, default=4, help="Semaines réservées à la validation")
+    parser.add_argument("--compare-full", action="store_true",
+                        help="Entraîner aussi un rebuild complet pour comparer durée et précision")
+    parser.add_argument("--allow-worse", action="store_true",
+                        help="Enregistrer la version même si sa MAE holdout est moins bonne que la parente")
+
+    args = parser.parse_args()
+
+    try:
+        train_incremental(
+            mode=args.mode,
+            num_boost_round=args.num_boost_round,
+            refresh_weeks=args.refresh_weeks,
+            holdout_weeks=args.holdout_weeks,
+            compare_full=args.compare_full,
+            allow_worse=args.allow_worse
+        )
+    except Exception as e:
+        print(f"\n❌ Erreur lors de l'entraînement incrémental: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
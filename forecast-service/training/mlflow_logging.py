@@ -0,0 +1,257 @@
+"""
+Logging MLflow asynchrone : envois en arrière-plan, fichiers dans un répertoire temporaire par run
+"""
+import os
+import time
+import queue
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from mlflow.entities import Metric, Param, RunTag
+from mlflow.models import Model
+from mlflow.models.model import MLMODEL_FILE_NAME
+from mlflow.tracking import MlflowClient
+
+# false = envois synchrones (débogage, comparaison des durées)
+MLFLOW_ASYNC_LOGGING = os.getenv("MLFLOW_ASYNC_LOGGING", "true").lower() == "true"
+MLFLOW_LOG_RETRIES = int(os.getenv("MLFLOW_LOG_RETRIES", "3"))
+# Limites d'un appel log_batch du tracking server
+MAX_PARAMS_PER_BATCH = 100
+MAX_METRICS_PER_BATCH = 1000
+MAX_TAGS_PER_BATCH = 100
+
+_STOP = object()
+
+class MlflowLoggingError(RuntimeError):
+    """Envois MLflow en échec après toutes les tentatives"""
+
+class AsyncRunLogger:
+    """
+    Logging d'une run MLflow sans appel réseau sur le chemin critique de l'entraînement.
+
+    Paramètres, métriques et tags sont regroupés en appels log_batch ; artifacts et modèle
+    sont écrits dans un répertoire temporaire propre à la run puis envoyés par un thread
+    unique, dans l'ordre de soumission (l'enregistrement suit l'envoi du modèle). Chaque
+    envoi est retenté avec backoff exponentiel ; close() attend la fin de la file et lève
+    MlflowLoggingError si des envois ont échoué.
+    """
+
+    def __init__(
+        self,
+        run_id: str,
+        tracking_uri: str = None,
+        asynchronous: bool = MLFLOW_ASYNC_LOGGING,
+        max_retries: int = MLFLOW_LOG_RETRIES,
+        backoff_seconds: float = 1.0
+    ):
+        self.run_id = run_id
+        self.client = MlflowClient(tracking_uri=tracking_uri)
+        self.asynchronous = asynchronous
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.local_dir = Path(tempfile.mkdtemp(prefix=f"mlflow-run-{run_id[:8]}-"))
+        self.failures: List[str] = []
+        self.operations = 0
+        self.upload_seconds = 0.0
+        self.flush_wait_seconds = 0.0
+
+        self._lock = threading.Lock()
+        self._pending = {'params': [], 'metrics': [], 'tags': []}
+        self._batch_queued = False
+        self._queue = queue.Queue()
+        self._thread = None
+        if asynchronous:
+            self._thread = threading.Thread(target=self._worker, name=f"mlflow-logger-{run_id[:8]}", daemon=True)
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(raise_on_failure=exc_type is None)
+        return False
+
+    # Paramètres, métriques, tags (regroupés)
+
+    def log_param(self, key: str, value):
+        self._add('params', Param(key, str(value)))
+
+    def log_params(self, params: Dict):
+        for key, value in params.items():
+            self.log_param(key, value)
+
+    def log_metric(self, key: str, value: float, step: int = 0):
+        self._add('metrics', Metric(key, float(value), int(time.time() * 1000), step))
+
+    def log_metrics(self, metrics: Dict, step: int = 0):
+        for key, value in metrics.items():
+            self.log_metric(key, value, step)
+
+    def set_tag(self, key: str, value):
+        self._add('tags', RunTag(key, str(value)))
+
+    # Artifacts (fichiers à écrire sous local_path, conservés jusqu'à close)
+
+    def local_path(self, artifact_path: str) -> Path:
+        """Répertoire local propre à la run pour un chemin d'artifact (créé si besoin)"""
+        path = self.local_dir / artifact_path
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def log_artifact(self, local_file: str, artifact_path: str = None):
+        self._submit(f"artifact {Path(local_file).name}", self.client.log_artifact, self.run_id, local_file, artifact_path)
+
+    def log_artifacts(self, local_dir: str, artifact_path: str = None):
+        self._submit(f"artifacts {artifact_path}", self.client.log_artifacts, self.run_id, local_dir, artifact_path)
+
+    def log_text(self, text: str, artifact_file: str):
+        artifact_path, _, filename = artifact_file.rpartition('/')
+        local_file = self.local_path(artifact_path or '.') / filename
+        local_file.write_text(text)
+        self.log_artifact(str(local_file), artifact_path or None)
+
+    def log_model(self, flavor, model, artifact_path: str = "model", registered_model_name: str = None, **kwargs):
+        """Sauvegarde (flavor.save_model), envoi puis enregistrement du modèle, en arrière-plan
+
+        Comme mlflow.<flavor>.log_model : MLmodel complet (signature, input_example passés en
+        kwargs) et tag mlflow.log-model.history de la run. Le modèle ne doit plus être modifié
+        après l'appel.
+        """
+        self._submit(f"model {artifact_path}", self._upload_model, flavor, model, artifact_path, kwargs)
+        self._submit(f"model history {artifact_path}", self._record_model, artifact_path)
+        if registered_model_name:
+            self._submit(f"registration {registered_model_name}", self._register, artifact_path, registered_model_name)
+
+    def _upload_model(self, flavor, model, artifact_path: str, save_kwargs: Dict):
+        local_model = self.local_dir / "_models" / artifact_path
+        # Sauvegarde conservée entre deux tentatives d'envoi
+        if not (local_model / MLMODEL_FILE_NAME).exists():
+            shutil.rmtree(local_model, ignore_errors=True)
+            flavor.save_model(model, str(local_model), **save_kwargs)
+            mlmodel = Model.load(str(local_model))
+            mlmodel.run_id, mlmodel.artifact_path = self.run_id, artifact_path
+            mlmodel.save(str(local_model / MLMODEL_FILE_NAME))
+        self.client.log_artifacts(self.run_id, str(local_model), artifact_path)
+
+    def _record_model(self, artifact_path: str):
+        """Entrée du tag mlflow.log-model.history (UI MLflow, mlflow.search_logged_models)"""
+        mlmodel = Model.load(str(self.local_dir / "_models" / artifact_path / MLMODEL_FILE_NAME))
+        history = self.client.get_run(self.run_id).data.tags.get("mlflow.log-model.history", "")
+        # Nouvel essai après un envoi réussi dont la réponse a été perdue : pas de doublon
+        if mlmodel.model_uuid and mlmodel.model_uuid in history:
+            return
+        self.client._record_logged_model(self.run_id, mlmodel)
+
+    def _register(self, artifact_path: str, name: str):
+        """Nouvelle version du modèle, sauf si une tentative précédente l'a déjà créée"""
+        source = f"{self.client.get_run(self.run_id).info.artifact_uri}/{artifact_path}"
+        for version in self.client.search_model_versions(f"run_id='{self.run_id}'"):
+            if version.name == name and version.source == source:
+                return
+        try:
+            self.client.get_registered_model(name)
+        except Exception:
+            self.client.create_registered_model(name)
+        self.client.create_model_version(name, source, self.run_id)
+
+    # Fin de run
+
+    def flush(self):
+        """Attendre que tous les envois soumis soient terminés"""
+        started = time.perf_counter()
+        if self.asynchronous:
+            self._queue_batch()
+            self._queue.join()
+        else:
+            self._send_batch()
+        self.flush_wait_seconds += time.perf_counter() - started
+
+    def close(self, raise_on_failure: bool = True):
+        try:
+            self.flush()
+            if self._thread is not None:
+                self._queue.put(_STOP)
+                self._thread.join()
+                self._thread = None
+            print(f"📤 MLflow: {self.operations} envois en {self.upload_seconds:.1f}s "
+                  f"({self.flush_wait_seconds:.1f}s d'attente en fin de run)")
+        finally:
+            shutil.rmtree(self.local_dir, ignore_errors=True)
+        if self.failures:
+            for failure in self.failures:
+                print(f"❌ Envoi MLflow en échec: {failure}")
+            if raise_on_failure:
+                raise MlflowLoggingError(f"{len(self.failures)} MLflow logging operation(s) failed")
+
+    # File d'envoi
+
+    def _add(self, kind: str, entity):
+        with self._lock:
+            self._pending[kind].append(entity)
+        if self.asynchronous:
+            self._queue_batch()
+        else:
+            self._send_batch()
+
+    def _queue_batch(self):
+        """Un seul envoi groupé en file à la fois : les entrées suivantes le rejoignent"""
+        with self._lock:
+            if self._batch_queued:
+                return
+            self._batch_queued = True
+        self._queue.put((None, self._send_batch, ()))
+
+    def _send_batch(self):
+        with self._lock:
+            pending, self._pending = self._pending, {'params': [], 'metrics': [], 'tags': []}
+            self._batch_queued = False
+        for kind, size in [('params', MAX_PARAMS_PER_BATCH), ('metrics', MAX_METRICS_PER_BATCH),
+                           ('tags', MAX_TAGS_PER_BATCH)]:
+            entities = pending[kind]
+            for start in range(0, len(entities), size):
+                chunk = entities[start:start + size]
+                self._with_retries(f"{len(chunk)} {kind}", self.client.log_batch, self.run_id, **{kind: chunk})
+
+    def _submit(self, description: str, fn: Callable, *args):
+        if self.asynchronous:
+            self._queue.put((description, fn, args))
+        else:
+            self._with_retries(description, fn, *args)
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                description, fn, args = item
+                if description is None:
+                    fn(*args)
+                else:
+                    self._with_retries(description, fn, *args)
+            except Exception as e:
+                # Le thread doit survivre : sinon flush() attendrait indéfiniment
+                self.failures.append(f"{description or 'batch'}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _with_retries(self, description: str, fn: Callable, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    fn(*args, **kwargs)
+                    self.operations += 1
+                    return
+                except Exception as e:
+                    if attempt == self.max_retries:
+                        self.failures.append(f"{description}: {e}")
+                        return
+                    delay = self.backoff_seconds * 2 ** attempt
+                    print(f"⚠️  Envoi MLflow '{description}' en échec ({e}), nouvel essai dans {delay:.0f}s")
+                    time.sleep(delay)
+        finally:
+            self.upload_seconds += time.perf_counter() - started
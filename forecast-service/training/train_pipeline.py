@@ -3,19 +3,30 @@ Pipeline d'entraînement du modèle de prévision de demande
 """
 import pandas as pd
 import numpy as np
+import os
 import sys
 from pathlib import Path
 
-# Ajouter le répertoire parent au path
+# Ajouter le répertoire parent au path (et app/ pour les imports internes du service)
 sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "app"))
 
 from app.models.xgboost_predictor import LuxuryDemandPredictor
 from app.features.feature_engineering import LuxuryForecastFeatureEngine
+from app.features.feature_cache import FeatureMatrixCache
+from data.sales_store import SalesStore, SALES_COLUMNS
+
+# Début de l'historique lu dans le store (vide = tout l'historique)
+TRAINING_START_DATE = os.getenv("TRAINING_START_DATE", "")
 
 def load_training_data(data_path: str) -> pd.DataFrame:
     """Charger les données d'entraînement"""
-    # Dans un vrai projet, ceci chargerait depuis une base de données
-    # Pour l'exemple, on génère des données synthétiques
+    # Historique réel depuis le store Parquet partitionné s'il a été alimenté
+    store = SalesStore()
+    if store.exists():
+        return store.read(columns=SALES_COLUMNS, start_date=TRAINING_START_DATE or None)
+    
+    # Sinon, données synthétiques pour l'exemple
     np.random.seed(42)
     
     dates = pd.date_range('2022-01-01', '2024-12-31', freq='W')
@@ -57,16 +68,14 @@ def train_model():
     
     print("Training model...")
     predictor = LuxuryDemandPredictor()
-    model = predictor.train(df, target='quantity')
+    model = predictor.train(df, target='quantity', feature_cache=FeatureMatrixCache())
     
     print("Model training completed!")
     print(f"Feature importance (top 10):")
     
     if hasattr(model, 'feature_importances_'):
-        feature_names = predictor.feature_engine.create_features(df).columns
-        exclude_cols = ['date', 'product_id', 'quantity', 'product_name', 'forecast_week']
-        feature_cols = [col for col in feature_names 
-                       if col not in exclude_cols and not col.startswith('Unnamed')]
+        # Colonnes retenues à l'entraînement (pas de second feature engineering)
+        feature_cols = predictor.feature_cols
         
         importances = model.feature_importances_
         top_indices = np.argsort(importances)[-10:][::-1]
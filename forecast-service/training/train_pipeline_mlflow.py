@@ -14,23 +14,60 @@ from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 from sklearn.model_selection import TimeSeriesSplit
 import xgboost as xgb
 
-# Ajouter le répertoire parent au path
+# Ajouter le répertoire parent au path (et app/ pour les imports internes du service)
 sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "app"))
 
-from app.models.xgboost_predictor import LuxuryDemandPredictor
+from app.models.xgboost_predictor import LuxuryDemandPredictor, SERIES_KEYS
+from app.models.horizon_models import (
+    HORIZON_BUCKETS, HORIZON_ARTIFACT_PATH, bucket_name,
+    DirectDesign, train_horizon_models, save_horizon_models
+)
+from app.models.segment_router import SEGMENT_ARTIFACT_PATH, segment_keys, train_segment_models
 from app.features.feature_engineering import LuxuryForecastFeatureEngine
+from app.features.feature_cache import FeatureMatrixCache
+from data.sales_store import SalesStore, SALES_COLUMNS
+from app.features.drift import DriftMonitor
+from app.utils.model_registry import (
+    HOLDOUT_ARTIFACT_PATH, HOLDOUT_FILE, DRIFT_ARTIFACT_PATH, DRIFT_REFERENCE_FILE
+)
+from mlflow_logging import AsyncRunLogger
 
 # Configuration MLflow
 MLFLOW_TRACKING_URI = os.getenv("MLFLOW_TRACKING_URI", "http://localhost:5000")
 EXPERIMENT_NAME = "luxury_demand_forecast"
+# Cœurs alloués à l'entraînement concurrent des modèles par horizon
+CPU_BUDGET = int(os.getenv("TRAINING_CPU_BUDGET", os.cpu_count() or 1))
+# Segmentation des modèles dédiés (family, collection, price_tier, iconic ; vide = désactivé)
+SEGMENT_BY = os.getenv("SEGMENT_BY", "")
+# Début de l'historique lu dans le store de ventes (vide = tout l'historique)
+TRAINING_START_DATE = os.getenv("TRAINING_START_DATE", "")
+
+# Hyperparamètres du modèle principal (repris par l'entraînement incrémental)
+PARAMS = {
+    'max_depth': 6,
+    'learning_rate': 0.05,
+    'n_estimators': 500,
+    'subsample': 0.8,
+    'colsample_bytree': 0.8,
+    'min_child_weight': 3,
+    'gamma': 0.1,
+    'reg_alpha': 0.1,
+    'reg_lambda': 1.0,
+    'objective': 'reg:squarederror'
+}
 
 mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
 mlflow.set_experiment(EXPERIMENT_NAME)
 
 def load_training_data(data_path: str = None) -> pd.DataFrame:
     """Charger les données d'entraînement"""
-    # Dans un vrai projet, ceci chargerait depuis une base de données
-    # Pour l'exemple, on génère des données synthétiques
+    # Historique réel depuis le store Parquet partitionné s'il a été alimenté
+    store = SalesStore()
+    if store.exists():
+        return store.read(columns=SALES_COLUMNS, start_date=TRAINING_START_DATE or None)
+    
+    # Sinon, données synthétiques pour l'exemple
     np.random.seed(42)
     
     dates = pd.date_range('2022-01-01', '2024-12-31', freq='W')
@@ -74,18 +111,19 @@ def train_and_register_model():
     df = load_training_data()
     print(f"   - {len(df)} échantillons chargés")
     
-    # Feature engineering
+    # Feature engineering (réutilisé depuis le cache si les données n'ont pas changé)
     print("🔧 Feature engineering...")
     feature_engine = LuxuryForecastFeatureEngine()
-    df_features = feature_engine.create_features(df)
+    features = FeatureMatrixCache().get_or_build(df, feature_engine, target='quantity')
+    df_features = features.to_frame()
     
     # Sélection des features
-    exclude_cols = ['date', 'product_id', 'quantity', 'product_name', 'forecast_week']
-    feature_cols = [col for col in df_features.columns 
-                   if col not in exclude_cols and not col.startswith('Unnamed')]
+    feature_cols = features.feature_cols
     
-    X = df_features[feature_cols].fillna(0)
-    y = df_features['quantity']
+    # Matrice float32 partagée par le modèle principal et les modèles multi-horizon
+    X_matrix = features.X
+    X = pd.DataFrame(X_matrix, columns=feature_cols)
+    y = pd.Series(features.y, name='quantity')
     
     # Split temporel
     print("✂️  Split temporel des données...")
@@ -102,28 +140,20 @@ def train_and_register_model():
     # Démarrage d'une "run" MLflow
     run_name = f"xgboost_training_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     
-    with mlflow.start_run(run_name=run_name):
+    # Envois MLflow en arrière-plan, attendus à la sortie du bloc (fin de run)
+    with mlflow.start_run(run_name=run_name) as run, AsyncRunLogger(run.info.run_id) as logger:
         
         # 1. LOG DES PARAMÈTRES
-        params = {
-            'max_depth': 6,
-            'learning_rate': 0.05,
-            'n_estimators': 500,
-            'subsample': 0.8,
-            'colsample_bytree': 0.8,
-            'min_child_weight': 3,
-            'gamma': 0.1,
-            'reg_alpha': 0.1,
-            'reg_lambda': 1.0,
-            'objective': 'reg:squarederror'
-        }
-        mlflow.log_params(params)
+        params = PARAMS
+        logger.log_params(params)
         
         # Log des infos dataset
-        mlflow.log_param("train_samples", len(X_train))
-        mlflow.log_param("test_samples", len(X_test))
-        mlflow.log_param("features_count", len(feature_cols))
-        mlflow.log_param("experiment_name", EXPERIMENT_NAME)
+        logger.log_param("train_samples", len(X_train))
+        logger.log_param("test_samples", len(X_test))
+        logger.log_param("features_count", len(feature_cols))
+        logger.log_param("experiment_name", EXPERIMENT_NAME)
+        # Dernière semaine vue à l'entraînement : point de départ d'un entraînement incrémental
+        logger.log_param("train_end_date", str(df_features['date'].iloc[train_idx].max().date()))
         
         # 2. ENTRAÎNEMENT
         print("🎯 Entraînement du modèle...")
@@ -135,6 +165,48 @@ def train_and_register_model():
             verbose=False
         )
         
+        # 2b. MODÈLES DIRECTS MULTI-HORIZON (un booster par tranche, en parallèle)
+        print(f"🧭 Entraînement de {len(HORIZON_BUCKETS)} modèles par horizon ({CPU_BUDGET} cœurs)...")
+        # Une ligne par (origine, horizon) : calendrier de la semaine cible + colonne horizon
+        design = DirectDesign(X_matrix, df_features, 'quantity', SERIES_KEYS, feature_cols, feature_engine)
+        # Pas de fuite : seules les cibles antérieures à la première semaine de test sont apprises
+        test_start = df_features['date'].iloc[test_idx].min()
+        booster_params = {k: v for k, v in params.items() if k != 'n_estimators'}
+        horizon_models = train_horizon_models(
+            design, {**booster_params, 'seed': 42}, num_boost_round=params['n_estimators'],
+            rows=train_idx, target_end=test_start, cpu_budget=CPU_BUDGET
+        )
+        logger.log_param("horizon_buckets", [bucket_name(b) for b in HORIZON_BUCKETS])
+        
+        for bucket, booster in horizon_models.items():
+            # Évaluation sur les semaines cibles du test uniquement (origines éventuellement en train)
+            X_bucket, y_bucket = design.matrix(range(bucket[0], bucket[1] + 1), target_start=test_start)
+            if len(y_bucket):
+                # Référence : le modèle principal sur les mêmes lignes servies (sans la colonne horizon)
+                logger.log_metrics({
+                    f"mae_{bucket_name(bucket)}": mean_absolute_error(y_bucket, booster.inplace_predict(X_bucket)),
+                    f"mae_single_{bucket_name(bucket)}": mean_absolute_error(y_bucket, model.predict(X_bucket[:, :-1])),
+                })
+        
+        horizon_dir = logger.local_path(HORIZON_ARTIFACT_PATH)
+        save_horizon_models(horizon_models, str(horizon_dir))
+        logger.log_artifacts(str(horizon_dir), artifact_path=HORIZON_ARTIFACT_PATH)
+        
+        # 2c. MODÈLES PAR SEGMENT (optionnels, servis à la demande avec un LRU)
+        if SEGMENT_BY:
+            # Un booster direct par (segment, tranche), mêmes lignes et même coupure que les tranches globales
+            print(f"🧩 Entraînement des modèles par segment ({SEGMENT_BY}) et par tranche d'horizon...")
+            segment_dir = logger.local_path(SEGMENT_ARTIFACT_PATH)
+            segments = train_segment_models(
+                design, segment_keys(df_features, SEGMENT_BY),
+                {**booster_params, 'seed': 42}, num_boost_round=params['n_estimators'],
+                directory=str(segment_dir), segment_by=SEGMENT_BY,
+                rows=train_idx, target_end=test_start, cpu_budget=CPU_BUDGET
+            )
+            logger.log_artifacts(str(segment_dir), artifact_path=SEGMENT_ARTIFACT_PATH)
+            logger.log_param("segment_by", SEGMENT_BY)
+            logger.log_param("segment_models", len(segments))
+        
         # 3. ÉVALUATION ET LOG DES MÉTRIQUES
         print("📈 Évaluation du modèle...")
         y_pred = model.predict(X_test)
@@ -147,7 +219,7 @@ def train_and_register_model():
         mask = y_test != 0
         mape = (np.abs((y_test[mask] - y_pred[mask]) / y_test[mask])).mean() * 100 if mask.any() else 0
         
-        mlflow.log_metrics({
+        logger.log_metrics({
             'mae': mae,
             'rmse': rmse,
             'r2_score': r2,
@@ -160,6 +232,18 @@ def train_and_register_model():
         print(f"   - R²: {r2:.3f}")
         print(f"   - MAPE: {mape:.1f}%")
         
+        # Jeu de test rejoué par scripts/promote_model.py avant toute promotion : lignes servies
+        # (origine + forecast_week) dont la semaine cible est dans le test, horizons 1 à 52
+        holdout_path = logger.local_path(HOLDOUT_ARTIFACT_PATH) / HOLDOUT_FILE
+        design.evaluation_frame(range(1, HORIZON_BUCKETS[-1][1] + 1), target_start=test_start).to_parquet(
+            holdout_path, index=False
+        )
+        logger.log_artifact(str(holdout_path), artifact_path=HOLDOUT_ARTIFACT_PATH)
+        
+        # Sketches de référence pour la détection de drift en production
+        drift_reference = DriftMonitor.from_reference(df_features.iloc[train_idx], feature_cols)
+        logger.log_text(drift_reference.to_json(), f"{DRIFT_ARTIFACT_PATH}/{DRIFT_REFERENCE_FILE}")
+        
         # 4. LOG DES ARTIFACTS (feature importance)
         try:
             import matplotlib
@@ -175,9 +259,11 @@ def train_and_register_model():
             feature_importance.head(15).plot(x='feature', y='importance', kind='barh', ax=ax)
             plt.title('Top 15 Feature Importance')
             plt.tight_layout()
-            plt.savefig('/tmp/feature_importance.png', dpi=100, bbox_inches='tight')
+            # Fichiers dans le répertoire de la run : pas de collision entre runs concurrentes
+            plots_dir = logger.local_path("plots")
+            plt.savefig(plots_dir / 'feature_importance.png', dpi=100, bbox_inches='tight')
             plt.close()
-            mlflow.log_artifact('/tmp/feature_importance.png', artifact_path="plots")
+            logger.log_artifact(str(plots_dir / 'feature_importance.png'), artifact_path="plots")
             
             # Prédictions vs réalité
             fig, ax = plt.subplots(figsize=(10, 6))
@@ -186,33 +272,36 @@ def train_and_register_model():
             plt.xlabel('Actual')
             plt.ylabel('Predicted')
             plt.title('Predictions vs Actual')
-            plt.savefig('/tmp/predictions_scatter.png', dpi=100, bbox_inches='tight')
+            plt.savefig(plots_dir / 'predictions_scatter.png', dpi=100, bbox_inches='tight')
             plt.close()
-            mlflow.log_artifact('/tmp/predictions_scatter.png', artifact_path="plots")
+            logger.log_artifact(str(plots_dir / 'predictions_scatter.png'), artifact_path="plots")
         except ImportError:
             print("⚠️  matplotlib non disponible, saut des plots")
         
         # 5. LOG DU MODÈLE
         print("💾 Enregistrement du modèle dans MLflow...")
-        mlflow.xgboost.log_model(
+        logger.log_model(
+            mlflow.xgboost,
             model,
             artifact_path="model",
-            registered_model_name="luxury_demand_forecast"
+            registered_model_name="luxury_demand_forecast",
+            model_format="json"  # Conserve les noms de features (format .xgb : perdus)
         )
         
-        print("✅ Modèle enregistré dans MLflow Registry")
-        
         # 6. TAGGING pour filtrer les modèles
-        mlflow.set_tag("model_type", "xgboost")
-        mlflow.set_tag("dataset", "sales_synthetic")
-        mlflow.set_tag("environment", "development")
-        mlflow.set_tag("training_date", datetime.now().strftime('%Y-%m-%d'))
+        logger.set_tag("model_type", "xgboost")
+        logger.set_tag("training_mode", "full")
+        logger.set_tag("dataset", "sales_store" if SalesStore().exists() else "sales_synthetic")
+        logger.set_tag("environment", "development")
+        logger.set_tag("training_date", datetime.now().strftime('%Y-%m-%d'))
         
-        run_id = mlflow.active_run().info.run_id
-        print(f"🎯 Run ID: {run_id}")
-        print(f"📊 Voir résultats: {MLFLOW_TRACKING_URI}/#/experiments")
-        
-        return run_id
+        run_id = run.info.run_id
+    
+    print("✅ Modèle enregistré dans MLflow Registry")
+    print(f"🎯 Run ID: {run_id}")
+    print(f"📊 Voir résultats: {MLFLOW_TRACKING_URI}/#/experiments")
+    
+    return run_id
 
 if __name__ == "__main__":
     try: